@@ -1,53 +1,196 @@
 """Alberga el punto de entrada al paquete Crotalpath"""
+import signal
+import sys
+import time
+from collections import deque
+from itertools import chain
+from concurrent.futures import Future, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 
 import cv2
+import numpy as np
 
+from crotalpath_core.tagrecognition.folder_watch import FolderWatcher, ProcessedFilesLog
+from crotalpath_core.tagrecognition.pipeline import RecognitionPipeline
+from crotalpath_core.tagrecognition.profiling import summarize_timings
+from crotalpath_core.tagrecognition.result_store import TagResultStore
 from crotalpath_core.tagrecognition.tag import Tag, NotAFileError
-from crotalpath_core.tagrecognition.tag_recognition import CowTagRecognizer
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
+from crotalpath_core.tagrecognition.tag_recognition import CowTagRecognizer, CowTagDigitClassifierRecognizer
+from crotalpath_core.tagrecognition.tiff_loader import read_image
+from crotalpath_core.tagrecognition.video_stream import FrameDeduplicator, TagTrackVoter, VideoFrameReader
 
-RECOGNIZER_TYPES = {1: {'recognizer': CowTagRecognizer, 'description': 'Cow recognizer'}}
+RECOGNIZER_TYPES = {1: {'recognizer': CowTagRecognizer, 'description': 'Cow recognizer'},
+                    2: {'recognizer': CowTagDigitClassifierRecognizer,
+                        'description': 'Cow recognizer with a per-digit classifier instead of Tesseract'}}
+
+_worker_batch_recognizer = None
+
+
+def _init_worker(batch_recognizer_options: dict) -> None:
+    """
+    Crea, una única vez por proceso, el reconocedor usado por los procesos del modo paralelo
+
+    :param batch_recognizer_options: argumentos con los que crear el reconocedor de conjuntos de crotales
+    """
+    global _worker_batch_recognizer
+    _worker_batch_recognizer = TagBatchRecognizer(**batch_recognizer_options)
+
+
+def _init_watch_worker(batch_recognizer_options: dict) -> None:
+    """
+    Crea el reconocedor de los procesos del modo de vigilancia, que ignoran la interrupción del usuario para que sea el
+    proceso principal quien termine la vigilancia
+
+    :param batch_recognizer_options: argumentos con los que crear el reconocedor de conjuntos de crotales
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(batch_recognizer_options)
+
+
+def _recognize_in_worker(images_path: List[Path]) -> List[Tag]:
+    """
+    Reconoce un grupo de imágenes con el reconocedor del proceso actual
+
+    :param images_path: lista con las rutas de las imágenes a reconocer
+    :returns: lista de objetos Tag con el resultado de cada reconocimiento
+    """
+    return _worker_batch_recognizer.recognize_image_batch(images_path)
+
+
+def _recognize_frames_in_worker(frames: List[np.array]) -> List[Tag]:
+    """
+    Reconoce un grupo de fotogramas con el reconocedor del proceso actual
+
+    :param frames: lista de fotogramas en escala de grises o en color
+    :returns: lista de objetos Tag, sin imágenes, con el resultado de cada reconocimiento
+    """
+    return _worker_batch_recognizer.recognize_frames(frames)
 
 
 class TagBatchRecognizer:
     """Reconocedor de crotales destinado a procesar conjuntos de estos"""
 
-    def __init__(self, recognizer_type: int, display_result: bool = False):
+    def __init__(self, recognizer_type: int, display_result: bool = False, workers: int = 1,
+                 cache: TagResultCache = None, profile: bool = False, ocr_batch_size: int = 1,
+                 roi_scale: float = None, retry_threshold: float = None, retry_budget_seconds: float = 0.5,
+                 pipeline_workers: tuple = None, pipeline_queue_size: int = 8, ocr_confidence: bool = False):
         """
         Crea una instancia del reconocedor de conjuntos de crotales que utilizara un reconocedor concreto
 
         :param recognizer_type: identificador del tipo de reconocedor de crotales a usar
-        :param display_result: indicador que determina si mostrar o no el resultado del reconocimiento
+        :param display_result: indicador que determina si mostrar o no el resultado del reconocimiento, solo en este
+        caso las imágenes se decodifican en color, en otro caso se decodifican directamente en escala de grises
+        :param workers: número de procesos entre los que repartir las imágenes, con 1 se procesan en este proceso
+        :param cache: caché donde buscar y almacenar los resultados de cada imagen, con los procesos del modo paralelo
+        solo se comparte su nivel en disco
+        :param profile: indicador que determina si medir o no el tiempo de cada etapa del reconocimiento
+        :param ocr_batch_size: número de imágenes cuyo texto se reconoce de forma conjunta, con 1 cada imagen se
+        reconoce por separado
+        :param roi_scale: escala, entre 0 y 1, de la imagen reducida donde localizar la región del texto antes de
+        procesarla a resolución completa, si no se indica se procesa la imagen completa
+        :param retry_threshold: confianza, entre 0 y 1, por debajo de la cual se reintenta el reconocimiento de un
+        crotal con parámetros alternativos, si no se indica no se reintenta
+        :param retry_budget_seconds: tiempo en segundos tras el cual no se prueban más hipótesis en los reintentos de
+        cada crotal
+        :param pipeline_workers: tupla con el número de hilos de decodificación, de procesos de localización del texto
+        y de hilos de OCR. Si se indica, las listas de imágenes se reconocen en esas tres etapas solapadas en lugar de
+        en grupos, ver RecognitionPipeline
+        :param pipeline_queue_size: número máximo de imágenes en cada cola entre dos etapas
+        :param ocr_confidence: indicador que determina si la confianza de cada crotal incluye la del OCR, como al
+        votar las lecturas de un vídeo. Con los reintentos activados se incluye siempre
+        :raises ValueError: si el tipo de reconocedor no existe, el número de procesos o de imágenes por grupo es
+        menor que 1, la escala o la confianza no están entre 0 y 1, el tiempo de los reintentos no es positivo o
+        alguna etapa no tiene al menos un hilo o proceso
         """
         if recognizer_type not in RECOGNIZER_TYPES:
             recognizer_types = [
                 '{} - {}'.format(recognizer_type_key, RECOGNIZER_TYPES[recognizer_type_key]['description']) for
                 recognizer_type_key in RECOGNIZER_TYPES.keys()]
             raise ValueError('Recognizer type not available, try one of: {}'.format(recognizer_types))
+        if workers < 1:
+            raise ValueError('Number of workers must be at least 1')
+        if ocr_batch_size < 1:
+            raise ValueError('OCR batch size must be at least 1')
+        if pipeline_workers is not None and (len(pipeline_workers) != 3 or min(pipeline_workers) < 1):
+            raise ValueError('Pipeline needs at least one worker in each of its three stages')
 
+        self.recognizer_type = recognizer_type
         self.display_result = display_result
-        self.recognizer = RECOGNIZER_TYPES[recognizer_type]['recognizer']()
+        self.workers = workers
+        self.cache = cache
+        self.cache_statistics = {'hits': 0, 'misses': 0}
+        self.video_statistics = {'frames': 0, 'duplicate_frames': 0, 'tracks': 0}
+        self.profile = profile
+        self.stage_timings = []
+        self.ocr_batch_size = ocr_batch_size
+        self.roi_scale = roi_scale
+        self.retry_threshold = retry_threshold
+        self.retry_budget_seconds = retry_budget_seconds
+        self.ocr_confidence = ocr_confidence
+        self.pipeline_workers = pipeline_workers
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline = None
+        self.recognizer = RECOGNIZER_TYPES[recognizer_type]['recognizer'](
+            profile=profile, roi_scale=roi_scale, retry_threshold=retry_threshold,
+            retry_budget_seconds=retry_budget_seconds, ocr_confidence=ocr_confidence)
 
-    def process_path(self, folder_path: str = None, images_path: List[str] = None) -> str:
+    def process_path(self, folder_path: str = None, images_path: List[str] = None,
+                     result_store: TagResultStore = None) -> str:
         """
         Realiza el reconocimiento de todas las imágenes presentes en una carpeta o de todas las rutas a imágenes
         recibida
 
         :param folder_path: ruta relativa de la carpeta con imágenes a reconocer
         :param images_path: ruta relativa a cada imagen a reconocer
+        :param result_store: almacén donde añadir, además, el resultado de cada reconocimiento
         :returns: cadena de caracteres en formado JSON con el resultado del reconocimiento
         :raises TypeError: si la ruta indicada no existe
         """
+        result_json = list(self.stream_path(folder_path, images_path, result_store))
+        return '[' + ','.join(result_json) + ']'
+
+    def stream_path(self, folder_path: str = None, images_path: List[str] = None,
+                    result_store: TagResultStore = None) -> Iterator[str]:
+        """
+        Realiza el reconocimiento de todas las imágenes presentes en una carpeta o de todas las rutas a imágenes
+        recibida, devolviendo cada resultado en cuanto está disponible. Las imágenes de cada crotal se liberan una vez
+        exportado su resultado
+
+        :param folder_path: ruta relativa de la carpeta con imágenes a reconocer
+        :param images_path: ruta relativa a cada imagen a reconocer
+        :param result_store: almacén donde añadir, además, el resultado de cada reconocimiento, los últimos
+        resultados se escriben al terminar el reconocimiento
+        :returns: iterador de cadenas de caracteres en formato JSON con el resultado de cada reconocimiento
+        :raises TypeError: si la ruta indicada no existe
+        """
+        for recognized_tag in self.iterate_path(folder_path, images_path):
+            tag_json = recognized_tag.export_json()
+            if result_store is not None:
+                result_store.add_tag(recognized_tag)
+            recognized_tag.release_images()
+            yield tag_json
+
+        if result_store is not None:
+            result_store.commit()
+
+    def iterate_path(self, folder_path: str = None, images_path: List[str] = None) -> Iterator[Tag]:
+        """
+        Realiza el reconocimiento de todas las imágenes presentes en una carpeta o de todas las rutas a imágenes
+        recibida, devolviendo cada crotal en cuanto está reconocido
+
+        :param folder_path: ruta relativa de la carpeta con imágenes a reconocer
+        :param images_path: ruta relativa a cada imagen a reconocer
+        :returns: iterador de objetos Tag con el resultado de cada reconocimiento
+        :raises TypeError: si la ruta indicada no existe
+        """
         if folder_path is not None:
-            recognized_tags = self.recognize_folder(folder_path)
-        elif images_path is not None:
-            recognized_tags = self.recognize_images(images_path)
-        else:
+            images_path = self.__list_folder(folder_path)
+        elif images_path is None:
             raise TypeError('No args have been passed')
 
-        result_json = [tag.export_json() for tag in recognized_tags]
-        return '[' + ','.join(result_json) + ']'
+        return self.iterate_images(images_path)
 
     def recognize_folder(self, folder_path: str) -> List[Tag]:
         """
@@ -58,16 +201,7 @@ class TagBatchRecognizer:
         :raises NotADirectoryError: si la ruta indicada no es un directorio
         :raises FileNotFoundError: si la ruta indicada no existe
         """
-        input_dataset_path = Path(folder_path)
-
-        if input_dataset_path.exists() and input_dataset_path.is_dir():
-            dataset_images_path = [str(img_path) for img_path in input_dataset_path.glob('*.*')]
-        elif not input_dataset_path.exists():
-            raise FileNotFoundError('Specified data path does not exist: ' + str(input_dataset_path))
-        else:
-            raise NotADirectoryError('Specified data path is not a directory:  ' + str(input_dataset_path))
-
-        return self.recognize_images(dataset_images_path)
+        return self.recognize_images(self.__list_folder(folder_path))
 
     def recognize_images(self, images_path: List[str]) -> List[Tag]:
         """
@@ -79,20 +213,368 @@ class TagBatchRecognizer:
         :raises FileNotFoundError: si alguna de las rutas indicadas no existe
         :raise TypeError: si el argumento recibido no es una lista
         """
+        return list(self.iterate_images(images_path))
+
+    def iterate_images(self, images_path: List[str]) -> Iterator[Tag]:
+        """
+        Realiza el reconocimiento de todas las rutas de las imágenes recibidas, devolviendo cada crotal, en el orden de
+        entrada, en cuanto está reconocido
+
+        :param images_path: lista con las rutas de las imágenes a reconocer
+        :returns: iterador de objetos Tag con el resultado de cada reconocimiento
+        :raises NotAFileError: si alguna de las rutas indicadas no es un fichero
+        :raises FileNotFoundError: si alguna de las rutas indicadas no existe
+        :raise TypeError: si el argumento recibido no es una lista
+        """
         if isinstance(images_path, list):
             input_paths = [Path(path) for path in images_path]
         else:
             raise TypeError('Image(s) path must be a list.')
 
-        tags = []
+        return self.__iterate_tags(input_paths)
+
+    def __iterate_tags(self, input_paths: List[Path]) -> Iterator[Tag]:
+        """
+        Reconoce las imágenes recibidas en este proceso o en el conjunto de procesos, según la configuración
+
+        :param input_paths: lista con las rutas de las imágenes a reconocer
+        :returns: iterador de objetos Tag con el resultado de cada reconocimiento
+        """
+        if self.pipeline_workers is not None:
+            yield from self.__iterate_pipeline(input_paths)
+            return
+
+        path_batches = [input_paths[start:start + self.ocr_batch_size]
+                        for start in range(0, len(input_paths), self.ocr_batch_size)]
+
+        if self.workers > 1 and len(path_batches) > 1:
+            for path in input_paths:
+                self.__check_image_path(path)
+            recognized_batches = self.__recognize_in_pool(path_batches)
+        else:
+            recognized_batches = map(self.recognize_image_batch, path_batches)
+        recognized_tags = chain.from_iterable(recognized_batches)
+
+        for path, recognized_tag in zip(input_paths, recognized_tags):
+            yield self.__finish_tag(path, recognized_tag)
+
+    def __iterate_pipeline(self, input_paths: List[Path]) -> Iterator[Tag]:
+        """
+        Reconoce las imágenes recibidas en las etapas solapadas de decodificación, localización del texto y OCR. Las
+        estadísticas de las etapas y colas se obtienen después con get_pipeline_statistics
+
+        :param input_paths: lista con las rutas de las imágenes a reconocer
+        :returns: iterador de objetos Tag con el resultado de cada reconocimiento
+        """
         for path in input_paths:
-            recognized_tag = self.recognize_image(path)
-            recognized_tag.identifier = path
-            if self.display_result:
-                recognized_tag.show_result_window()
-            tags.append(recognized_tag)
+            self.__check_image_path(path)
+
+        flags = cv2.IMREAD_COLOR if self.display_result else cv2.IMREAD_GRAYSCALE
+        self.pipeline = RecognitionPipeline(self.recognizer, lambda path: read_image(str(path), flags),
+                                            *self.pipeline_workers, queue_size=self.pipeline_queue_size,
+                                            cache=self.cache, profile=self.profile)
+        for path, recognized_tag in zip(input_paths, self.pipeline.iterate(input_paths)):
+            yield self.__finish_tag(path, recognized_tag)
+
+    def get_pipeline_statistics(self) -> dict:
+        """
+        Devuelve el uso de cada etapa y la ocupación de cada cola del último reconocimiento en etapas
+
+        :returns: diccionario con las estadísticas, ver RecognitionPipeline.get_statistics, o None si no se ha
+        reconocido ninguna imagen en etapas
+        """
+        return None if self.pipeline is None else self.pipeline.get_statistics()
+
+    def __finish_tag(self, path: Path, recognized_tag: Tag) -> Tag:
+        """
+        Asigna la ruta de la imagen a un crotal reconocido, acumula sus estadísticas y, si se ha configurado, lo muestra
+
+        :param path: ruta de la imagen del crotal
+        :param recognized_tag: objeto Tag con el resultado del reconocimiento
+        :returns: el mismo objeto Tag
+        """
+        recognized_tag.identifier = path
+        if self.cache is not None:
+            self.cache_statistics['hits' if recognized_tag.cache_hit else 'misses'] += 1
+        if recognized_tag.timings is not None:
+            self.stage_timings.append(recognized_tag.timings)
+        if self.display_result:
+            recognized_tag.show_result_window()
+        return recognized_tag
+
+    def watch_folder(self, folder_path: str, processed_files: ProcessedFilesLog = None, poll_interval: float = 0.5,
+                     use_inotify: bool = True) -> Iterator[Tag]:
+        """
+        Vigila una carpeta y reconoce cada imagen nueva en cuanto termina de escribirse, incluidas las que ya estaban en
+        la carpeta, sin terminar nunca. El reconocedor, o el conjunto de procesos, se crea una única vez y las imágenes
+        que llegan a la vez se reparten en grupos del tamaño configurado. Los crotales se devuelven en el orden de
+        llegada y cada imagen se anota en el registro de procesadas después de que se haya consumido su crotal, por lo
+        que al reanudar no se pierde ningún resultado. Las imágenes que no se pueden reconocer se notifican por la
+        salida de errores y también se anotan, para no reintentarlas indefinidamente
+
+        :param folder_path: ruta relativa de la carpeta a vigilar
+        :param processed_files: registro de las imágenes ya procesadas, que no se vuelven a reconocer
+        :param poll_interval: segundos entre dos recorridos de la carpeta cuando no se usa inotify
+        :param use_inotify: indicador que determina si usar inotify, cuando está disponible, en lugar de recorrer la
+        carpeta periódicamente
+        :returns: iterador infinito de objetos Tag con el resultado de cada reconocimiento
+        :raises NotADirectoryError: si la ruta indicada no es un directorio
+        :raises FileNotFoundError: si la ruta indicada no existe
+        """
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_watch_worker,
+                                           initargs=(self.__get_worker_options(),))
+        max_pending_batches = self.workers * 2
+        waiting_paths = deque()
+        pending_batches = deque()
+
+        with FolderWatcher(folder_path, poll_interval, use_inotify) as watcher:
+            try:
+                while True:
+                    if pending_batches:
+                        wait([pending_batches[0][1]], timeout=poll_interval)
+                        timeout = 0
+                    else:
+                        timeout = 0 if waiting_paths else poll_interval
+                    waiting_paths.extend(path for path in watcher.get_new_files(timeout)
+                                         if processed_files is None or path.name not in processed_files)
+
+                    while waiting_paths and len(pending_batches) < max_pending_batches:
+                        path_batch = [waiting_paths.popleft()
+                                      for _ in range(min(self.ocr_batch_size, len(waiting_paths)))]
+                        pending_batches.append((path_batch, self.__submit_batch(executor, path_batch)))
+
+                    while pending_batches and pending_batches[0][1].done():
+                        path_batch, recognized_batch = pending_batches.popleft()
+                        for path, recognized_tag in self.__get_batch_result(path_batch, recognized_batch):
+                            if recognized_tag is not None:
+                                yield self.__finish_tag(path, recognized_tag)
+                            if processed_files is not None:
+                                processed_files.add(path.name)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+    def recognize_video(self, source: str, frame_step: int = 1, duplicate_threshold: float = 2.0,
+                        max_gap_frames: int = 10, min_readings: int = 2,
+                        split_confidence: float = 0.8) -> Iterator[dict]:
+        """
+        Reconoce los crotales de un vídeo, una secuencia de imágenes o un flujo de cámara y devuelve un resultado por
+        cada paso de un animal, votado entre las lecturas de sus fotogramas. Los fotogramas se leen en este proceso y
+        los casi iguales al anterior no se reconocen, repiten la última lectura. El resto se reconoce en grupos del
+        tamaño configurado, en el conjunto de procesos si hay más de uno, con como mucho dos grupos pendientes por
+        proceso, de forma que la lectura de la fuente se detiene mientras el reconocimiento no avanza. Los grupos que
+        no se pueden reconocer se notifican por la salida de errores y cuentan como fotogramas sin lectura. Los
+        contadores de fotogramas leídos, repetidos y pasos devueltos se guardan en video_statistics
+
+        :param source: ruta de un vídeo, patrón de una secuencia de imágenes, URL de un flujo o número de una cámara
+        :param frame_step: se reconoce uno de cada frame_step fotogramas
+        :param duplicate_threshold: diferencia media máxima, en niveles de gris, entre las miniaturas de un fotograma
+        repetido y el último no repetido
+        :param max_gap_frames: número máximo de fotogramas sin lectura dentro del paso de un mismo animal
+        :param min_readings: número mínimo de fotogramas leídos para devolver el paso de un animal
+        :param split_confidence: confianza mínima de una lectura que difiere del número votado para comenzar el paso de
+        otro animal, aunque no haya fotogramas sin lectura entre ambos, o None para no separar así los pasos. La
+        confianza de cada lectura solo incluye la del OCR si el reconocedor se ha creado con ocr_confidence
+        :returns: iterador de diccionarios, con el formato de TagTrackVoter.finish_track, con el identificador
+        ('identifier') formado por la fuente y el primer fotograma con lectura
+        :raises OSError: si no se puede abrir la fuente de vídeo
+        """
+        deduplicator = FrameDeduplicator(duplicate_threshold)
+        voter = TagTrackVoter(max_gap_frames, min_readings, split_confidence)
+        self.video_statistics = {'frames': 0, 'duplicate_frames': 0, 'tracks': 0}
+        max_pending_batches = self.workers * 2
+        pending_batches = deque()
+        frame_batch = []
+        last_reading = (None, None)
+
+        with VideoFrameReader(source, frame_step, grayscale=not self.display_result) as video_frames:
+            executor = None
+            if self.workers > 1:
+                executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                               initargs=(self.__get_worker_options(),))
+            try:
+                for frame in chain(video_frames, [None]):
+                    if frame is not None:
+                        duplicate = deduplicator.is_duplicate(frame.image)
+                        self.video_statistics['frames'] += 1
+                        self.video_statistics['duplicate_frames'] += duplicate
+                        frame_batch.append((frame, duplicate))
+                        if len(frame_batch) < self.ocr_batch_size:
+                            continue
+
+                    if frame_batch:
+                        images = [video_frame.image for video_frame, duplicate in frame_batch if not duplicate]
+                        # Los fotogramas pendientes solo conservan su número e instante, la imagen ya se ha enviado
+                        pending_batches.append(([(video_frame._replace(image=None), duplicate)
+                                                 for video_frame, duplicate in frame_batch],
+                                                self.__submit_frames(executor, images)))
+                        frame_batch = []
+
+                    while pending_batches and (frame is None or len(pending_batches) >= max_pending_batches or
+                                               pending_batches[0][1].done()):
+                        batch_frames, recognized_batch = pending_batches.popleft()
+                        recognized_tags = iter(self.__get_frames_result(batch_frames, recognized_batch))
+                        for video_frame, duplicate in batch_frames:
+                            if not duplicate:
+                                recognized_tag = next(recognized_tags)
+                                last_reading = (None, None) if recognized_tag is None else \
+                                    (recognized_tag.digits, recognized_tag.confidence)
+                            track = voter.add_reading(video_frame, *last_reading, repeated=duplicate)
+                            if track is not None:
+                                yield self.__finish_track(source, track)
+
+                track = voter.finish_track()
+                if track is not None:
+                    yield self.__finish_track(source, track)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+    def recognize_frames(self, frames: List[np.array]) -> List[Tag]:
+        """
+        Realiza el reconocimiento conjunto de un grupo de fotogramas ya decodificados, usando la caché si está
+        configurada. Las imágenes de los crotales se liberan para no devolverlas entre procesos
+
+        :param frames: lista de fotogramas en escala de grises (1 canal) o en color (3 canales)
+        :returns: lista de objetos Tag con el resultado de cada reconocimiento
+        """
+        recognized_tags = self.__recognize_decoded_images(frames)
+        for recognized_tag in recognized_tags:
+            recognized_tag.release_images()
+        return recognized_tags
+
+    def __submit_frames(self, executor: ProcessPoolExecutor, frames: List[np.array]) -> Future:
+        """
+        Envía un grupo de fotogramas al conjunto de procesos o, si no existe, lo reconoce en este proceso
 
-        return tags
+        :param executor: conjunto de procesos o None para reconocer los fotogramas en este proceso
+        :param frames: lista de fotogramas del grupo, puede estar vacía
+        :returns: futuro con la lista de objetos Tag del grupo
+        """
+        if executor is not None and frames:
+            return executor.submit(_recognize_frames_in_worker, frames)
+
+        recognized_batch = Future()
+        try:
+            recognized_batch.set_result(self.recognize_frames(frames) if frames else [])
+        except Exception as error:
+            recognized_batch.set_exception(error)
+        return recognized_batch
+
+    def __get_frames_result(self, batch_frames: List[tuple], recognized_batch: Future) -> List[Tag]:
+        """
+        Obtiene el resultado de un grupo de fotogramas y acumula sus tiempos. Si el grupo ha fallado se notifica por la
+        salida de errores
+
+        :param batch_frames: lista de tuplas con cada VideoFrame del grupo y si es un repetido
+        :param recognized_batch: futuro con la lista de objetos Tag de los fotogramas no repetidos del grupo
+        :returns: lista de objetos Tag de los fotogramas no repetidos, con None en lugar de los que han fallado
+        """
+        try:
+            recognized_tags = recognized_batch.result()
+        except Exception as error:
+            print('Could not recognize frames {}-{}: {!r}'.format(batch_frames[0][0].index, batch_frames[-1][0].index,
+                                                                  error), file=sys.stderr)
+            return [None] * sum(not duplicate for _, duplicate in batch_frames)
+
+        for recognized_tag in recognized_tags:
+            if recognized_tag.timings is not None:
+                self.stage_timings.append(recognized_tag.timings)
+        return recognized_tags
+
+    def __finish_track(self, source: str, track: dict) -> dict:
+        """
+        Añade el identificador al paso de un animal y lo cuenta
+
+        :param source: fuente de vídeo
+        :param track: diccionario con el resultado del paso
+        :returns: el mismo diccionario con el identificador ('identifier')
+        """
+        self.video_statistics['tracks'] += 1
+        track['identifier'] = '{}#{}'.format(source, track['first_frame'])
+        return track
+
+    def __submit_batch(self, executor: ProcessPoolExecutor, path_batch: List[Path]) -> Future:
+        """
+        Envía un grupo de imágenes al conjunto de procesos o, si no existe, lo reconoce en este proceso
+
+        :param executor: conjunto de procesos o None para reconocer las imágenes en este proceso
+        :param path_batch: lista con las rutas de las imágenes del grupo
+        :returns: futuro con la lista de objetos Tag del grupo
+        """
+        if executor is not None:
+            return executor.submit(_recognize_in_worker, path_batch)
+
+        recognized_batch = Future()
+        try:
+            recognized_batch.set_result(self.recognize_image_batch(path_batch))
+        except Exception as error:
+            recognized_batch.set_exception(error)
+        return recognized_batch
+
+    def __get_batch_result(self, path_batch: List[Path], recognized_batch: Future) -> Iterator[tuple]:
+        """
+        Obtiene el resultado de un grupo de imágenes. Si el grupo ha fallado sus imágenes se reconocen de una en una en
+        este proceso, de forma que una imagen inválida no impide reconocer el resto
+
+        :param path_batch: lista con las rutas de las imágenes del grupo
+        :param recognized_batch: futuro con la lista de objetos Tag del grupo
+        :returns: iterador de tuplas con la ruta de cada imagen y su objeto Tag, o None si no se ha podido reconocer
+        """
+        try:
+            yield from zip(path_batch, recognized_batch.result())
+            return
+        except Exception:
+            pass
+
+        for path in path_batch:
+            try:
+                recognized_tag = self.recognize_image(path)
+            except Exception as error:
+                print('Could not recognize {}: {!r}'.format(path, error), file=sys.stderr)
+                recognized_tag = None
+            yield path, recognized_tag
+
+    def __recognize_in_pool(self, path_batches: List[List[Path]]) -> Iterator[List[Tag]]:
+        """
+        Reparte los grupos de imágenes entre un conjunto de procesos manteniendo como mucho dos grupos pendientes por
+        proceso, de forma que los resultados se devuelven en orden sin acumularse en memoria
+
+        :param path_batches: lista de grupos de rutas de las imágenes a reconocer
+        :returns: iterador de listas de objetos Tag con el resultado de cada grupo
+        """
+        workers = min(self.workers, len(path_batches))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.__get_worker_options(),)) as executor:
+            pending_batches = deque()
+            for path_batch in path_batches:
+                if len(pending_batches) >= workers * 2:
+                    yield pending_batches.popleft().result()
+                pending_batches.append(executor.submit(_recognize_in_worker, path_batch))
+
+            while pending_batches:
+                yield pending_batches.popleft().result()
+
+    def get_profile_summary(self) -> dict:
+        """
+        Resume los tiempos por etapa de todas las imágenes reconocidas con la medición de tiempos activada
+
+        :returns: diccionario con las estadísticas de cada etapa, ver summarize_timings
+        """
+        return summarize_timings(self.stage_timings)
+
+    def __get_worker_options(self) -> dict:
+        """
+        Obtiene los argumentos con los que crear el reconocedor de cada proceso del modo paralelo
+
+        :returns: diccionario con los argumentos del reconocedor de conjuntos de crotales
+        """
+        return {'recognizer_type': self.recognizer_type, 'cache': self.cache, 'profile': self.profile,
+                'ocr_batch_size': self.ocr_batch_size, 'roi_scale': self.roi_scale,
+                'retry_threshold': self.retry_threshold, 'retry_budget_seconds': self.retry_budget_seconds,
+                'ocr_confidence': self.ocr_confidence}
 
     def recognize_image(self, image_path: str) -> Tag:
         """
@@ -103,36 +585,268 @@ class TagBatchRecognizer:
         :raises NotAFileError: si la ruta indicada no es un fichero
         :raises FileNotFoundError: si la ruta indicada no existe
         """
-        image_path = Path(image_path)
-        recognized_tag = None
+        return self.recognize_image_batch([image_path])[0]
 
-        if image_path.is_file():
-            image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
-            recognized_tag = self.recognizer.recognize_image(image)
-        elif not image_path.exists():
+    def recognize_image_batch(self, images_path: List[str]) -> List[Tag]:
+        """
+        Realiza el reconocimiento conjunto de un grupo de imágenes, el texto de las imágenes que no estén en la
+        caché se reconoce de una sola vez. Las imágenes TIFF sin comprimir se proyectan en memoria en lugar de copiarse
+
+        :param images_path: lista con las rutas de las imágenes a reconocer
+        :returns: lista de objetos Tag con el resultado de cada reconocimiento
+        :raises NotAFileError: si alguna de las rutas indicadas no es un fichero
+        :raises FileNotFoundError: si alguna de las rutas indicadas no existe
+        """
+        start = time.perf_counter()
+        images = []
+        decode_times = []
+        for image_path in images_path:
+            image_path = Path(image_path)
+            self.__check_image_path(image_path)
+
+            decode_start = time.perf_counter()
+            images.append(read_image(str(image_path),
+                                     cv2.IMREAD_COLOR if self.display_result else cv2.IMREAD_GRAYSCALE))
+            decode_times.append(time.perf_counter() - decode_start)
+
+        recognized_tags = self.__recognize_decoded_images(images)
+
+        if self.profile:
+            total_time = (time.perf_counter() - start) / len(recognized_tags)
+            for recognized_tag, decode_time in zip(recognized_tags, decode_times):
+                recognized_tag.timings = dict(recognized_tag.timings or {})
+                recognized_tag.timings['decode'] = round(decode_time * 1000, 3)
+                recognized_tag.timings['total'] = round(total_time * 1000, 3)
+
+        return recognized_tags
+
+    def __recognize_decoded_images(self, images: List[np.array]) -> List[Tag]:
+        """
+        Reconoce un grupo de imágenes ya decodificadas, usando la caché si está configurada
+
+        :param images: lista de imágenes en color (3 canales) o en escala de grises (1 canal) de los crotales
+        :returns: lista de objetos Tag con el resultado de cada reconocimiento
+        """
+        recognized_tags = [None] * len(images)
+        cache_keys = [None] * len(images)
+        pending_indexes = []
+
+        for index, image in enumerate(images):
+            if self.cache is not None:
+                cache_keys[index] = self.cache.key(image, self.recognizer.get_configuration())
+                cached_detection = self.cache.get(cache_keys[index])
+                if cached_detection is not None:
+                    recognized_tags[index] = self.recognizer.create_tag(image)
+                    recognized_tags[index].set_detection(
+                        text=cached_detection['digits'],
+                        bounding_rectangles=np.array(cached_detection['bounding_rects'], np.int32).reshape(-1, 4),
+                        confidence=cached_detection.get('confidence'),
+                        rejection_reason=cached_detection.get('rejection_reason'))
+                    recognized_tags[index].cache_hit = True
+                    continue
+            pending_indexes.append(index)
+
+        if len(pending_indexes) == 1:
+            pending_tags = [self.recognizer.recognize_image(images[pending_indexes[0]])]
+        else:
+            pending_tags = self.recognizer.recognize_images([images[index] for index in pending_indexes])
+
+        for index, recognized_tag in zip(pending_indexes, pending_tags):
+            recognized_tags[index] = recognized_tag
+            # Un reintento interrumpido por el tiempo máximo depende de la carga de la máquina, no de la imagen
+            if self.cache is not None and not recognized_tag.retry_truncated:
+                self.cache.put(cache_keys[index], recognized_tag.get_detection())
+
+        return recognized_tags
+
+    @staticmethod
+    def __check_image_path(image_path: Path) -> None:
+        """
+        Comprueba que la ruta recibida sea un fichero existente
+
+        :param image_path: ruta de la imagen a comprobar
+        :raises NotAFileError: si la ruta indicada no es un fichero
+        :raises FileNotFoundError: si la ruta indicada no existe
+        """
+        if not image_path.exists():
             raise FileNotFoundError('Specified image path does not exist: ' + str(image_path))
         elif not image_path.is_file():
             raise NotAFileError('Specified image path is not a file: ' + str(image_path))
 
-        return recognized_tag
+    @staticmethod
+    def __list_folder(folder_path: str) -> List[str]:
+        """
+        Obtiene las rutas de todas las imágenes presentes en una carpeta
+
+        :param folder_path: ruta relativa de la carpeta con imágenes a reconocer
+        :returns: lista con las rutas de las imágenes de la carpeta
+        :raises NotADirectoryError: si la ruta indicada no es un directorio
+        :raises FileNotFoundError: si la ruta indicada no existe
+        """
+        input_dataset_path = Path(folder_path)
+
+        if input_dataset_path.exists() and input_dataset_path.is_dir():
+            return [str(img_path) for img_path in input_dataset_path.glob('*.*')]
+        elif not input_dataset_path.exists():
+            raise FileNotFoundError('Specified data path does not exist: ' + str(input_dataset_path))
+        else:
+            raise NotADirectoryError('Specified data path is not a directory:  ' + str(input_dataset_path))
 
 
 if __name__ == '__main__':
     import argparse
+    import json
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-o", "--output_path", type=str, help='Relative path to the output file.')
-    parser.add_argument("-t", "--type", type=int, required=True, help='Tag type. 1 - Cow')
+    parser.add_argument("-t", "--type", type=int, help='Tag type. 1 - Cow, 2 - Cow with a per-digit classifier')
     parser.add_argument("-d", "--display_result", dest='display_result', action='store_true',
                         help='If stated the result of each recognized tag will be shown.')
+    parser.add_argument("-s", "--stream", dest='stream', action='store_true',
+                        help='If stated each result is written to the output file as soon as it is recognized, one '
+                             'JSON object per line.')
+    parser.add_argument("-j", "--jobs", type=int, default=1, help='Number of processes used to recognize the images.')
+    parser.add_argument("-b", "--batch_size", type=int, default=1,
+                        help='Number of images whose text is recognized with a single Tesseract run. Images whose '
+                             'digit count does not match their located digits are recognized again one by one.')
+    parser.add_argument("-c", "--cache", dest='cache', action='store_true',
+                        help='If stated already recognized images are not recognized again.')
+    parser.add_argument("--cache_dir", type=str, help='Relative folder path where recognition results are cached.')
+    parser.add_argument("-p", "--profile", dest='profile', action='store_true',
+                        help='If stated the time of each recognition stage is added to each result and a summary of '
+                             'the batch is shown.')
+    parser.add_argument("-r", "--roi_scale", type=float,
+                        help='Scale, between 0 and 1, of the downscaled image where the text region is located before '
+                             'processing only that region at full resolution.')
+    parser.add_argument("--retry_threshold", type=float,
+                        help='Confidence, between 0 and 1, below which a tag is recognized again with alternative '
+                             'text location parameters, tried one after another.')
+    parser.add_argument("--retry_budget", type=float, default=0.5,
+                        help='Seconds after which no more alternatives are tried when retrying a low-confidence tag.')
+    parser.add_argument("--pipeline", type=int, nargs=3, metavar=('DECODE', 'LOCATE', 'OCR'),
+                        help='Recognize the images in three overlapping stages with the given number of decoding '
+                             'threads, text location processes and OCR threads, showing the use of each stage and '
+                             'queue at the end.')
+    parser.add_argument("--queue_size", type=int, default=8,
+                        help='Maximum number of images waiting between two pipeline stages.')
+    parser.add_argument("-w", "--watch", dest='watch', action='store_true',
+                        help='If stated the folder is watched and each new image is recognized as soon as it is '
+                             'written, appending one JSON object per line to the output file, until interrupted.')
+    parser.add_argument("--state_file", type=str,
+                        help='Relative path to the file listing the images already processed in watch mode, by '
+                             'default the output path followed by ".processed".')
+    parser.add_argument("--poll", dest='poll', action='store_true',
+                        help='If stated the watched folder is scanned periodically instead of using inotify, needed '
+                             'for network shares.')
+    parser.add_argument("--poll_interval", type=float, default=0.5,
+                        help='Seconds between two scans of the watched folder.')
+    parser.add_argument("--frame_step", type=int, default=1,
+                        help='With --video only one of every this many frames is recognized.')
+    parser.add_argument("--duplicate_threshold", type=float, default=2.0,
+                        help='With --video, mean grey level difference below which a frame is considered a repetition '
+                             'of the last recognized one and is not recognized again.')
+    parser.add_argument("--track_gap", type=int, default=10,
+                        help='With --video, number of frames without a reading that ends the pass of an animal.')
+    parser.add_argument("--split_confidence", type=float, default=0.8,
+                        help='With --video, minimum confidence of a reading that differs from the voted number in '
+                             'most digits to start the pass of another animal. Negative to disable.')
+    parser.add_argument("-e", "--export_db", type=str,
+                        help='Relative path to a SQLite database where the results are also added, indexed by digits.')
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-i", "--images", nargs='+', help='One or more images relative path to recognize.')
     group.add_argument("-f", "--folder", type=str, help='Relative folder path with images to recognize.')
+    group.add_argument("-v", "--video", type=str,
+                       help='Video file, image sequence pattern (e.g. frames/%%04d.png), stream URL or camera number '
+                            'to recognize, writing one JSON object per animal pass and line to the output file.')
+    group.add_argument("-q", "--query", type=str,
+                       help='Tag number to look up in the database given with -e instead of recognizing images, a '
+                            'trailing * matches every tag number starting with the given digits.')
     kwargs = parser.parse_args()
+    if kwargs.query is None and kwargs.type is None:
+        parser.error('the following arguments are required: -t/--type')
+    if kwargs.watch and (kwargs.folder is None or kwargs.output_path is None):
+        parser.error('--watch requires a folder (-f) and an output path (-o)')
+    if kwargs.video is not None and kwargs.output_path is None:
+        parser.error('--video requires an output path (-o)')
+    if kwargs.query is not None and kwargs.export_db is None:
+        parser.error('--query requires a database (-e)')
+
+    result_store = None
+    if kwargs.export_db is not None:
+        result_store = TagResultStore(kwargs.export_db)
+
+    if kwargs.query is not None:
+        with result_store:
+            for detection in result_store.find_by_digits(kwargs.query.rstrip('*'), prefix=kwargs.query.endswith('*')):
+                print(json.dumps(detection))
+        sys.exit(0)
+
+    result_cache = None
+    if kwargs.cache or kwargs.cache_dir is not None:
+        result_cache = TagResultCache(disk_path=kwargs.cache_dir)
+
+    tag_batch_recognizer = TagBatchRecognizer(recognizer_type=kwargs.type, display_result=kwargs.display_result,
+                                              workers=kwargs.jobs, cache=result_cache, profile=kwargs.profile,
+                                              ocr_batch_size=kwargs.batch_size, roi_scale=kwargs.roi_scale,
+                                              retry_threshold=kwargs.retry_threshold,
+                                              retry_budget_seconds=kwargs.retry_budget,
+                                              pipeline_workers=kwargs.pipeline, pipeline_queue_size=kwargs.queue_size,
+                                              ocr_confidence=kwargs.video is not None)
+
+    if kwargs.video is not None:
+        start = time.perf_counter()
+        with open(kwargs.output_path, "w") as output_file:
+            try:
+                for track in tag_batch_recognizer.recognize_video(kwargs.video, kwargs.frame_step,
+                                                                  kwargs.duplicate_threshold, kwargs.track_gap,
+                                                                  split_confidence=None if kwargs.split_confidence < 0
+                                                                  else kwargs.split_confidence):
+                    output_file.write(json.dumps(track) + '\n')
+                    output_file.flush()
+                    if result_store is not None:
+                        result_store.add_detection(track)
+            except KeyboardInterrupt:
+                pass
+        video_statistics = tag_batch_recognizer.video_statistics
+        print('Frames: {frames}, duplicates: {duplicate_frames}, animal passes: {tracks}, {fps:.1f} frames/s'.format(
+            fps=video_statistics['frames'] / (time.perf_counter() - start), **video_statistics), file=sys.stderr)
+    elif kwargs.watch:
+        state_file = kwargs.state_file or kwargs.output_path + '.processed'
+        with ProcessedFilesLog(state_file) as processed_images, open(kwargs.output_path, "a") as output_file:
+            try:
+                for recognized_tag in tag_batch_recognizer.watch_folder(kwargs.folder, processed_images,
+                                                                        kwargs.poll_interval, not kwargs.poll):
+                    output_file.write(recognized_tag.export_json() + '\n')
+                    output_file.flush()
+                    if result_store is not None:
+                        result_store.add_tag(recognized_tag)
+                        result_store.commit()
+                    recognized_tag.release_images()
+            except KeyboardInterrupt:
+                pass
+    elif kwargs.output_path is None and result_store is not None:
+        for _ in tag_batch_recognizer.stream_path(kwargs.folder, kwargs.images, result_store):
+            pass
+    elif kwargs.stream:
+        with open(kwargs.output_path, "w") as output_file:
+            for tag_result in tag_batch_recognizer.stream_path(kwargs.folder, kwargs.images, result_store):
+                output_file.write(tag_result + '\n')
+                output_file.flush()
+    else:
+        result = tag_batch_recognizer.process_path(kwargs.folder, kwargs.images, result_store)
+
+        output_file = open(kwargs.output_path, "w")
+        output_file.write(result)
+        output_file.close()
+
+    if result_store is not None:
+        result_store.close()
+
+    if result_cache is not None:
+        print('Cache hits: {hits}, misses: {misses}'.format(**tag_batch_recognizer.cache_statistics), file=sys.stderr)
 
-    tag_batch_recognizer = TagBatchRecognizer(recognizer_type=kwargs.type, display_result=kwargs.display_result)
-    result = tag_batch_recognizer.process_path(kwargs.folder, kwargs.images)
+    if kwargs.profile:
+        print(json.dumps(tag_batch_recognizer.get_profile_summary(), indent=2), file=sys.stderr)
 
-    output_file = open(kwargs.output_path, "w")
-    output_file.write(result)
-    output_file.close()
+    if tag_batch_recognizer.get_pipeline_statistics() is not None:
+        print(json.dumps(tag_batch_recognizer.get_pipeline_statistics(), indent=2), file=sys.stderr)
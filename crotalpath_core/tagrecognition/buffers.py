@@ -0,0 +1,36 @@
+"""Memoria de trabajo reutilizable entre las imágenes procesadas por una misma instancia"""
+import numpy as np
+
+
+class ScratchBuffers:
+    """
+    Conjunto de buffers con nombre que se reutilizan entre imágenes, cada uno solo se vuelve a reservar cuando se
+    necesita un tamaño mayor. Los arrays devueltos se sobrescriben en la siguiente petición del mismo buffer
+    """
+
+    def __init__(self):
+        """Crea el conjunto vacío, cada buffer se reserva con su primera petición"""
+
+        self.buffers = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8) -> np.array:
+        """
+        Obtiene un array contiguo, sin inicializar, con las dimensiones indicadas
+
+        :param name: nombre del buffer
+        :param shape: dimensiones del array
+        :param dtype: tipo de los elementos del array
+        :returns: un array que comparte memoria con el buffer
+        """
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(size, dtype)
+            self.buffers[name] = buffer
+
+        return buffer[:size].reshape(shape)
+
+    def __getstate__(self) -> dict:
+        """Excluye el contenido de los buffers al serializar, cada proceso reserva los suyos"""
+
+        return {'buffers': {}}
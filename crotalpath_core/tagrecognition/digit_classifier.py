@@ -0,0 +1,173 @@
+"""Clasificador k-NN de dígitos aislados a partir de sus descriptores HOG"""
+import hashlib
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+
+GLYPH_SIZE = 32
+GLYPH_MARGIN = 2
+DEFAULT_MODEL_PATH = Path(__file__).absolute().parent / 'models' / 'digit_knn.npz'
+
+_HOG = cv2.HOGDescriptor((GLYPH_SIZE, GLYPH_SIZE), (16, 16), (8, 8), (8, 8), 9)
+
+
+def extract_glyphs(image: np.array, enclosing_rectangles: np.array) -> np.array:
+    """
+    Recorta cada dígito de una imagen y lo normaliza a un cuadrado de GLYPH_SIZE píxeles, escalándolo sin deformarlo
+    hasta ocupar el alto del cuadrado salvo un margen y centrándolo. Los dígitos se ordenan de izquierda a derecha
+
+    :param image: imagen en blanco y negro (1 canal) con los dígitos de color negro y el fondo blanco
+    :param enclosing_rectangles: array numpy Nx4 con los rectángulos (x, y, ancho, alto) que delimitan cada dígito
+    :returns: array numpy Nx(GLYPH_SIZE)x(GLYPH_SIZE) con los dígitos en blanco sobre fondo negro
+    """
+    enclosing_rectangles = np.asarray(enclosing_rectangles).reshape(-1, 4)
+    glyphs = np.zeros((len(enclosing_rectangles), GLYPH_SIZE, GLYPH_SIZE), np.uint8)
+    box_size = GLYPH_SIZE - GLYPH_MARGIN * 2
+
+    for glyph, (x_pos, y_pos, width, height) in zip(glyphs, enclosing_rectangles[np.argsort(
+            enclosing_rectangles[:, 0], kind='stable')]):
+        if width < 1 or height < 1:
+            continue
+        scale = box_size / max(width, height)
+        glyph_width, glyph_height = max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)
+        digit = cv2.resize(image[y_pos:y_pos + height, x_pos:x_pos + width], (glyph_width, glyph_height),
+                           interpolation=cv2.INTER_AREA)
+        left, top = (GLYPH_SIZE - glyph_width) // 2, (GLYPH_SIZE - glyph_height) // 2
+        cv2.bitwise_not(digit, dst=glyph[top:top + glyph_height, left:left + glyph_width])
+
+    return glyphs
+
+
+def compute_features(glyphs: np.array) -> np.array:
+    """
+    Calcula el descriptor HOG de un conjunto de dígitos normalizados con una sola llamada, colocando los dígitos uno
+    junto a otro y desplazando la ventana del descriptor de dígito en dígito
+
+    :param glyphs: array numpy Nx(GLYPH_SIZE)x(GLYPH_SIZE) con los dígitos normalizados
+    :returns: array numpy de float32 con un descriptor por fila
+    """
+    if len(glyphs) == 0:
+        return np.empty((0, _HOG.getDescriptorSize()), np.float32)
+
+    # El margen negro de cada dígito hace que el gradiente en los bordes de la ventana no dependa del dígito vecino,
+    # por lo que el descriptor es el mismo que calculando cada dígito por separado
+    mosaic = np.ascontiguousarray(glyphs.transpose(1, 0, 2).reshape(GLYPH_SIZE, -1))
+    features = _HOG.compute(mosaic, winStride=(GLYPH_SIZE, GLYPH_SIZE))
+    return features.reshape(len(glyphs), -1)
+
+
+class KNearestDigitClassifier:
+    """Clasificador por votación de los k descriptores de entrenamiento más cercanos, en distancia euclídea"""
+
+    def __init__(self, features: np.array, labels: np.array, k: int = 3):
+        """
+        Crea un clasificador a partir de los descriptores de entrenamiento
+
+        :param features: array numpy con un descriptor de entrenamiento por fila
+        :param labels: array numpy con el dígito (0 a 9) de cada descriptor
+        :param k: número de vecinos que votan la clase de cada dígito
+        :raises ValueError: si no hay descriptores, no coinciden con las etiquetas o k no es válido
+        """
+        if len(features) == 0 or len(features) != len(labels):
+            raise ValueError('There must be one label per training feature')
+        if not 1 <= k <= len(features):
+            raise ValueError('k must be between 1 and the number of training features')
+
+        self.features = np.ascontiguousarray(features, np.float32)
+        self.labels = np.asarray(labels, np.uint8)
+        self.k = k
+        self.squared_norms = np.einsum('ij,ij->i', self.features, self.features)
+
+    @classmethod
+    def load(cls, model_path: str = DEFAULT_MODEL_PATH, k: int = None) -> 'KNearestDigitClassifier':
+        """
+        Carga un clasificador guardado con save
+
+        :param model_path: ruta del fichero del modelo
+        :param k: número de vecinos, si no se indica se usa el guardado en el modelo
+        :returns: el clasificador
+        """
+        with np.load(str(model_path)) as model:
+            return cls(model['features'].astype(np.float32), model['labels'], int(model['k']) if k is None else k)
+
+    def save(self, model_path: str) -> None:
+        """
+        Guarda el clasificador comprimido, con los descriptores en media precisión
+
+        :param model_path: ruta del fichero del modelo
+        """
+        Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(str(model_path), 'wb') as model_file:
+            np.savez_compressed(model_file, features=self.features.astype(np.float16), labels=self.labels, k=self.k)
+
+    def get_fingerprint(self) -> str:
+        """
+        Obtiene un resumen de los datos de entrenamiento, que identifica al modelo en la configuración del reconocedor
+
+        :returns: los primeros 16 caracteres hexadecimales del resumen SHA-256 de los descriptores y las etiquetas
+        """
+        model_hash = hashlib.sha256(self.features.tobytes())
+        model_hash.update(self.labels.tobytes())
+        model_hash.update(str(self.k).encode())
+        return model_hash.hexdigest()[:16]
+
+    def predict(self, features: np.array) -> np.array:
+        """
+        Clasifica un conjunto de descriptores
+
+        :param features: array numpy con un descriptor por fila
+        :returns: array numpy con el dígito (0 a 9) de cada descriptor
+        """
+        return self.predict_with_confidence(features)[0]
+
+    def predict_with_confidence(self, features: np.array) -> tuple:
+        """
+        Clasifica un conjunto de descriptores con una sola multiplicación de matrices
+
+        :param features: array numpy con un descriptor por fila
+        :returns: una tupla con un array numpy con el dígito (0 a 9) de cada descriptor y otro con la fracción de los k
+        vecinos que tienen ese dígito
+        """
+        if len(features) == 0:
+            return np.empty(0, np.uint8), np.empty(0, np.float32)
+
+        features = np.asarray(features, np.float32)
+        squared_distances = self.squared_norms[np.newaxis, :] - 2 * features.dot(self.features.T)
+        nearest = np.argpartition(squared_distances, self.k - 1, axis=1)[:, :self.k]
+        nearest_distances = np.take_along_axis(squared_distances, nearest, axis=1)
+        nearest = np.take_along_axis(nearest, np.argsort(nearest_distances, axis=1), axis=1)
+
+        votes = np.zeros((len(features), 10), np.float32)
+        nearest_labels = self.labels[nearest]
+        for rank in range(self.k):
+            # El vecino más cercano deshace los empates
+            np.add.at(votes, (np.arange(len(features)), nearest_labels[:, rank]), 1 + (rank == 0) * 0.5)
+        predictions = votes.argmax(axis=1).astype(np.uint8)
+        return predictions, (nearest_labels == predictions[:, np.newaxis]).mean(axis=1).astype(np.float32)
+
+
+def classify_digits(classifier: KNearestDigitClassifier, images: List[np.array],
+                    enclosing_rectangles: List[np.array]) -> List[tuple]:
+    """
+    Clasifica de una sola vez todos los dígitos de un conjunto de imágenes
+
+    :param classifier: clasificador de dígitos
+    :param images: lista de imágenes en blanco y negro con los dígitos de color negro y el fondo blanco
+    :param enclosing_rectangles: lista con los rectángulos que delimitan los dígitos de cada imagen
+    :returns: lista de tuplas con los dígitos de cada imagen, de izquierda a derecha, y la fracción media de vecinos
+    que votan cada dígito, 0 si la imagen no tiene dígitos
+    """
+    glyphs = [extract_glyphs(image, rectangles) for image, rectangles in zip(images, enclosing_rectangles)]
+    digit_counts = [len(image_glyphs) for image_glyphs in glyphs]
+    all_glyphs = np.concatenate(glyphs) if glyphs else np.empty((0, GLYPH_SIZE, GLYPH_SIZE), np.uint8)
+    predictions, vote_shares = classifier.predict_with_confidence(compute_features(all_glyphs))
+
+    texts = []
+    start = 0
+    for digit_count in digit_counts:
+        texts.append((''.join(str(digit) for digit in predictions[start:start + digit_count]),
+                      float(vote_shares[start:start + digit_count].mean()) if digit_count else 0.0))
+        start += digit_count
+    return texts
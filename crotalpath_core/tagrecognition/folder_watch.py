@@ -0,0 +1,277 @@
+"""Detección de las imágenes que aparecen en una carpeta vigilada y registro de las ya procesadas"""
+import ctypes
+import ctypes.util
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+_INOTIFY_READ_BYTES = 64 * 1024
+
+
+def _open_inotify(folder_path: Path) -> int:
+    """
+    Crea una instancia de inotify que avisa de los ficheros escritos o movidos a una carpeta
+
+    :param folder_path: ruta de la carpeta a vigilar
+    :returns: descriptor no bloqueante de la instancia o None si inotify no está disponible
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    inotify_fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if inotify_fd < 0:
+        return None
+    if inotify_add_watch(inotify_fd, os.fsencode(str(folder_path)), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+        os.close(inotify_fd)
+        return None
+    return inotify_fd
+
+
+class FolderWatcher:
+    """
+    Vigila una carpeta y devuelve cada fichero nuevo una única vez, cuando ya se ha terminado de escribir. En Linux se
+    usa inotify, en otro caso o si se indica, la carpeta se recorre periódicamente. Un fichero sin evento de inotify,
+    como los que ya estaban en la carpeta o los perdidos por desbordamiento de la cola de inotify, se da por terminado
+    cuando su tamaño y su fecha de modificación no cambian durante al menos poll_interval segundos. Se ignoran los
+    ficheros ocultos y los que no tienen extensión, que suelen ser ficheros temporales de una escritura en curso
+    """
+
+    def __init__(self, folder_path: str, poll_interval: float = 0.5, use_inotify: bool = True):
+        """
+        Comienza a vigilar una carpeta
+
+        :param folder_path: ruta de la carpeta a vigilar
+        :param poll_interval: segundos entre dos recorridos de la carpeta cuando no se usa inotify y tiempo mínimo sin
+        cambios de un fichero sin evento de inotify para darlo por terminado
+        :param use_inotify: indicador que determina si usar inotify cuando está disponible
+        :raises NotADirectoryError: si la ruta indicada no es un directorio
+        :raises FileNotFoundError: si la ruta indicada no existe
+        """
+        self.folder_path = Path(folder_path)
+        if not self.folder_path.exists():
+            raise FileNotFoundError('Specified data path does not exist: ' + str(self.folder_path))
+        elif not self.folder_path.is_dir():
+            raise NotADirectoryError('Specified data path is not a directory:  ' + str(self.folder_path))
+
+        self.poll_interval = poll_interval
+        self.reported_names = set()
+        self.unsettled_files = {}
+        self.pending_rescan = True
+        self.inotify_fd = _open_inotify(self.folder_path) if use_inotify else None
+
+    @property
+    def uses_inotify(self) -> bool:
+        """Indica si los ficheros nuevos se detectan con inotify en lugar de recorriendo la carpeta"""
+
+        return self.inotify_fd is not None
+
+    def get_new_files(self, timeout: float) -> List[Path]:
+        """
+        Obtiene los ficheros terminados de escribir desde la última llamada. Los que ya existían en la carpeta se
+        incluyen en cuanto dejan de cambiar
+
+        :param timeout: segundos máximos de espera si no hay ficheros nuevos
+        :returns: lista ordenada por nombre de las rutas de los ficheros nuevos
+        """
+        if self.inotify_fd is None:
+            return self.__poll_files(timeout)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            candidate_names = set(self.unsettled_files)
+            if self.pending_rescan:
+                # Los ficheros escritos antes de crear la instancia de inotify, o perdidos por desbordamiento de su
+                # cola, solo se encuentran recorriendo la carpeta y pueden estar escribiéndose todavía
+                self.pending_rescan = False
+                candidate_names.update(entry.name for entry in os.scandir(str(self.folder_path)))
+            new_names = self.__settled_names(self.__file_states(candidate_names))
+
+            wait_time = 0 if new_names else max(deadline - time.monotonic(), 0)
+            if self.unsettled_files:
+                wait_time = min(wait_time, self.poll_interval)
+            for name in self.__read_inotify_events(wait_time):
+                # El evento de fin de escritura hace innecesario esperar a que el fichero deje de cambiar
+                self.unsettled_files.pop(name, None)
+                new_names.add(name)
+
+            new_files = self.__report(new_names)
+            if new_files or time.monotonic() >= deadline:
+                return new_files
+
+    def close(self) -> None:
+        """Deja de vigilar la carpeta"""
+
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __read_inotify_events(self, timeout: float) -> List[str]:
+        """
+        Espera y lee los eventos de inotify pendientes
+
+        :param timeout: segundos máximos de espera si no hay eventos
+        :returns: lista con los nombres de los ficheros escritos o movidos a la carpeta
+        """
+        names = []
+        readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        while readable:
+            try:
+                events = os.read(self.inotify_fd, _INOTIFY_READ_BYTES)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(events):
+                _, mask, _, name_length = _INOTIFY_EVENT_HEADER.unpack_from(events, offset)
+                offset += _INOTIFY_EVENT_HEADER.size
+                if mask & _IN_Q_OVERFLOW:
+                    self.pending_rescan = True
+                elif name_length:
+                    names.append(os.fsdecode(events[offset:offset + name_length].rstrip(b'\0')))
+                offset += name_length
+        return names
+
+    def __poll_files(self, timeout: float) -> List[Path]:
+        """
+        Recorre la carpeta hasta que algún fichero nuevo deja de cambiar o se agota el tiempo de espera
+
+        :param timeout: segundos máximos de espera si no hay ficheros nuevos
+        :returns: lista ordenada por nombre de las rutas de los ficheros nuevos
+        """
+        remaining_time = timeout
+        while True:
+            settled_names = self.__settled_names(self.__file_states(
+                entry.name for entry in os.scandir(str(self.folder_path))))
+            if settled_names or remaining_time <= 0:
+                return self.__report(settled_names)
+            sleep_time = min(self.poll_interval, remaining_time)
+            select.select([], [], [], sleep_time)
+            remaining_time -= sleep_time
+
+    def __file_states(self, names: Iterable[str]) -> dict:
+        """
+        Obtiene el estado de los ficheros candidatos todavía no devueltos
+
+        :param names: nombres de los ficheros
+        :returns: diccionario donde cada entrada es el nombre de un fichero existente y su valor una tupla con su tamaño
+        y su fecha de modificación
+        """
+        file_states = {}
+        for name in names:
+            if name in self.reported_names or not self.__is_candidate(name):
+                continue
+            try:
+                file_stat = os.stat(str(self.folder_path / name))
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode):
+                file_states[name] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return file_states
+
+    def __settled_names(self, file_states: dict) -> set:
+        """
+        Selecciona los ficheros cuyo estado no ha cambiado durante al menos poll_interval segundos y conserva el resto,
+        con el instante en que se observó su estado actual por primera vez, para comprobarlos de nuevo
+
+        :param file_states: diccionario con el estado actual de los ficheros, con el formato de __file_states
+        :returns: conjunto con los nombres de los ficheros terminados de escribir
+        """
+        now = time.monotonic()
+        settled_names = set()
+        unsettled_files = {}
+        for name, file_state in file_states.items():
+            previous_state = self.unsettled_files.get(name)
+            if previous_state is None or previous_state[0] != file_state:
+                unsettled_files[name] = (file_state, now)
+            elif now - previous_state[1] >= self.poll_interval:
+                settled_names.add(name)
+            else:
+                unsettled_files[name] = previous_state
+        self.unsettled_files = unsettled_files
+        return settled_names
+
+    def __report(self, names: set) -> List[Path]:
+        """
+        Selecciona los ficheros todavía no devueltos y los marca como devueltos
+
+        :param names: nombres de los ficheros detectados
+        :returns: lista ordenada por nombre de las rutas de los ficheros no devueltos anteriormente
+        """
+        new_names = sorted(name for name in names if name not in self.reported_names and self.__is_candidate(name))
+        self.reported_names.update(new_names)
+        return [self.folder_path / name for name in new_names]
+
+    @staticmethod
+    def __is_candidate(name: str) -> bool:
+        """Indica si un nombre de fichero puede corresponder a una imagen terminada de escribir"""
+
+        return not name.startswith('.') and '.' in name
+
+
+class ProcessedFilesLog:
+    """
+    Registro en disco de los nombres de los ficheros ya procesados, un nombre por línea, de forma que al reiniciar la
+    vigilancia de una carpeta no se vuelven a procesar
+    """
+
+    def __init__(self, log_path: str):
+        """
+        Abre, creándolo si no existe, el registro de ficheros procesados
+
+        :param log_path: ruta del fichero del registro
+        """
+        self.log_path = Path(log_path)
+        self.names = set()
+        if self.log_path.exists():
+            with open(str(self.log_path), 'r') as log_file:
+                self.names.update(line.rstrip('\n') for line in log_file if line.strip())
+        self.log_file = open(str(self.log_path), 'a')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str) -> None:
+        """
+        Registra un fichero como procesado
+
+        :param name: nombre del fichero
+        """
+        if name not in self.names:
+            self.names.add(name)
+            self.log_file.write(name + '\n')
+            self.log_file.flush()
+
+    def close(self) -> None:
+        """Cierra el fichero del registro"""
+
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
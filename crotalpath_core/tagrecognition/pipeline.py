@@ -0,0 +1,396 @@
+"""Reconocimiento de crotales en etapas concurrentes de decodificación, localización del texto y OCR"""
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+import numpy as np
+
+from crotalpath_core.tagrecognition.profiling import StageProfiler
+from crotalpath_core.tagrecognition.tag import Tag
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
+from crotalpath_core.tagrecognition.tag_recognition import CowTagRecognizer
+from crotalpath_core.tagrecognition.text_location import TextLocator
+
+_END = object()
+_QUEUE_POLL_SECONDS = 0.1
+
+_worker_text_locator = None
+
+
+def _init_locate_worker(text_locator: TextLocator) -> None:
+    """
+    Guarda el detector de texto usado por los procesos de la etapa de localización
+
+    :param text_locator: detector de texto, se envía serializado una única vez por proceso
+    """
+    global _worker_text_locator
+    _worker_text_locator = text_locator
+
+
+def _locate_in_worker(image: np.array) -> tuple:
+    """
+    Localiza el texto de una imagen con el detector del proceso actual
+
+    :param image: imagen en escala de grises
+    :returns: una tupla formada por los rectángulos que delimitan los caracteres y la imagen postprocesada
+    """
+    return _worker_text_locator.locate_text(image)
+
+
+class _PipelineItem:
+    """Imagen en curso por las etapas del reconocimiento, con su posición en la entrada"""
+
+    __slots__ = ('index', 'path', 'tag', 'cache_key', 'located_text', 'error', 'timings')
+
+    def __init__(self, index: int, path: Path):
+        self.index = index
+        self.path = path
+        self.tag = None
+        self.cache_key = None
+        self.located_text = None
+        self.error = None
+        self.timings = {}
+
+
+class _PipelineStage:
+    """Hilos de una etapa, que toman las imágenes de una cola y dejan el resultado en la siguiente"""
+
+    def __init__(self, name: str, workers: int, process_item: Callable, input_queue: queue.Queue,
+                 output_queue: queue.Queue, result_queue: queue.Queue, stop_event: threading.Event):
+        """
+        Crea los hilos de la etapa, sin iniciarlos
+
+        :param name: nombre de la etapa
+        :param workers: número de hilos
+        :param process_item: función que procesa una imagen en curso y devuelve si continúa a la siguiente etapa o, por
+        venir de la caché, ya está terminada
+        :param input_queue: cola de entrada
+        :param output_queue: cola de la siguiente etapa
+        :param result_queue: cola de las imágenes terminadas o con error
+        :param stop_event: evento que indica que el reconocimiento se ha abandonado
+        """
+        self.name = name
+        self.process_item = process_item
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.result_queue = result_queue
+        self.stop_event = stop_event
+        self.lock = threading.Lock()
+        self.running_workers = workers
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.threads = [threading.Thread(target=self.__run, name='{}-{}'.format(name, index), daemon=True)
+                        for index in range(workers)]
+
+    def start(self) -> None:
+        """Inicia los hilos de la etapa"""
+
+        for thread in self.threads:
+            thread.start()
+
+    def __run(self) -> None:
+        """Procesa imágenes hasta recibir el fin de la entrada, que el último hilo reenvía a la siguiente etapa"""
+
+        while True:
+            item = _get(self.input_queue, self.stop_event)
+            if item is None:
+                return
+            if item is _END:
+                # El fin se devuelve a la entrada para el resto de hilos de la etapa
+                _put(self.input_queue, _END, self.stop_event)
+                with self.lock:
+                    self.running_workers -= 1
+                    last_worker = self.running_workers == 0
+                if last_worker:
+                    _put(self.output_queue, _END, self.stop_event)
+                return
+
+            start = time.perf_counter()
+            try:
+                next_stage = self.process_item(item)
+            except Exception as error:
+                item.error = error
+                next_stage = False
+            elapsed = time.perf_counter() - start
+            item.timings[self.name] = round(elapsed * 1000, 3)
+            with self.lock:
+                self.busy_seconds += elapsed
+                self.items += 1
+            _put(self.output_queue if next_stage else self.result_queue, item, self.stop_event)
+
+
+class _MonitoredQueue(queue.Queue):
+    """Cola acotada que registra su ocupación cada vez que se añade un elemento"""
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.depth_samples = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+
+    def _put(self, item) -> None:
+        super()._put(item)
+        depth = len(self.queue)
+        self.depth_samples += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+
+
+def _get(source_queue: queue.Queue, stop_event: threading.Event):
+    """
+    Toma un elemento de una cola, esperando mientras no se abandone el reconocimiento
+
+    :returns: el elemento o None si se ha abandonado el reconocimiento
+    """
+    while not stop_event.is_set():
+        try:
+            return source_queue.get(timeout=_QUEUE_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _put(target_queue: queue.Queue, item, stop_event: threading.Event) -> None:
+    """Añade un elemento a una cola, esperando a que haya hueco mientras no se abandone el reconocimiento"""
+
+    while not stop_event.is_set():
+        try:
+            target_queue.put(item, timeout=_QUEUE_POLL_SECONDS)
+            return
+        except queue.Full:
+            pass
+
+
+class RecognitionPipeline:
+    """
+    Reconoce imágenes de crotales en tres etapas que se solapan, conectadas por colas acotadas: la lectura y
+    decodificación de cada imagen en hilos, la localización del texto, limitada por la CPU, en procesos, y el OCR en
+    hilos, que con Tesseract esperan a su proceso. Cada hilo de OCR tiene su propio reconocedor de texto. Los
+    resultados se devuelven en el orden de entrada y el número de imágenes en curso, incluidas las terminadas que
+    esperan a una anterior más lenta, está acotado, de forma que una imagen lenta no acumula en memoria las siguientes
+    """
+
+    def __init__(self, recognizer: CowTagRecognizer, read_image: Callable, decode_threads: int = 2,
+                 locate_processes: int = 2, ocr_threads: int = 2, queue_size: int = 8, cache: TagResultCache = None,
+                 profile: bool = False):
+        """
+        Crea el conjunto de etapas, sin iniciarlas
+
+        :param recognizer: reconocedor de crotales cuyo detector de texto, OCR y criterios de descarte se usan
+        :param read_image: función que recibe la ruta de una imagen y devuelve la imagen decodificada
+        :param decode_threads: número de hilos de la etapa de lectura y decodificación
+        :param locate_processes: número de procesos de la etapa de localización, cada uno atendido por un hilo
+        :param ocr_threads: número de hilos de la etapa de OCR
+        :param queue_size: número máximo de imágenes en cada cola entre dos etapas y de imágenes en curso, además de
+        las que procesan los hilos de las etapas
+        :param cache: caché donde buscar, tras decodificar, y almacenar el resultado de cada imagen
+        :param profile: indicador que determina si añadir a cada crotal el tiempo en milisegundos de cada etapa
+        :raises ValueError: si alguna etapa no tiene al menos un hilo o proceso o las colas tienen tamaño menor que 1
+        """
+        if min(decode_threads, locate_processes, ocr_threads) < 1:
+            raise ValueError('Each pipeline stage needs at least one worker')
+        if queue_size < 1:
+            raise ValueError('Pipeline queue size must be at least 1')
+
+        self.recognizer = recognizer
+        self.read_image = read_image
+        self.workers = {'decode': decode_threads, 'locate': locate_processes, 'ocr': ocr_threads}
+        self.queue_size = queue_size
+        self.window_size = queue_size + decode_threads + locate_processes + ocr_threads
+        self.window = None
+        self.window_lock = threading.Lock()
+        self.images_in_flight = 0
+        self.max_images_in_flight = 0
+        self.cache = cache
+        self.cache_lock = threading.Lock()
+        self.configuration = recognizer.get_configuration() if cache is not None else None
+        self.profile = profile
+        self.ocr_pool = queue.Queue()
+        for _ in range(ocr_threads):
+            self.ocr_pool.put(recognizer.create_text_recognizer(StageProfiler()))
+        self.stages = []
+        self.queues = {}
+        self.elapsed_seconds = 0.0
+
+    def iterate(self, images_path: List[Path]) -> Iterator[Tag]:
+        """
+        Reconoce las imágenes recibidas, devolviendo cada crotal, en el orden de entrada, en cuanto está reconocido. Si
+        se deja de consumir el iterador las etapas se detienen
+
+        :param images_path: lista con las rutas de las imágenes a reconocer
+        :returns: iterador de objetos Tag con el resultado de cada reconocimiento
+        :raises Exception: el error producido al reconocer una imagen, cuando le corresponde ser devuelta
+        """
+        stop_event = threading.Event()
+        self.window = threading.BoundedSemaphore(self.window_size)
+        self.images_in_flight = self.max_images_in_flight = 0
+        self.queues = {name: _MonitoredQueue(self.queue_size) for name in ('input', 'decoded', 'located')}
+        # Nunca hay más imágenes terminadas que en curso, por lo que añadir a esta cola no espera
+        self.queues['recognized'] = _MonitoredQueue(self.window_size)
+        recognized_queue = self.queues['recognized']
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.workers['locate'], initializer=_init_locate_worker,
+                                 initargs=(self.recognizer.text_locator,)) as locate_executor:
+            self.stages = [
+                _PipelineStage('decode', self.workers['decode'], self.__decode, self.queues['input'],
+                               self.queues['decoded'], recognized_queue, stop_event),
+                _PipelineStage('locate', self.workers['locate'],
+                               lambda item: self.__locate(locate_executor, item), self.queues['decoded'],
+                               self.queues['located'], recognized_queue, stop_event),
+                _PipelineStage('ocr', self.workers['ocr'], self.__recognize_text, self.queues['located'],
+                               recognized_queue, recognized_queue, stop_event)]
+            feeder = threading.Thread(target=self.__feed, args=(images_path, stop_event), name='feed', daemon=True)
+            for stage in self.stages:
+                stage.start()
+            feeder.start()
+
+            try:
+                pending_items = {}
+                for index in range(len(images_path)):
+                    while index not in pending_items:
+                        item = _get(recognized_queue, stop_event)
+                        if item is not _END:
+                            pending_items[item.index] = item
+                    item = pending_items.pop(index)
+                    self.__release_window()
+                    yield self.__finish_item(item)
+            finally:
+                stop_event.set()
+                self.elapsed_seconds = time.perf_counter() - start
+
+    def get_statistics(self) -> dict:
+        """
+        Devuelve el uso de cada etapa y la ocupación de cada cola del último reconocimiento, para dimensionar las
+        etapas: una etapa con un uso cercano a 1 y una cola de entrada llena es el cuello de botella
+
+        :returns: diccionario con el tiempo total en segundos ('elapsed_seconds'), el número máximo de imágenes en curso
+        ('max_images_in_flight') y su límite ('window_size'), y para cada etapa ('stages') el
+        número de hilos o procesos ('workers'), de imágenes procesadas ('items'), el tiempo ocupado en segundos
+        ('busy_seconds') y la fracción del tiempo total ocupada ('utilization'), y para cada cola ('queues') su
+        capacidad ('capacity'), la ocupación media ('mean_depth') y la máxima ('max_depth') al añadir una imagen
+        """
+        stages = {}
+        for stage in self.stages:
+            capacity_seconds = max(self.elapsed_seconds * len(stage.threads), 1e-9)
+            stages[stage.name] = {'workers': len(stage.threads), 'items': stage.items,
+                                  'busy_seconds': round(stage.busy_seconds, 3),
+                                  'utilization': round(min(stage.busy_seconds / capacity_seconds, 1.0), 3)}
+
+        queues = {name: {'capacity': monitored_queue.maxsize or None,
+                         'mean_depth': round(monitored_queue.depth_sum / max(monitored_queue.depth_samples, 1), 2),
+                         'max_depth': monitored_queue.max_depth}
+                  for name, monitored_queue in self.queues.items()}
+        return {'elapsed_seconds': round(self.elapsed_seconds, 3), 'max_images_in_flight': self.max_images_in_flight,
+                'window_size': self.window_size, 'stages': stages, 'queues': queues}
+
+    def __feed(self, images_path: List[Path], stop_event: threading.Event) -> None:
+        """
+        Añade las rutas a la cola de entrada, esperando mientras está llena o se ha alcanzado el número máximo de
+        imágenes en curso, y después el fin de la entrada
+        """
+        for index, path in enumerate(images_path):
+            while not self.window.acquire(timeout=_QUEUE_POLL_SECONDS):
+                if stop_event.is_set():
+                    return
+            with self.window_lock:
+                self.images_in_flight += 1
+                self.max_images_in_flight = max(self.max_images_in_flight, self.images_in_flight)
+            _put(self.queues['input'], _PipelineItem(index, path), stop_event)
+        _put(self.queues['input'], _END, stop_event)
+
+    def __release_window(self) -> None:
+        """Libera el hueco de una imagen que sale de las etapas hacia el consumidor"""
+
+        with self.window_lock:
+            self.images_in_flight -= 1
+        self.window.release()
+
+    def __decode(self, item: _PipelineItem) -> bool:
+        """
+        Lee y decodifica una imagen, crea su crotal y, si está configurada, busca su resultado en la caché
+
+        :param item: imagen en curso
+        :returns: False si el resultado está en la caché y la imagen ya está terminada
+        """
+        item.tag = self.recognizer.create_tag(self.read_image(item.path))
+        if self.cache is None:
+            return True
+
+        item.cache_key = self.cache.key(item.tag.gray_image, self.configuration)
+        with self.cache_lock:
+            cached_detection = self.cache.get(item.cache_key)
+        if cached_detection is None:
+            return True
+
+        bounding_rectangles = np.array(cached_detection['bounding_rects'], np.int32).reshape(-1, 4)
+        item.tag.set_detection(text=cached_detection['digits'], bounding_rectangles=bounding_rectangles,
+                               confidence=cached_detection.get('confidence'),
+                               rejection_reason=cached_detection.get('rejection_reason'))
+        item.tag.cache_hit = True
+        return False
+
+    @staticmethod
+    def __locate(locate_executor: ProcessPoolExecutor, item: _PipelineItem) -> bool:
+        """
+        Localiza el texto de una imagen en uno de los procesos, el hilo espera al resultado
+
+        :param locate_executor: conjunto de procesos de la etapa
+        :param item: imagen en curso
+        :returns: True, la imagen continúa al OCR
+        """
+        item.located_text = locate_executor.submit(_locate_in_worker, item.tag.gray_image).result()
+        return True
+
+    def __recognize_text(self, item: _PipelineItem) -> bool:
+        """
+        Descarta la imagen si sus rectángulos no pueden ser los dígitos de un crotal o, en otro caso, reconoce su texto
+        con uno de los reconocedores de texto de la etapa
+
+        :param item: imagen en curso
+        :returns: True, la imagen está terminada
+        """
+        enclosing_rectangles, digits_only_image = item.located_text
+        item.located_text = None
+        rejection_reason = self.recognizer.check_located_text(enclosing_rectangles)
+        if rejection_reason is not None:
+            item.tag.set_detection(text='', bounding_rectangles=enclosing_rectangles, confidence=0.0,
+                                   rejection_reason=rejection_reason)
+            return True
+
+        ocr = self.ocr_pool.get()
+        try:
+            recognized_digits, ocr_confidence = ocr.recognize_text_with_confidence(digits_only_image,
+                                                                                   enclosing_rectangles)
+        finally:
+            self.ocr_pool.put(ocr)
+        self.recognizer.finish_detection(item.tag, recognized_digits, enclosing_rectangles, ocr_confidence)
+        return True
+
+    def __finish_item(self, item: _PipelineItem) -> Tag:
+        """
+        Termina una imagen en el hilo que consume los resultados: lanza su error, reintenta su reconocimiento si su
+        confianza es baja, lo almacena en la caché si no depende del tiempo de los reintentos y le añade los tiempos de
+        cada etapa
+
+        :param item: imagen terminada
+        :returns: el objeto Tag con el resultado del reconocimiento
+        :raises Exception: el error producido al reconocer la imagen
+        """
+        if item.error is not None:
+            raise item.error
+
+        tag = item.tag
+        if not tag.cache_hit and self.recognizer.needs_retry(tag):
+            start = time.perf_counter()
+            self.recognizer.retry_detection(tag)
+            item.timings['retry'] = round((time.perf_counter() - start) * 1000, 3)
+        if self.cache is not None and not tag.cache_hit and not tag.retry_truncated:
+            with self.cache_lock:
+                self.cache.put(item.cache_key, tag.get_detection())
+        if self.profile:
+            tag.timings = item.timings
+        return tag
@@ -0,0 +1,94 @@
+"""Medición opcional del tiempo de cada etapa del reconocimiento de crotales"""
+import time
+from contextlib import nullcontext
+from typing import List
+
+import numpy as np
+
+_DISABLED_STAGE = nullcontext()
+
+
+class _TimedStage:
+    """Contexto que acumula el tiempo transcurrido en una etapa del reconocimiento"""
+
+    def __init__(self, timings: dict, name: str):
+        self.timings = timings
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class StageProfiler:
+    """Registra el tiempo, en milisegundos, de cada etapa del reconocimiento de una imagen"""
+
+    def __init__(self, enabled: bool = False):
+        """
+        Crea un medidor de tiempos, si no está activado sus etapas no realizan ninguna medición
+
+        :param enabled: indicador que determina si medir o no los tiempos
+        """
+        self.enabled = enabled
+        self.timings = {}
+
+    def start_image(self) -> None:
+        """Descarta los tiempos registrados para comenzar con una nueva imagen"""
+
+        if self.enabled:
+            self.timings = {}
+
+    def stage(self, name: str):
+        """
+        Devuelve el contexto con el que medir una etapa
+
+        :param name: nombre de la etapa
+        :returns: un contexto que registra el tiempo de la etapa o que no hace nada si el medidor no está activado
+        """
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _TimedStage(self.timings, name)
+
+    def finish_image(self) -> dict:
+        """
+        Devuelve los tiempos registrados para la imagen actual
+
+        :returns: diccionario con el tiempo en milisegundos de cada etapa o None si el medidor no está activado
+        """
+        if not self.enabled:
+            return None
+
+        timings, self.timings = self.timings, {}
+        return {stage: round(elapsed, 3) for stage, elapsed in timings.items()}
+
+
+def summarize_timings(timings: List[dict]) -> dict:
+    """
+    Resume los tiempos por etapa de un conjunto de imágenes
+
+    :param timings: lista con el diccionario de tiempos de cada imagen
+    :returns: diccionario donde cada entrada es una etapa y su valor el número de imágenes ('count'), la media
+    ('mean'), los percentiles 50, 90 y 99 ('p50', 'p90', 'p99') y el máximo ('max') en milisegundos
+    """
+    stage_timings = {}
+    for image_timings in timings:
+        for stage, elapsed in image_timings.items():
+            stage_timings.setdefault(stage, []).append(elapsed)
+
+    summary = {}
+    for stage, elapsed in stage_timings.items():
+        p50, p90, p99 = np.percentile(elapsed, [50, 90, 99])
+        summary[stage] = {'count': len(elapsed),
+                          'mean': round(float(np.mean(elapsed)), 3),
+                          'p50': round(float(p50), 3),
+                          'p90': round(float(p90), 3),
+                          'p99': round(float(p99), 3),
+                          'max': round(float(np.max(elapsed)), 3)}
+
+    return summary
@@ -0,0 +1,202 @@
+"""Almacén de resultados de reconocimiento en una base de datos SQLite indexada por los dígitos de cada crotal"""
+import json
+import sqlite3
+import threading
+from typing import List
+
+import numpy as np
+
+from crotalpath_core.tagrecognition.tag import Tag
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    identifier TEXT NOT NULL,
+    digits TEXT,
+    bounding_rects BLOB,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS results_digits ON results (digits);
+CREATE INDEX IF NOT EXISTS results_source ON results (source);
+'''
+
+
+class TagResultStore:
+    """
+    Almacén de los resultados de reconocimiento de crotales. Los rectángulos se guardan como enteros de 32 bits en
+    binario y los dígitos se indexan para buscar los crotales por su número. Los resultados añadidos se escriben en
+    grupos, cada uno en una sola transacción, y la base de datos usa el modo WAL para que las consultas no esperen a
+    las escrituras. Cada hilo usa su propia conexión
+    """
+
+    def __init__(self, database_path: str, commit_size: int = 1000, busy_timeout_seconds: float = 30):
+        """
+        Abre, creándola si no existe, la base de datos de resultados
+
+        :param database_path: ruta del fichero de la base de datos
+        :param commit_size: número de resultados añadidos a partir del cual se escriben en la base de datos
+        :param busy_timeout_seconds: tiempo máximo de espera a que otra conexión termine de escribir
+        :raises ValueError: si el número de resultados por escritura es menor que 1
+        """
+        if commit_size < 1:
+            raise ValueError('Commit size must be at least 1')
+
+        self.database_path = str(database_path)
+        self.commit_size = commit_size
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self.pending_rows = []
+        self.local = threading.local()
+        self.__connection().executescript(_SCHEMA)
+
+    def __getstate__(self) -> dict:
+        """Excluye las conexiones y los resultados sin escribir al serializar, cada proceso abre sus conexiones"""
+
+        return {'database_path': self.database_path, 'commit_size': self.commit_size,
+                'busy_timeout_seconds': self.busy_timeout_seconds, 'pending_rows': []}
+
+    def __setstate__(self, state: dict) -> None:
+        """Restaura el almacén sin conexiones abiertas"""
+
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def add_tag(self, tag: Tag, source: str = None) -> None:
+        """
+        Añade el resultado de un crotal reconocido
+
+        :param tag: objeto Tag con el resultado del reconocimiento
+        :param source: origen del resultado, como el identificador de la tarea del servidor web
+        """
+        self.add_detection(tag.get_detection(), source)
+
+    def add_detection(self, detection: dict, source: str = None) -> None:
+        """
+        Añade un resultado de reconocimiento con el formato de Tag.get_detection
+
+        :param detection: diccionario con los dígitos ('digits'), los rectángulos ('bounding_rects'), el identificador
+        ('identifier') y, opcionalmente, los tiempos de cada etapa ('timings')
+        :param source: origen del resultado, como el identificador de la tarea del servidor web
+        """
+        self.pending_rows.append(self.__detection_to_row(detection, source))
+        if len(self.pending_rows) >= self.commit_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """Escribe en una sola transacción los resultados añadidos pendientes"""
+
+        if not self.pending_rows:
+            return
+        with self.__connection() as connection:
+            connection.executemany('INSERT INTO results (source, identifier, digits, bounding_rects, timings) '
+                                   'VALUES (?, ?, ?, ?, ?)', self.pending_rows)
+        self.pending_rows = []
+
+    def delete_source(self, source: str) -> None:
+        """
+        Elimina los resultados escritos de un origen, por ejemplo antes de volver a reconocer una tarea
+
+        :param source: origen de los resultados
+        """
+        with self.__connection() as connection:
+            connection.execute('DELETE FROM results WHERE source = ?', (source,))
+
+    def replace_source(self, source: str, detections: List[dict]) -> None:
+        """
+        Reemplaza los resultados escritos de un origen por otros en una sola transacción, de forma que nunca se vean
+        los de dos intentos a la vez ni queden a medio escribir. No afecta a los resultados añadidos pendientes
+
+        :param source: origen de los resultados, como el identificador de la tarea del servidor web
+        :param detections: lista de resultados con el formato de Tag.get_detection
+        """
+        rows = [self.__detection_to_row(detection, source) for detection in detections]
+        with self.__connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM results WHERE source = ?', (source,))
+            connection.executemany('INSERT INTO results (source, identifier, digits, bounding_rects, timings) '
+                                   'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def find_by_digits(self, digits: str, prefix: bool = False, limit: int = 100) -> List[dict]:
+        """
+        Busca los resultados con un número de crotal usando el índice de los dígitos
+
+        :param digits: dígitos a buscar
+        :param prefix: indicador que determina si buscar los crotales cuyo número empieza por los dígitos en lugar de
+        los que coinciden exactamente
+        :param limit: número máximo de resultados a devolver
+        :returns: lista de diccionarios, en el orden en que se añadieron, con los dígitos ('digits'), los rectángulos
+        ('bounding_rects'), el identificador ('identifier'), el origen ('source') y, si se midieron, los tiempos
+        ('timings')
+        """
+        if prefix and digits:
+            # Un rango sobre el índice en lugar de LIKE, que con la colación por defecto no usa el índice
+            condition, parameters = 'digits >= ? AND digits < ?', (digits, digits[:-1] + chr(ord(digits[-1]) + 1))
+        elif prefix:
+            condition, parameters = 'digits IS NOT NULL', ()
+        else:
+            condition, parameters = 'digits = ?', (digits,)
+
+        rows = self.__connection().execute(
+            'SELECT source, identifier, digits, bounding_rects, timings FROM results WHERE {} ORDER BY id LIMIT ?'
+            .format(condition), parameters + (limit,))
+        return [self.__row_to_detection(row) for row in rows]
+
+    def count(self) -> int:
+        """
+        Cuenta los resultados escritos
+
+        :returns: número de resultados en la base de datos
+        """
+        return self.__connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self) -> None:
+        """Escribe los resultados pendientes y cierra la conexión de este hilo"""
+
+        self.commit()
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def __detection_to_row(detection: dict, source: str) -> tuple:
+        """Convierte un resultado con el formato de Tag.get_detection a una fila de la base de datos"""
+
+        bounding_rects = detection.get('bounding_rects')
+        if bounding_rects is not None:
+            bounding_rects = np.asarray(bounding_rects, '<i4').reshape(-1, 4).tobytes()
+        timings = detection.get('timings')
+        if timings is not None:
+            timings = json.dumps(timings)
+        return source, str(detection['identifier']), detection.get('digits'), bounding_rects, timings
+
+    @staticmethod
+    def __row_to_detection(row: tuple) -> dict:
+        """Convierte una fila de la base de datos al formato de Tag.get_detection, añadiendo el origen"""
+
+        source, identifier, digits, bounding_rects, timings = row
+        detection = {'digits': digits,
+                     'bounding_rects': None if bounding_rects is None else
+                     np.frombuffer(bounding_rects, '<i4').reshape(-1, 4).tolist(),
+                     'identifier': identifier,
+                     'source': source}
+        if timings is not None:
+            detection['timings'] = json.loads(timings)
+        return detection
+
+    def __connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión de este hilo, abriéndola la primera vez"""
+
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=self.busy_timeout_seconds)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
@@ -11,8 +11,9 @@ class NotAFileError(Exception):
 class Tag:
     """Interfaz común a seguir por los descriptores de crotales"""
 
-    def set_detection(self, text: str, bounding_rectangles: np.array)-> None:
-        """Añade los datos del reconocimiento del crotal y sus rectángulos delimitadores"""
+    def set_detection(self, text: str, bounding_rectangles: np.array, confidence: float = None,
+                      rejection_reason: str = None) -> None:
+        """Añade los datos del reconocimiento del crotal, sus rectángulos delimitadores y la confianza del resultado"""
 
         raise NotImplementedError()
 
@@ -31,42 +32,70 @@ class Tag:
 
         raise NotImplementedError()
 
+    def release_images(self) -> None:
+        """Libera las imágenes del crotal conservando el resultado del reconocimiento"""
+
+        raise NotImplementedError()
+
 
 class CowTag(Tag):
     """Alberga la imagen de un tag y su predicción"""
 
     def __init__(self, image: np.array):
         """
-        Crea un descriptor de crotales de vaca inicializado con la imagen recibida
+        Crea un descriptor de crotales de vaca inicializado con la imagen recibida. Si la imagen ya está en escala de
+        grises no se conserva ninguna imagen en color
 
-        :param image: imagen en color (3 canales) en forma de numpy array
+        :param image: imagen en color (3 canales) o en escala de grises (1 canal) en forma de numpy array
         """
         self.identifier = None
-        self.image = image
-        self.gray_image = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        if image.ndim == 2:
+            self.image = None
+            self.gray_image = image
+        else:
+            self.image = image
+            self.gray_image = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
         self.digits = None
         self.bounding_rectangles = None
-
-    def set_detection(self, text: str, bounding_rectangles: np.array):
+        self.confidence = None
+        self.rejection_reason = None
+        self.cache_hit = False
+        self.retry_truncated = False
+        self.timings = None
+
+    def set_detection(self, text: str, bounding_rectangles: np.array, confidence: float = None,
+                      rejection_reason: str = None):
         """
         Añade los datos del reconocimiento del crotal y sus rectángulos delimitadores
 
         :param text: dígitos que contiene la imagen del crotal
         :param bounding_rectangles: rectángulos delimitadores de los dígitos de la imagen del crotal
+        :param confidence: confianza del reconocimiento entre 0 y 1, None si no se ha podido estimar
+        :param rejection_reason: motivo por el que se ha descartado la imagen sin reconocer su texto, None si no se ha
+        descartado
         """
         self.digits = text
         self.bounding_rectangles = bounding_rectangles[bounding_rectangles[:, 0].argsort()].tolist()
+        self.confidence = confidence
+        self.rejection_reason = rejection_reason
 
     def get_detection(self) -> dict:
         """
         Devuelve la descripción del crotal
 
         :returns: la descripción del crotal en formado diccionario con los digitos (digits), los rectángulos
-        ('bounding_rects') y el identificador ('identifier')
+        ('bounding_rects'), el identificador ('identifier') y la confianza ('confidence'). Si la imagen se ha descartado
+        sin reconocer su texto el motivo se añade en la clave 'rejection_reason' y si se han medido los tiempos de cada
+        etapa del reconocimiento se añaden, en milisegundos, en la clave 'timings'
         """
         output = {'digits': self.digits,
                   'bounding_rects': self.bounding_rectangles,
-                  'identifier': str(self.identifier)}
+                  'identifier': str(self.identifier),
+                  'confidence': None if self.confidence is None else round(self.confidence, 3)}
+        if self.rejection_reason is not None:
+            output['rejection_reason'] = self.rejection_reason
+        if self.timings is not None:
+            output['timings'] = self.timings
         return output
 
     def export_json(self) -> str:
@@ -81,10 +110,19 @@ class CowTag(Tag):
     def show_result_window(self):
         """Muestra el resultado del reconocimiento en una ventana de OpenCV con el resultado como titulo de ventana"""
 
-        if self.digits is not None and self.image is not None and self.bounding_rectangles is not None:
-            shown_image = self.image.copy()
+        if self.digits is not None and self.gray_image is not None and self.bounding_rectangles is not None:
+            if self.image is not None:
+                shown_image = self.image.copy()
+            else:
+                shown_image = cv2.cvtColor(self.gray_image, cv2.COLOR_GRAY2BGR)
             for rect in self.bounding_rectangles:
                 cv2.rectangle(shown_image, (rect[0], rect[1]), (rect[0] + rect[2], rect[1] + rect[3]), (0, 255, 0), 3)
             cv2.imshow(self.digits, shown_image)
             cv2.waitKey(0)
             cv2.destroyAllWindows()
+
+    def release_images(self):
+        """Libera las imágenes del crotal, una vez exportado su resultado ya no son necesarias"""
+
+        self.image = None
+        self.gray_image = None
@@ -0,0 +1,166 @@
+"""Caché de resultados de reconocimiento indexada por el contenido de la imagen y la configuración del reconocedor"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# Al superar el tamaño máximo en disco se eliminan resultados hasta esta fracción del máximo, de forma que la carpeta
+# solo se recorra de nuevo tras escribir otra fracción del máximo y no en cada resultado
+DISK_LOW_WATER_RATIO = 0.9
+
+
+class TagResultCache:
+    """
+    Caché LRU en memoria, con un nivel opcional en disco, de los resultados de reconocimiento de crotales. La carpeta
+    en disco se puede compartir entre procesos: cada uno cuenta los bytes que escribe y, al superar el máximo, recorre
+    la carpeta para obtener su tamaño real y eliminar los resultados usados hace más tiempo, por lo que con varios
+    procesos el máximo se puede superar como mucho en la holgura de cada proceso
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_path: str = None, max_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        Crea una caché de resultados de reconocimiento
+
+        :param max_entries: número máximo de resultados almacenados en memoria
+        :param disk_path: ruta de la carpeta donde almacenar los resultados en disco, si no se indica solo se usa la
+        memoria
+        :param max_disk_bytes: tamaño máximo en bytes de los resultados almacenados en disco
+        :raises ValueError: si el número de resultados o el tamaño en disco no son positivos
+        """
+        if max_entries < 1 or max_disk_bytes < 1:
+            raise ValueError('Cache sizes must be positive')
+
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_path = None if disk_path is None else Path(disk_path)
+        self.memory_entries = OrderedDict()
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_path is not None:
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in self.disk_path.glob('*.json'))
+
+    @staticmethod
+    def key(image: np.array, configuration: dict) -> str:
+        """
+        Calcula la clave de una imagen para una configuración del reconocedor
+
+        :param image: imagen decodificada en forma de numpy array
+        :param configuration: diccionario con la configuración del reconocedor
+        :returns: resumen SHA-256, en hexadecimal, de la configuración, las dimensiones y el contenido de la imagen
+        """
+        image = np.ascontiguousarray(image)
+        image_hash = hashlib.sha256(json.dumps(configuration, sort_keys=True).encode())
+        image_hash.update('{}{}'.format(image.shape, image.dtype.str).encode())
+        image_hash.update(image.data)
+        return image_hash.hexdigest()
+
+    def get(self, key: str) -> dict:
+        """
+        Obtiene el resultado almacenado para una clave, buscando primero en memoria y después en disco
+
+        :param key: clave de la imagen
+        :returns: diccionario con los dígitos ('digits'), los rectángulos ('bounding_rects') y, si se almacenaron, la
+        confianza ('confidence') y el motivo de descarte ('rejection_reason') o None si no existe
+        """
+        if key in self.memory_entries:
+            self.memory_entries.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory_entries[key]
+
+        if self.disk_path is not None:
+            entry_path = self.disk_path / (key + '.json')
+            try:
+                with open(entry_path, 'r') as entry_file:
+                    detection = json.load(entry_file)
+                os.utime(str(entry_path))
+            except (OSError, ValueError):
+                detection = None
+
+            if detection is not None:
+                self.disk_hits += 1
+                self.__put_memory(key, detection)
+                return detection
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, detection: dict) -> None:
+        """
+        Almacena el resultado de una imagen
+
+        :param key: clave de la imagen
+        :param detection: diccionario con los dígitos ('digits'), los rectángulos ('bounding_rects') y, opcionalmente,
+        la confianza ('confidence') y el motivo de descarte ('rejection_reason')
+        """
+        detection = {field: detection[field] for field in ('digits', 'bounding_rects', 'confidence', 'rejection_reason')
+                     if field in detection}
+        self.__put_memory(key, detection)
+
+        if self.disk_path is not None:
+            entry_content = json.dumps(detection)
+            entry_path = self.disk_path / (key + '.json')
+            try:
+                replaced_bytes = entry_path.stat().st_size
+            except OSError:
+                replaced_bytes = 0
+            partial_entry_path = self.disk_path / '{}.{}.part'.format(key, os.getpid())
+            with open(partial_entry_path, 'w') as entry_file:
+                entry_file.write(entry_content)
+            os.replace(str(partial_entry_path), str(entry_path))
+
+            self.disk_bytes += len(entry_content) - replaced_bytes
+            if self.disk_bytes > self.max_disk_bytes:
+                self.__evict_disk()
+
+    def get_statistics(self) -> dict:
+        """
+        Devuelve los contadores de uso de la caché
+
+        :returns: diccionario con los aciertos en memoria ('memory_hits'), en disco ('disk_hits'), los fallos
+        ('misses') y el número de resultados en memoria ('memory_entries')
+        """
+        return {'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self.memory_entries)}
+
+    def __put_memory(self, key: str, detection: dict) -> None:
+        """Almacena un resultado en memoria descartando el menos usado recientemente si se supera el máximo"""
+
+        self.memory_entries[key] = detection
+        self.memory_entries.move_to_end(key)
+        if len(self.memory_entries) > self.max_entries:
+            self.memory_entries.popitem(last=False)
+
+    def __evict_disk(self) -> None:
+        """
+        Elimina los resultados en disco usados hace más tiempo hasta quedar por debajo de DISK_LOW_WATER_RATIO del
+        tamaño máximo
+        """
+
+        entries = []
+        for entry_path in self.disk_path.glob('*.json'):
+            try:
+                entry_stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+
+        entries.sort()
+        self.disk_bytes = sum(entry_size for _, entry_size, _ in entries)
+        low_water_bytes = self.max_disk_bytes * DISK_LOW_WATER_RATIO
+        for _, entry_size, entry_path in entries:
+            if self.disk_bytes <= low_water_bytes:
+                break
+            try:
+                entry_path.unlink()
+            except OSError:
+                continue
+            self.disk_bytes -= entry_size
@@ -1,9 +1,20 @@
 """Conjunto reconocedores de crotales que siguen la interfaz definida por TagRecognizer"""
+import time
+from typing import List
+
 import numpy as np
 
+from crotalpath_core.tagrecognition.profiling import StageProfiler
 from crotalpath_core.tagrecognition.tag import Tag, CowTag
 from crotalpath_core.tagrecognition.text_location import LargestTextLocator
-from crotalpath_core.tagrecognition.text_recognition import ClassicOCR
+from crotalpath_core.tagrecognition.text_recognition import ClassicOCR, DigitClassifierOCR, TextRecognizer
+
+# Parámetros alternativos del detector de texto probados al reintentar un reconocimiento con baja confianza: umbral bajo
+# para crotales oscuros, umbral alto para reflejos, trazos finos y fondos con ruido
+RETRY_HYPOTHESES = ({'thresholding_threshold': 15, 'noise_size': 5, 'digit_difference_threshold': 0.3},
+                    {'thresholding_threshold': 60, 'noise_size': 5, 'digit_difference_threshold': 0.3},
+                    {'thresholding_threshold': 30, 'noise_size': 3, 'digit_difference_threshold': 0.3},
+                    {'thresholding_threshold': 30, 'noise_size': 7, 'digit_difference_threshold': 0.2})
 
 
 class TagRecognizer:
@@ -13,26 +24,322 @@ class TagRecognizer:
         """Reconoce los caracteres presentes en la imagen del crotal recibida"""
         raise NotImplementedError()
 
+    def recognize_images(self, images: List[np.array]) -> List[Tag]:
+        """Reconoce los caracteres de un conjunto de imágenes de crotales, por defecto cada imagen por separado"""
+        return [self.recognize_image(image) for image in images]
+
+    def create_tag(self, image: np.array) -> Tag:
+        """Crea el descriptor del crotal, sin reconocer, para la imagen recibida"""
+        raise NotImplementedError()
+
+    def get_configuration(self) -> dict:
+        """Devuelve los parámetros que determinan el resultado del reconocimiento"""
+        raise NotImplementedError()
+
 
 class CowTagRecognizer(TagRecognizer):
     """Reconocedor de los dígitos de los crotales de vacas"""
 
-    def __init__(self):
-        """Crea un reconocedor de crotales de vaca"""
+    def __init__(self, profile: bool = False, roi_scale: float = None, min_digits: int = 2,
+                 min_height_ratio: float = 0.4, retry_threshold: float = None, retry_budget_seconds: float = 0.5,
+                 ocr_confidence: bool = False):
+        """
+        Crea un reconocedor de crotales de vaca
+
+        :param profile: indicador que determina si medir o no el tiempo de cada etapa del reconocimiento, los tiempos
+        se añaden al resultado de cada crotal
+        :param roi_scale: escala, entre 0 y 1, de la imagen reducida donde localizar la región de los dígitos antes de
+        procesarla a resolución completa. Si no se indica se procesa siempre la imagen completa
+        :param min_digits: número mínimo de dígitos localizados para reconocer el texto de la imagen
+        :param min_height_ratio: proporción mínima, entre 0 y 1, entre el alto del dígito más bajo y el del más alto
+        para reconocer el texto de la imagen
+        :param retry_threshold: confianza, entre 0 y 1, por debajo de la cual se reintenta el reconocimiento con los
+        parámetros de RETRY_HYPOTHESES. Si no se indica no se reintenta
+        :param retry_budget_seconds: tiempo en segundos tras el cual no se prueban más hipótesis en los reintentos de
+        cada crotal
+        :param ocr_confidence: indicador que determina si la confianza de cada crotal incluye la del OCR. Con Tesseract
+        obtenerla cambia la forma de ejecutarlo, por lo que solo se solicita si se indica o si se reintentan los
+        reconocimientos con baja confianza
+        :raises ValueError: si el número mínimo de dígitos es menor que 1, la proporción o la confianza no están entre
+        0 y 1 o el tiempo de los reintentos no es positivo
+        """
+        if min_digits < 1:
+            raise ValueError('Minimum number of digits must be at least 1')
+        if not 0 <= min_height_ratio <= 1:
+            raise ValueError('Minimum height ratio must be between 0 and 1')
+        if retry_threshold is not None and not 0 < retry_threshold <= 1:
+            raise ValueError('Retry threshold must be between 0 and 1')
+        if retry_budget_seconds <= 0:
+            raise ValueError('Retry budget must be positive')
+
+        self.min_digits = min_digits
+        self.min_height_ratio = min_height_ratio
+        self.retry_threshold = retry_threshold
+        self.retry_budget_seconds = retry_budget_seconds
+        self.ocr_confidence = ocr_confidence or retry_threshold is not None
+        self.profiler = StageProfiler(enabled=profile)
+        self.ocr = self.create_text_recognizer(self.profiler)
+        self.text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3,
+                                               roi_scale=roi_scale)
+
+        # Los reintentos usan su propio OCR, sin medir tiempos, para no mezclar sus etapas con las del reconocimiento
+        self.retry_hypotheses = []
+        self.retry_ocr = None
+        if retry_threshold is not None:
+            self.retry_hypotheses = [LargestTextLocator(roi_scale=roi_scale, **parameters)
+                                     for parameters in RETRY_HYPOTHESES]
+            self.retry_ocr = self.create_text_recognizer(StageProfiler())
+
+    def create_text_recognizer(self, profiler: StageProfiler) -> TextRecognizer:
+        """
+        Crea el reconocedor del texto localizado en cada crotal
+
+        :param profiler: medidor donde registrar el tiempo de cada etapa del reconocimiento
+        :returns: una instancia de ClassicOCR que reconoce los dígitos con Tesseract, con su confianza si se ha
+        solicitado
+        """
+        return ClassicOCR(image_width=600, image_height=300, profiler=profiler, confidence=self.ocr_confidence)
+
+    def create_tag(self, image: np.array) -> Tag:
+        """
+        Crea el descriptor del crotal, sin reconocer, para la imagen recibida
 
-        self.ocr = ClassicOCR(image_width=600, image_height=300)
-        self.text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+        :param image: imagen en color (3 canales) o en escala de grises (1 canal) del crotal
+        :returns: una instancia de la clase CowTag
+        """
+        return CowTag(image)
+
+    def get_configuration(self) -> dict:
+        """
+        Devuelve los parámetros que determinan el resultado del reconocimiento
+
+        :returns: diccionario con la configuración del detector de texto ('text_locator'), del OCR ('ocr'), de los
+        criterios para descartar imágenes ('min_digits' y 'min_height_ratio') y, si se reintentan los reconocimientos
+        con baja confianza, la confianza mínima ('retry_threshold') y los detectores de cada reintento
+        ('retry_hypotheses')
+        """
+        configuration = {'text_locator': self.text_locator.get_configuration(), 'ocr': self.ocr.get_configuration(),
+                         'min_digits': self.min_digits, 'min_height_ratio': self.min_height_ratio}
+        if self.retry_threshold is not None:
+            configuration['retry_threshold'] = self.retry_threshold
+            configuration['retry_hypotheses'] = [text_locator.get_configuration()
+                                                 for text_locator in self.retry_hypotheses]
+        return configuration
+
+    def check_located_text(self, enclosing_rectangles: np.array) -> str:
+        """
+        Comprueba si los rectángulos localizados pueden ser los dígitos de un crotal antes de reconocer su texto
+
+        :param enclosing_rectangles: array numpy Nx4 con los rectángulos (x, y, ancho, alto) localizados
+        :returns: el motivo por el que se descarta la imagen, 'no_digits' si no se ha localizado ningún rectángulo,
+        'too_few_digits' si hay menos de min_digits o 'inconsistent_digit_heights' si los altos difieren más de lo
+        permitido por min_height_ratio. None si la imagen es válida
+        """
+        if len(enclosing_rectangles) == 0:
+            return 'no_digits'
+        if len(enclosing_rectangles) < self.min_digits:
+            return 'too_few_digits'
+        heights = enclosing_rectangles[:, 3]
+        if heights.min() < heights.max() * self.min_height_ratio:
+            return 'inconsistent_digit_heights'
+        return None
+
+    @staticmethod
+    def score_detection(text: str, enclosing_rectangles: np.array, ocr_confidence: float = None) -> float:
+        """
+        Calcula la confianza de un reconocimiento como el producto de la confianza del OCR, la proporción entre el
+        alto del dígito más bajo y el del más alto y la proporción entre el número de caracteres reconocidos y el de
+        rectángulos localizados
+
+        :param text: texto reconocido
+        :param enclosing_rectangles: array numpy Nx4 con los rectángulos localizados, al menos uno
+        :param ocr_confidence: confianza del OCR entre 0 y 1, si es None no se tiene en cuenta
+        :returns: la confianza entre 0 y 1, 0 si no se ha reconocido ningún carácter
+        """
+        if not text:
+            return 0.0
+        heights = enclosing_rectangles[:, 3]
+        confidence = (heights.min() / heights.max() *
+                      min(len(text), len(enclosing_rectangles)) / max(len(text), len(enclosing_rectangles)))
+        if ocr_confidence is not None:
+            confidence *= ocr_confidence
+        return float(confidence)
+
+    @classmethod
+    def finish_detection(cls, tag: Tag, text: str, enclosing_rectangles: np.array, ocr_confidence: float) -> None:
+        """
+        Añade al crotal el texto reconocido y su confianza, marcándolo como ilegible si no se ha reconocido nada
+
+        :param tag: crotal reconocido
+        :param text: texto reconocido
+        :param enclosing_rectangles: array numpy Nx4 con los rectángulos localizados
+        :param ocr_confidence: confianza del OCR entre 0 y 1 o None
+        """
+        tag.set_detection(text=text, bounding_rectangles=enclosing_rectangles,
+                          confidence=cls.score_detection(text, enclosing_rectangles, ocr_confidence),
+                          rejection_reason=None if text else 'unreadable_digits')
+
+    def needs_retry(self, tag: Tag) -> bool:
+        """
+        Determina si reintentar el reconocimiento de un crotal. Las imágenes sin ningún dígito localizado no se
+        reintentan, para que las imágenes vacías sigan descartándose sin coste
+
+        :param tag: crotal reconocido
+        :returns: True si los reintentos están activados y la confianza del crotal es menor que retry_threshold
+        """
+        return (self.retry_threshold is not None and tag.confidence < self.retry_threshold and
+                tag.rejection_reason != 'no_digits')
+
+    def retry_detection(self, tag: Tag) -> None:
+        """
+        Reconoce de nuevo el crotal con cada hipótesis de RETRY_HYPOTHESES, una tras otra y siempre en ese orden, hasta
+        la primera cuya confianza alcanza retry_threshold. Tras cada hipótesis se comprueba si se ha agotado
+        retry_budget_seconds, en cuyo caso no se prueban las restantes y el crotal se marca con retry_truncated, ya que
+        su resultado depende del tiempo y no debe almacenarse en la caché. El crotal se actualiza con el resultado de
+        mayor confianza si mejora el original
+
+        :param tag: crotal reconocido con baja confianza, con su imagen en escala de grises
+        """
+        deadline = time.perf_counter() + self.retry_budget_seconds
+        best_detection = None
+        for index, text_locator in enumerate(self.retry_hypotheses):
+            detection = self.__recognize_hypothesis(text_locator, tag.gray_image)
+            if best_detection is None or detection[2] > best_detection[2]:
+                best_detection = detection
+            if best_detection[2] >= self.retry_threshold:
+                break
+            if time.perf_counter() >= deadline and index + 1 < len(self.retry_hypotheses):
+                tag.retry_truncated = True
+                break
+
+        if best_detection is not None and best_detection[2] > tag.confidence:
+            text, enclosing_rectangles, confidence, rejection_reason = best_detection
+            tag.set_detection(text=text, bounding_rectangles=enclosing_rectangles, confidence=confidence,
+                              rejection_reason=rejection_reason)
+
+    def __recognize_hypothesis(self, text_locator: LargestTextLocator, image: np.array) -> tuple:
+        """
+        Reconoce una imagen con el detector de texto de una hipótesis y el OCR de los reintentos
+
+        :param text_locator: detector de texto de la hipótesis
+        :param image: imagen en escala de grises del crotal
+        :returns: una tupla con el texto, los rectángulos localizados, la confianza y el motivo de descarte o None
+        """
+        enclosing_rectangles, digits_only_image = text_locator.locate_text(image)
+        rejection_reason = self.check_located_text(enclosing_rectangles)
+        if rejection_reason is not None:
+            return '', enclosing_rectangles, 0.0, rejection_reason
+
+        text, ocr_confidence = self.retry_ocr.recognize_text_with_confidence(digits_only_image, enclosing_rectangles)
+        return (text, enclosing_rectangles, self.score_detection(text, enclosing_rectangles, ocr_confidence),
+                None if text else 'unreadable_digits')
 
     def recognize_image(self, image: np.array) -> Tag:
         """
-        Reconoce los dígitos  del crotal recibido
+        Reconoce los dígitos  del crotal recibido. Si los rectángulos localizados no pueden ser los dígitos de un
+        crotal la imagen se descarta sin ejecutar el OCR, con los dígitos vacíos, confianza 0 y el motivo. Si la
+        confianza es baja y los reintentos están activados se reintenta con los parámetros alternativos
 
         :param image: una instancia de la clase Tag con la descripción  del crotal a reconocer
         :returns: una instancia de la clase Tag con los resultados del reconocimiento
         """
-        tag = CowTag(image)
+        self.profiler.start_image()
+        with self.profiler.stage('tag_init'):
+            tag = self.create_tag(image)
         image = tag.gray_image
-        enclosing_rectangles, digits_only_image = self.text_locator.locate_text(image)
-        recognized_digits = self.ocr.recognize_text(digits_only_image, enclosing_rectangles)
-        tag.set_detection(text=recognized_digits, bounding_rectangles=enclosing_rectangles)
+        with self.profiler.stage('locate_text'):
+            enclosing_rectangles, digits_only_image = self.text_locator.locate_text(image)
+        rejection_reason = self.check_located_text(enclosing_rectangles)
+        if rejection_reason is not None:
+            tag.set_detection(text='', bounding_rectangles=enclosing_rectangles, confidence=0.0,
+                              rejection_reason=rejection_reason)
+        else:
+            recognized_digits, ocr_confidence = self.ocr.recognize_text_with_confidence(digits_only_image,
+                                                                                        enclosing_rectangles)
+            self.finish_detection(tag, recognized_digits, enclosing_rectangles, ocr_confidence)
+        if self.needs_retry(tag):
+            with self.profiler.stage('retry'):
+                self.retry_detection(tag)
+        tag.timings = self.profiler.finish_image()
         return tag
+
+    def recognize_images(self, images: List[np.array]) -> List[Tag]:
+        """
+        Reconoce los dígitos de un conjunto de crotales, localizando el texto de cada uno y reconociéndolo después
+        de forma conjunta, con ClassicOCR para reducir las ejecuciones de Tesseract. Las imágenes descartadas no se
+        incluyen en el reconocimiento conjunto y los crotales con baja confianza se reintentan uno a uno
+
+        :param images: lista de imágenes de los crotales a reconocer
+        :returns: lista de instancias de la clase Tag con los resultados del reconocimiento
+        """
+        tags = []
+        located_texts = []
+        for image in images:
+            self.profiler.start_image()
+            with self.profiler.stage('tag_init'):
+                tag = self.create_tag(image)
+            with self.profiler.stage('locate_text'):
+                enclosing_rectangles, digits_only_image = self.text_locator.locate_text(tag.gray_image)
+                located_texts.append((enclosing_rectangles,) + self.__crop_located_text(digits_only_image,
+                                                                                        enclosing_rectangles))
+            tag.timings = self.profiler.finish_image()
+            tags.append(tag)
+
+        rejection_reasons = [self.check_located_text(rectangles) for rectangles, _, _ in located_texts]
+        accepted_texts = [located_text for located_text, rejection_reason in zip(located_texts, rejection_reasons)
+                          if rejection_reason is None]
+
+        start = time.perf_counter()
+        recognized_digits = iter(self.ocr.recognize_texts_with_confidence(
+            [digits_image for _, digits_image, _ in accepted_texts],
+            [digits_rectangles for _, _, digits_rectangles in accepted_texts]))
+        ocr_time = (time.perf_counter() - start) * 1000 / max(len(tags), 1)
+
+        for tag, rejection_reason, (enclosing_rectangles, _, _) in zip(tags, rejection_reasons, located_texts):
+            if rejection_reason is not None:
+                tag.set_detection(text='', bounding_rectangles=enclosing_rectangles, confidence=0.0,
+                                  rejection_reason=rejection_reason)
+            else:
+                digits, ocr_confidence = next(recognized_digits)
+                self.finish_detection(tag, digits, enclosing_rectangles, ocr_confidence)
+            if tag.timings is not None:
+                tag.timings['ocr_batch'] = round(ocr_time, 3)
+            if self.needs_retry(tag):
+                start = time.perf_counter()
+                self.retry_detection(tag)
+                if tag.timings is not None:
+                    tag.timings['retry'] = round((time.perf_counter() - start) * 1000, 3)
+
+        return tags
+
+    @staticmethod
+    def __crop_located_text(digits_only_image: np.array, enclosing_rectangles: np.array) -> tuple:
+        """
+        Copia de la imagen postprocesada solo la zona que contiene los caracteres, de forma que al reconocer un
+        conjunto de imágenes no se mantengan en memoria las imágenes completas, que además pueden ser un buffer que el
+        detector de texto reutiliza en la siguiente imagen
+
+        :param digits_only_image: imagen postprocesada por el detector de texto
+        :param enclosing_rectangles: rectángulos que delimitan los caracteres en la imagen postprocesada
+        :returns: una tupla con la zona copiada y los rectángulos en coordenadas de esa zona
+        """
+        if len(enclosing_rectangles) == 0:
+            return digits_only_image[:0, :0].copy(), enclosing_rectangles
+        left, top = np.min(enclosing_rectangles[:, :2], axis=0)
+        right = np.max(enclosing_rectangles[:, 0] + enclosing_rectangles[:, 2])
+        bottom = np.max(enclosing_rectangles[:, 1] + enclosing_rectangles[:, 3])
+        return (digits_only_image[top:bottom, left:right].copy(),
+                enclosing_rectangles - np.array([left, top, 0, 0], enclosing_rectangles.dtype))
+
+
+class CowTagDigitClassifierRecognizer(CowTagRecognizer):
+    """Reconocedor de los dígitos de los crotales de vacas que clasifica cada dígito localizado sin usar Tesseract"""
+
+    def create_text_recognizer(self, profiler: StageProfiler) -> TextRecognizer:
+        """
+        Crea el reconocedor del texto localizado en cada crotal
+
+        :param profiler: medidor donde registrar el tiempo de cada etapa del reconocimiento
+        :returns: una instancia de DigitClassifierOCR con el modelo por defecto
+        """
+        return DigitClassifierOCR(profiler=profiler)
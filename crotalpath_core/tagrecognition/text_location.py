@@ -2,6 +2,10 @@
 import cv2
 import numpy as np
 
+from crotalpath_core.tagrecognition.buffers import ScratchBuffers
+
+CLAHE_TILE_GRID_SIZE = (19, 19)
+
 
 class TextLocator:
     """Interfaz común a seguir por los detectores de texto"""
@@ -11,66 +15,202 @@ class TextLocator:
 
         raise NotImplementedError()
 
+    def get_configuration(self) -> dict:
+        """Devuelve los parámetros que determinan el resultado de la detección"""
+
+        raise NotImplementedError()
+
 
 class LargestTextLocator(TextLocator):
     """Detector de texto especializado en la detección de los caracteres de mayor tamaño de una imagen"""
 
-    def __init__(self, thresholding_threshold, noise_size, digit_difference_threshold):
+    def __init__(self, thresholding_threshold, noise_size, digit_difference_threshold, roi_scale=None):
         """
         Crea un reconocedor de los caracteres de mayor tamaño de una imagen
 
         :param thresholding_threshold: valor de intensidad límite para la umbralización
         :param noise_size: tamaño del ruido esperando en la imagen
         :param digit_difference_threshold: ratio de diferencia entre los digitos a localizar
+        :param roi_scale: escala, entre 0 y 1, de la imagen reducida donde localizar primero la región de los
+        caracteres, que después se procesa a resolución completa. Si no se indica se procesa la imagen completa
+        :raises ValueError: si la escala no está entre 0 y 1
         """
+        if roi_scale is not None and not 0 < roi_scale < 1:
+            raise ValueError('ROI scale must be between 0 and 1')
+
         self.thresholding_threshold = thresholding_threshold
         self.noise_size = noise_size
         self.digit_difference_threshold = digit_difference_threshold
+        self.roi_scale = roi_scale
         self.structuring_element = np.ones((self.noise_size, self.noise_size), np.uint8)
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=CLAHE_TILE_GRID_SIZE)
+        self.scratch_buffers = ScratchBuffers()
+        self.roi_canvas_region = None
+        if roi_scale is not None:
+            # Con un elemento de 1x1 o 2x2 las operaciones morfológicas apenas eliminan ruido en la imagen reducida
+            roi_noise_size = max(min(self.noise_size, 3), int(round(self.noise_size * roi_scale)))
+            self.roi_structuring_element = np.ones((roi_noise_size, roi_noise_size), np.uint8)
+
+    def get_configuration(self) -> dict:
+        """
+        Devuelve los parámetros que determinan el resultado de la detección
+
+        :returns: diccionario con el nombre del detector y sus parámetros
+        """
+        configuration = {'locator': type(self).__name__,
+                         'thresholding_threshold': self.thresholding_threshold,
+                         'noise_size': self.noise_size,
+                         'digit_difference_threshold': self.digit_difference_threshold}
+        if self.roi_scale is not None:
+            configuration['roi_scale'] = self.roi_scale
+        return configuration
+
+    def __getstate__(self) -> dict:
+        """Excluye el objeto CLAHE de OpenCV al serializar, no se puede serializar y se vuelve a crear"""
+
+        state = self.__dict__.copy()
+        del state['clahe']
+        state['roi_canvas_region'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Restaura el detector creando de nuevo el objeto CLAHE"""
+
+        self.__dict__.update(state)
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=CLAHE_TILE_GRID_SIZE)
 
     def locate_text(self, image: np.array) -> tuple:
         """
-        Detecta el texto de una imagen y devuelve su localización
+        Detecta el texto de una imagen y devuelve su localización. Con una escala de región de interés, la imagen
+        completa solo se procesa si en la imagen reducida no se localiza ningún carácter
 
         :param image: imagen donde realizar la detección
         :returns: una tupla formada por los rectángulos que delimitan los caracteres y la imagen postprocesada donde se
-        ha realizado esta localización
+        ha realizado esta localización. Con una escala de región de interés la imagen postprocesada puede ser un
+        buffer reutilizado, válido hasta procesar la siguiente imagen
+        """
+        if self.roi_scale is not None:
+            region = self.__locate_region(image)
+            if region is not None:
+                return self.__locate_text_in_region(image, region)
+
+        return self.__locate_text(image, self.structuring_element, CLAHE_TILE_GRID_SIZE)
+
+    def __locate_text(self, image: np.array, structuring_element: np.array, clahe_tile_grid_size: tuple) -> tuple:
+        """
+        Detecta el texto de una imagen procesándola completa
+
+        :param image: imagen en escala de grises (1 solo canal)
+        :param structuring_element: elemento estructurante de las operaciones morfológicas
+        :param clahe_tile_grid_size: número de regiones, horizontal y vertical, de la ecualización del histograma
+        :returns: una tupla formada por los rectángulos que delimitan los caracteres y la imagen postprocesada
         """
-        tag_foreground_mask = self.__get_tag_mask(image)
-        digits_only_image = self.__remove_background(image=image, tag_mask=tag_foreground_mask)
+        background_mask = self.__get_background_mask(image, structuring_element)
+        digits_only_image = self.__remove_background(image=image, background_mask=background_mask,
+                                                     structuring_element=structuring_element,
+                                                     clahe_tile_grid_size=clahe_tile_grid_size)
         enclosing_rectangles = self.__locate_largest_text(digits_only_image)
 
         return enclosing_rectangles, digits_only_image
 
-    def __get_tag_mask(self, image: np.array) -> np.array:
+    def __locate_region(self, image: np.array) -> tuple:
+        """
+        Localiza los caracteres en la imagen reducida y calcula, a resolución completa, la región que los contiene con
+        un margen de la altura de un carácter por cada lado
+
+        :param image: imagen en escala de grises (1 solo canal)
+        :returns: una tupla (izquierda, arriba, derecha, abajo) con los límites de la región o None si no se ha
+        localizado ningún carácter
+        """
+        reduced_image = cv2.resize(image, None, fx=self.roi_scale, fy=self.roi_scale, interpolation=cv2.INTER_AREA)
+        reduced_rectangles, _ = self.__locate_text(reduced_image, self.roi_structuring_element, CLAHE_TILE_GRID_SIZE)
+        if len(reduced_rectangles) == 0:
+            return None
+
+        margin = np.max(reduced_rectangles[:, 3])
+        left = np.min(reduced_rectangles[:, 0]) - margin
+        top = np.min(reduced_rectangles[:, 1]) - margin
+        right = np.max(reduced_rectangles[:, 0] + reduced_rectangles[:, 2]) + margin
+        bottom = np.max(reduced_rectangles[:, 1] + reduced_rectangles[:, 3]) + margin
+
+        image_height, image_width = image.shape[:2]
+        return (max(0, int(left / self.roi_scale)), max(0, int(top / self.roi_scale)),
+                min(image_width, int(np.ceil(right / self.roi_scale))),
+                min(image_height, int(np.ceil(bottom / self.roi_scale))))
+
+    def __locate_text_in_region(self, image: np.array, region: tuple) -> tuple:
         """
-        Umbraliza la imagen y aplica operaciones morfológicas de cierre y apertura para eliminar imperfecciones
+        Detecta el texto procesando a resolución completa solo la región indicada. La ecualización del histograma usa
+        regiones del mismo tamaño que en la imagen completa. La imagen postprocesada se escribe en un buffer del tamaño
+        de la imagen completa reutilizado entre imágenes, donde solo se vuelve a poner en blanco la región de la
+        imagen anterior
 
         :param image: imagen en escala de grises (1 solo canal)
-        :returns: una máscara con la zona del crotal a True y el fondo a False
+        :param region: tupla (izquierda, arriba, derecha, abajo) con los límites de la región
+        :returns: una tupla formada por los rectángulos, en coordenadas de la imagen completa, que delimitan los
+        caracteres y la imagen postprocesada, del tamaño de la completa, en blanco fuera de la región y válida hasta
+        procesar la siguiente imagen
         """
-        _, binary_image = cv2.threshold(image, self.thresholding_threshold, 1, cv2.THRESH_BINARY)
+        left, top, right, bottom = region
+        image_height, image_width = image.shape[:2]
+        clahe_tile_grid_size = (max(1, int(round(CLAHE_TILE_GRID_SIZE[0] * (right - left) / image_width))),
+                                max(1, int(round(CLAHE_TILE_GRID_SIZE[1] * (bottom - top) / image_height))))
 
-        binary_image = cv2.morphologyEx(binary_image, cv2.MORPH_CLOSE, self.structuring_element)
-        binary_image = cv2.morphologyEx(binary_image, cv2.MORPH_OPEN, self.structuring_element)
+        region_rectangles, region_digits_only_image = self.__locate_text(image[top:bottom, left:right],
+                                                                         self.structuring_element,
+                                                                         clahe_tile_grid_size)
 
-        return binary_image.astype(np.bool)
+        digits_only_image = self.scratch_buffers.get('roi_canvas', image.shape[:2])
+        if self.roi_canvas_region is None or self.roi_canvas_region[0] != image.shape[:2]:
+            digits_only_image.fill(255)
+        else:
+            previous_left, previous_top, previous_right, previous_bottom = self.roi_canvas_region[1]
+            digits_only_image[previous_top:previous_bottom, previous_left:previous_right] = 255
+        digits_only_image[top:bottom, left:right] = region_digits_only_image
+        self.roi_canvas_region = (image.shape[:2], region)
+        enclosing_rectangles = region_rectangles + np.array([left, top, 0, 0])
+
+        return enclosing_rectangles, digits_only_image
 
-    def __remove_background(self, image: np.array, tag_mask: np.array) -> np.array:
+    def __get_background_mask(self, image: np.array, structuring_element: np.array) -> np.array:
+        """
+        Umbraliza la imagen y aplica operaciones morfológicas de cierre y apertura para eliminar imperfecciones. Todas
+        las operaciones se realizan sobre un mismo buffer reutilizado entre imágenes
+
+        :param image: imagen en escala de grises (1 solo canal)
+        :param structuring_element: elemento estructurante de las operaciones morfológicas
+        :returns: una máscara con la zona del crotal a 0 y el fondo a 255, válida hasta procesar la siguiente imagen
+        """
+        binary_image = self.scratch_buffers.get('background_mask', image.shape[:2])
+        cv2.threshold(image, self.thresholding_threshold, 1, cv2.THRESH_BINARY, dst=binary_image)
+
+        cv2.morphologyEx(binary_image, cv2.MORPH_CLOSE, structuring_element, dst=binary_image)
+        cv2.morphologyEx(binary_image, cv2.MORPH_OPEN, structuring_element, dst=binary_image)
+        cv2.threshold(binary_image, 0, 255, cv2.THRESH_BINARY_INV, dst=binary_image)
+
+        return binary_image
+
+    def __remove_background(self, image: np.array, background_mask: np.array, structuring_element: np.array,
+                            clahe_tile_grid_size: tuple) -> np.array:
         """
         Elimina todos los elementos de la imagen a excepción de los caracteres que sean de mayor tamaño al elemento
-        estructurante
+        estructurante. La imagen recibida no se modifica, el resto de operaciones se realizan sobre la imagen
+        ecualizada
 
         :param image: imagen en escala de grises (1 solo canal)
-        :param tag_mask: una máscara con la zona del crotal a True y el fondo a False
+        :param background_mask: una máscara con la zona del crotal a 0 y el fondo a 255
+        :param structuring_element: elemento estructurante de las operaciones morfológicas
+        :param clahe_tile_grid_size: número de regiones, horizontal y vertical, de la ecualización del histograma
         :returns: una imagen en blanco (255) y negro (0) con los caracteres presentes en la imagen original
         """
-        image = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(19, 19)).apply(image)
+        self.clahe.setTilesGridSize(clahe_tile_grid_size)
+        binary_image = self.clahe.apply(image)
 
-        _, binary_image = cv2.threshold(image, self.thresholding_threshold, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        cv2.threshold(binary_image, self.thresholding_threshold, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                      dst=binary_image)
 
-        binary_image[~tag_mask] = 255
-        binary_image = cv2.morphologyEx(binary_image, cv2.MORPH_CLOSE, self.structuring_element)
+        cv2.bitwise_or(binary_image, background_mask, dst=binary_image)
+        cv2.morphologyEx(binary_image, cv2.MORPH_CLOSE, structuring_element, dst=binary_image)
 
         return binary_image
 
@@ -78,15 +218,31 @@ class LargestTextLocator(TextLocator):
         """
         Localiza los caracteres de mayor tamaño presentes en una imagen
 
+        El área de cada objeto es el número de píxeles de primer plano dentro de su rectángulo, calculada para todos
+        los objetos a la vez a partir de la imagen integral. El contorno de los objetos y la imagen integral se
+        obtienen de una misma imagen con el primer plano a 1, ambas en buffers reutilizados entre imágenes
+
         :param image: imagen en blanco y negro siendo los caracteres los elementos de mayor tamaño
         tamaño respecto al de menor tamaño, en un rango de 0 a 1
         :returns: un numpy arrau con los rectángulos que engloban a los caracteres candidatos
         """
-        image_objects_contour, _ = cv2.findContours(~image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        binary_image = ~image / 255
+        image_height, image_width = image.shape[:2]
+        foreground_image = self.scratch_buffers.get('foreground', (image_height, image_width))
+        cv2.threshold(image, 0, 1, cv2.THRESH_BINARY_INV, dst=foreground_image)
+        image_objects_contour, _ = cv2.findContours(foreground_image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        if len(image_objects_contour) == 0:
+            return np.empty((0, 4), np.int32)
+        foreground_integral = self.scratch_buffers.get('foreground_integral', (image_height + 1, image_width + 1),
+                                                       np.int32)
+        cv2.integral(foreground_image, sum=foreground_integral)
 
-        object_enclosing_rect = [cv2.boundingRect(contour) for contour in image_objects_contour]
-        object_areas = [np.sum(binary_image[y:y + h, x:x + w]) for x, y, w, h in object_enclosing_rect]
+        object_enclosing_rect = np.array([cv2.boundingRect(contour) for contour in image_objects_contour])
+        rect_left = object_enclosing_rect[:, 0]
+        rect_top = object_enclosing_rect[:, 1]
+        rect_right = rect_left + object_enclosing_rect[:, 2]
+        rect_bottom = rect_top + object_enclosing_rect[:, 3]
+        object_areas = (foreground_integral[rect_bottom, rect_right] - foreground_integral[rect_top, rect_right] -
+                        foreground_integral[rect_bottom, rect_left] + foreground_integral[rect_top, rect_left])
 
         max_object_area = np.max(object_areas)
         max_object_area_index = np.argmax(object_areas)
@@ -96,9 +252,8 @@ class LargestTextLocator(TextLocator):
         normalized_object_areas = (object_areas - np.min(object_areas)) / (max_object_area - np.min(object_areas))
         digit_candidate_index = normalized_object_areas > self.digit_difference_threshold
 
-        digit_enclosing_rects = []
-        for digit_enclosing_rect in np.array(object_enclosing_rect)[digit_candidate_index]:
-            if abs(digit_enclosing_rect[1] - biggest_object_enclosing_rect[1]) < biggest_object_enclosing_rect[3] / 3:
-                digit_enclosing_rects.append(digit_enclosing_rect)
+        digit_enclosing_rects = object_enclosing_rect[digit_candidate_index]
+        digit_row_index = np.abs(digit_enclosing_rects[:, 1] - biggest_object_enclosing_rect[1]) < \
+            biggest_object_enclosing_rect[3] / 3
 
-        return np.array(digit_enclosing_rects)
+        return digit_enclosing_rects[digit_row_index]
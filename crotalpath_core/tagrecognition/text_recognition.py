@@ -1,8 +1,24 @@
 """Conjunto reconocedores de textos de crotales que siguen la interfaz definida por TextRecognizer"""
+import re
+import shlex
+from typing import List, Tuple
+
 import cv2
 import pytesseract
 import numpy as np
 
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+from crotalpath_core.tagrecognition.buffers import ScratchBuffers
+from crotalpath_core.tagrecognition.digit_classifier import DEFAULT_MODEL_PATH, KNearestDigitClassifier, \
+    classify_digits
+from crotalpath_core.tagrecognition.profiling import StageProfiler
+
+OCR_ENGINES = ('auto', 'tesserocr', 'pytesseract')
+
 
 class TextRecognizer:
     """Interfaz común a seguir por los reconocedores de textos"""
@@ -10,6 +26,41 @@ class TextRecognizer:
     def recognize_text(self, image: np.array, enclosing_rectangles: np.array) -> str:
         """Reconoce el texto presente en la imagen recibida dentro de cada rectángulo delimitador"""
 
+        return self.recognize_text_with_confidence(image, enclosing_rectangles)[0]
+
+    def recognize_text_with_confidence(self, image: np.array, enclosing_rectangles: np.array) -> Tuple[str, float]:
+        """
+        Reconoce el texto presente en la imagen recibida dentro de cada rectángulo delimitador junto con la confianza
+        del reconocimiento, entre 0 y 1, o None si el reconocedor no la proporciona
+        """
+        raise NotImplementedError()
+
+    def recognize_texts(self, images: List[np.array], enclosing_rectangles: List[np.array]) -> List[str]:
+        """
+        Reconoce el texto de un conjunto de imágenes
+
+        :param images: lista de imágenes donde realizar el reconocimiento
+        :param enclosing_rectangles: lista con los rectángulos que delimitan los caracteres de cada imagen
+        :returns: lista con el texto reconocido en cada imagen
+        """
+        return [text for text, _ in self.recognize_texts_with_confidence(images, enclosing_rectangles)]
+
+    def recognize_texts_with_confidence(self, images: List[np.array],
+                                        enclosing_rectangles: List[np.array]) -> List[Tuple[str, float]]:
+        """
+        Reconoce el texto de un conjunto de imágenes junto con la confianza de cada reconocimiento, por defecto
+        reconociendo cada imagen por separado
+
+        :param images: lista de imágenes donde realizar el reconocimiento
+        :param enclosing_rectangles: lista con los rectángulos que delimitan los caracteres de cada imagen
+        :returns: lista de tuplas con el texto reconocido en cada imagen y su confianza
+        """
+        return [self.recognize_text_with_confidence(image, rectangles)
+                for image, rectangles in zip(images, enclosing_rectangles)]
+
+    def get_configuration(self) -> dict:
+        """Devuelve los parámetros que determinan el resultado del reconocimiento"""
+
         raise NotImplementedError()
 
 
@@ -17,7 +68,8 @@ class ClassicOCR(TextRecognizer):
     """Algoritmo OCR clásico usado para reconocimiento de caracteres"""
 
     def __init__(self, image_width: int, image_height: int,
-                 config: str = '--psm 8 --oem 0 -c tessedit_char_whitelist=0123456789', padding: int = 50):
+                 config: str = '--psm 8 --oem 0 -c tessedit_char_whitelist=0123456789', padding: int = 50,
+                 engine: str = 'auto', profiler: StageProfiler = None, batch_size: int = 32, confidence: bool = False):
         """
         Genera una instancia del algoritmo OCR (Tesseract) inicializado con la configuración recibida, por defecto
         la configuración acepta bloques de una sola palabra siendo esta solo dígitos
@@ -26,25 +78,227 @@ class ClassicOCR(TextRecognizer):
         :param config: alto de la imagen donde realizar la proyección
         :param config: cadena de caracteres de configuración para Tesseract
         :param padding: espacio entre caracteres y caracteres y borde de la imagen donde realizar el reconocimiento
+        :param engine: motor de Tesseract a usar: 'tesserocr' mantiene una instancia de Tesseract cargada en memoria,
+        'pytesseract' lanza un proceso por reconocimiento y 'auto' usa 'tesserocr' si está disponible
+        :param profiler: medidor donde registrar el tiempo de cada etapa del reconocimiento
+        :param batch_size: número máximo de imágenes reconocidas en una misma ejecución de Tesseract al reconocer un
+        conjunto de imágenes con 'pytesseract'
+        :param confidence: indicador que determina si obtener la confianza del reconocimiento de una imagen con
+        'pytesseract', en cuyo caso el texto y la confianza se obtienen de una única ejecución de image_to_data en lugar
+        de image_to_string. Con 'tesserocr' y al reconocer un conjunto de imágenes la confianza se obtiene siempre
+        :raises ValueError: si el motor indicado no existe
+        :raises ImportError: si se solicita 'tesserocr' y no está instalado
         """
+        if engine not in OCR_ENGINES:
+            raise ValueError('OCR engine not available, try one of: {}'.format(list(OCR_ENGINES)))
+        if engine == 'tesserocr' and tesserocr is None:
+            raise ImportError('OCR engine tesserocr is not installed')
+        if engine == 'auto':
+            engine = 'pytesseract' if tesserocr is None else 'tesserocr'
+
         self.padding = padding
         self.config = config
         self.image_width = image_width
         self.image_height = image_height
+        self.engine = engine
+        self.tesseract_api = None
+        self.profiler = StageProfiler() if profiler is None else profiler
+        self.batch_size = batch_size
+        self.confidence = confidence
+        self.scratch_buffers = ScratchBuffers()
+        self.close_structuring_element = np.ones((5, 5), np.uint8)
+        self.open_structuring_element = np.ones((9, 9), np.uint8)
+        if re.search(r'--psm\s+\d+', config):
+            self.batch_config = re.sub(r'--psm\s+\d+', '--psm 6', config)
+        else:
+            self.batch_config = '--psm 6 ' + config
+
+    def get_configuration(self) -> dict:
+        """
+        Devuelve los parámetros que determinan el resultado del reconocimiento
 
-    def recognize_text(self, image: np.array, enclosing_rectangles: np.array) -> str:
+        :returns: diccionario con el nombre del reconocedor y sus parámetros
+        """
+        return {'recognizer': type(self).__name__,
+                'image_width': self.image_width,
+                'image_height': self.image_height,
+                'config': self.config,
+                'padding': self.padding,
+                'engine': self.engine,
+                'confidence': self.confidence}
+
+    def __getstate__(self) -> dict:
+        """Excluye la instancia de Tesseract al serializar, cada proceso debe crear la suya"""
+
+        state = self.__dict__.copy()
+        state['tesseract_api'] = None
+        return state
+
+    def recognize_text_with_confidence(self, image: np.array, enclosing_rectangles: np.array) -> Tuple[str, float]:
         """
-        Reconoce el texto presente en la imagen recibida dentro de cada rectángulo delimitador
+        Reconoce el texto presente en la imagen recibida dentro de cada rectángulo delimitador. Sin rectángulos no se
+        ejecuta Tesseract
 
         :param image: imagen donde realizar el reconocimiento
         :param enclosing_rectangles: conjunto de rectangulos que delimitan los caracteres
-        :return: una cadena de caracteres con el resultado del reconocimiento, sin espacios
+        :return: una tupla con el resultado del reconocimiento, sin espacios, y la confianza media de Tesseract en sus
+        palabras, entre 0 y 1, o None si no se ha solicitado con 'pytesseract'
+        """
+        if enclosing_rectangles is not None and len(enclosing_rectangles) == 0:
+            return '', 0.0
+
+        with self.profiler.stage('align_characters'):
+            projected_char_image = self.__align_characters(image, enclosing_rectangles)
+        with self.profiler.stage('separate_characters'):
+            spaced_digits_image = self.__separate_characters(projected_char_image)
+        with self.profiler.stage('tesseract'):
+            recognized_text, confidence = self.__run_tesseract(spaced_digits_image)
+
+        return recognized_text.replace(" ", ""), confidence
+
+    def recognize_texts_with_confidence(self, images: List[np.array],
+                                        enclosing_rectangles: List[np.array]) -> List[Tuple[str, float]]:
+        """
+        Reconoce el texto de un conjunto de imágenes. Con 'pytesseract' las imágenes con los caracteres espaciados se
+        apilan en una sola imagen, de hasta batch_size filas, que se reconoce con una única ejecución de Tesseract. Al
+        reconocer la imagen apilada como un bloque de texto, si en una fila no se leen tantos dígitos como rectángulos
+        tiene su imagen, esa imagen se vuelve a reconocer por separado con la configuración original. Las imágenes sin
+        rectángulos no se reconocen
+
+        :param images: lista de imágenes donde realizar el reconocimiento
+        :param enclosing_rectangles: lista con los rectángulos que delimitan los caracteres de cada imagen
+        :returns: lista de tuplas con el texto reconocido en cada imagen, sin espacios, y su confianza entre 0 y 1
+        """
+        if self.engine != 'pytesseract' or len(images) <= 1:
+            return super().recognize_texts_with_confidence(images, enclosing_rectangles)
+
+        recognized_texts = [('', 0.0)] * len(images)
+        pending_indexes = [index for index, rectangles in enumerate(enclosing_rectangles)
+                           if rectangles is None or len(rectangles) > 0]
+        # Cada imagen se copia porque la siguiente reutiliza el mismo buffer
+        spaced_digits_images = [self.__separate_characters(
+            self.__align_characters(images[index], enclosing_rectangles[index])).copy() for index in pending_indexes]
+
+        for start in range(0, len(spaced_digits_images), self.batch_size):
+            batch_texts = self.__run_tesseract_batch(spaced_digits_images[start:start + self.batch_size])
+            for index, recognized_text in zip(pending_indexes[start:start + self.batch_size], batch_texts):
+                recognized_texts[index] = recognized_text
+
+        for position, index in enumerate(pending_indexes):
+            if enclosing_rectangles[index] is not None and \
+                    len(recognized_texts[index][0]) != len(enclosing_rectangles[index]):
+                recognized_text, confidence = self.__run_tesseract(spaced_digits_images[position])
+                recognized_texts[index] = recognized_text.replace(" ", ""), confidence
+
+        return recognized_texts
+
+    def __run_tesseract_batch(self, images: List[np.array]) -> List[Tuple[str, float]]:
         """
+        Apila las imágenes recibidas en una sola imagen, la reconoce con una ejecución de Tesseract y asigna cada
+        palabra reconocida a la imagen de la fila que contiene su centro
 
-        projected_char_image = self.__align_characters(image, enclosing_rectangles)
-        spaced_digits_image = self.__separate_characters(projected_char_image)
+        :param images: lista de imágenes en escala de grises (1 solo canal) con el texto a reconocer
+        :returns: lista de tuplas con el texto reconocido en cada imagen, sin espacios, y la confianza media de sus
+        palabras entre 0 y 1
+        """
+        row_tops = np.cumsum([0] + [image.shape[0] for image in images])
+        stacked_image = np.full((row_tops[-1], max(image.shape[1] for image in images)), 255, np.uint8)
+        for image, row_top in zip(images, row_tops):
+            stacked_image[row_top:row_top + image.shape[0], :image.shape[1]] = image
+
+        recognized_words = [[] for _ in images]
+        for left, top, height, confidence, word in self.__parse_tesseract_data(
+                pytesseract.image_to_data(stacked_image, config=self.batch_config)):
+            row = int(np.searchsorted(row_tops, top + height / 2, side='right')) - 1
+            recognized_words[min(max(row, 0), len(images) - 1)].append((left, word, confidence))
 
-        return pytesseract.image_to_string(spaced_digits_image, config=self.config).replace(" ", "")
+        return [self.__join_words(words) for words in recognized_words]
+
+    @staticmethod
+    def __parse_tesseract_data(tesseract_data: str) -> List[tuple]:
+        """
+        Obtiene las palabras de la salida en formato TSV de Tesseract
+
+        :param tesseract_data: salida de pytesseract.image_to_data
+        :returns: lista de tuplas con la posición izquierda, la superior, el alto, la confianza entre 0 y 100 y el
+        texto de cada palabra no vacía
+        """
+        words = []
+        for line in tesseract_data.splitlines()[1:]:
+            fields = line.split('\t')
+            if len(fields) < 12 or not fields[11].strip():
+                continue
+            words.append((int(fields[6]), int(fields[7]), int(fields[9]), float(fields[10]), fields[11].strip()))
+        return words
+
+    @staticmethod
+    def __join_words(words: List[tuple]) -> Tuple[str, float]:
+        """
+        Une las palabras reconocidas en una imagen de izquierda a derecha
+
+        :param words: lista de tuplas con la posición izquierda, el texto y la confianza entre 0 y 100 de cada palabra
+        :returns: una tupla con el texto sin espacios y la confianza media de las palabras entre 0 y 1, 0 si no hay
+        ninguna
+        """
+        if not words:
+            return '', 0.0
+        words = sorted(words)
+        confidence = float(np.mean([max(word_confidence, 0) for _, _, word_confidence in words])) / 100
+        return ''.join(word for _, word, _ in words).replace(" ", ""), confidence
+
+    def __run_tesseract(self, image: np.array) -> Tuple[str, float]:
+        """
+        Ejecuta Tesseract sobre la imagen recibida con el motor configurado. Con 'pytesseract' se lanza un único
+        proceso: image_to_string si no se ha solicitado la confianza o image_to_data, uniendo sus palabras, si se ha
+        solicitado
+
+        :param image: imagen en escala de grises (1 solo canal) con el texto a reconocer
+        :returns: una tupla con el texto reconocido por Tesseract y su confianza media entre 0 y 1, o None si no se ha
+        solicitado con 'pytesseract'
+        """
+        if self.engine == 'pytesseract':
+            if not self.confidence:
+                return pytesseract.image_to_string(image, config=self.config).strip(), None
+            words = self.__parse_tesseract_data(pytesseract.image_to_data(image, config=self.config))
+            return self.__join_words([(left, word, confidence) for left, _, _, confidence, word in words])
+
+        if self.tesseract_api is None:
+            page_seg_mode, engine_mode, variables = self.__parse_config(self.config)
+            self.tesseract_api = tesserocr.PyTessBaseAPI(psm=page_seg_mode, oem=engine_mode)
+            for name, value in variables.items():
+                self.tesseract_api.SetVariable(name, value)
+
+        image = np.ascontiguousarray(image)
+        height, width = image.shape
+        self.tesseract_api.SetImageBytes(image.tobytes(), width, height, 1, width)
+
+        recognized_text = self.tesseract_api.GetUTF8Text().strip()
+        return recognized_text, max(self.tesseract_api.MeanTextConf(), 0) / 100 if recognized_text else 0.0
+
+    @staticmethod
+    def __parse_config(config: str) -> tuple:
+        """
+        Traduce la cadena de configuración de la línea de comandos de Tesseract a los parámetros de tesserocr
+
+        :param config: cadena de caracteres de configuración para Tesseract
+        :returns: una tupla con el modo de segmentación, el modo del motor y un diccionario con las variables
+        """
+        page_seg_mode = tesserocr.PSM.SINGLE_BLOCK
+        engine_mode = tesserocr.OEM.DEFAULT
+        variables = {}
+
+        arguments = shlex.split(config)
+        for index, argument in enumerate(arguments[:-1]):
+            value = arguments[index + 1]
+            if argument == '--psm':
+                page_seg_mode = int(value)
+            elif argument == '--oem':
+                engine_mode = int(value)
+            elif argument == '-c':
+                name, _, variable_value = value.partition('=')
+                variables[name] = variable_value
+
+        return page_seg_mode, engine_mode, variables
 
     def __align_characters(self, image: np.array, char_enclosing_rects: np.array) -> np.array:
         """
@@ -53,7 +307,8 @@ class ClassicOCR(TextRecognizer):
         :param image: imagen en escala de grises (1 solo canal)
         :param char_enclosing_rects: array numpy 4xN con las 4 componentes (x, y, ancho, alto) de los rectángulos
         que delimitan cada digito de la imagen de entrada
-        :returns: imagen proyectada para ajustarse a los caracteres de la imagen original
+        :returns: imagen proyectada para ajustarse a los caracteres de la imagen original, válida hasta procesar la
+        siguiente imagen
         """
         min_char_pos_x = np.min(char_enclosing_rects[:, 0])
         max_char_pos_x_arg = np.argmax(char_enclosing_rects[:, 0])
@@ -92,39 +347,45 @@ class ClassicOCR(TextRecognizer):
                                                     [self.image_width, self.image_height], [0, self.image_height]])
 
         projection_matrix = cv2.getPerspectiveTransform(source_projection_points, destination_projection_points)
-        projected_image = cv2.warpPerspective(cropped_image, projection_matrix, (self.image_width, self.image_height))
+        projected_image = self.scratch_buffers.get('projected', (self.image_height, self.image_width))
+        cv2.warpPerspective(cropped_image, projection_matrix, (self.image_width, self.image_height),
+                            dst=projected_image)
 
         return projected_image
 
     def __separate_characters(self, image: np.array):
         """
-        Separa los caracteres presentes en una imagen
+        Separa los caracteres presentes en una imagen. Las imágenes intermedias y el resultado se escriben en buffers
+        reutilizados entre imágenes
 
         :param image: imagen en blanco y negro (1 canal) donde los caracteres sean de color negro y el fondo blanco
-        :returns: imagen con los caracteres espaciados
+        :returns: imagen con los caracteres espaciados, válida hasta procesar la siguiente imagen
         """
-        structuring_element = np.ones((5, 5), np.uint8)
-        deionised_images = cv2.morphologyEx(image, cv2.MORPH_CLOSE, structuring_element)
+        image_height, image_width = image.shape[:2]
+        deionised_image = self.scratch_buffers.get('deionised', (image_height, image_width))
+        cv2.morphologyEx(image, cv2.MORPH_CLOSE, self.close_structuring_element, dst=deionised_image)
 
-        structuring_element = np.ones((9, 9), np.uint8)
-        image = cv2.morphologyEx(deionised_images, cv2.MORPH_OPEN, structuring_element)
+        opened_image = self.scratch_buffers.get('opened', (image_height, image_width))
+        cv2.morphologyEx(deionised_image, cv2.MORPH_OPEN, self.open_structuring_element, dst=opened_image)
 
-        padded_image = cv2.copyMakeBorder(image, self.padding, self.padding, self.padding, self.padding,
-                                          cv2.BORDER_CONSTANT,
-                                          None, 255)
+        padded_image = self.scratch_buffers.get('padded', (image_height + self.padding * 2,
+                                                           image_width + self.padding * 2))
+        cv2.copyMakeBorder(opened_image, self.padding, self.padding, self.padding, self.padding,
+                           cv2.BORDER_CONSTANT, dst=padded_image, value=255)
 
-        digits_contours, _ = cv2.findContours(~padded_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        inverted_image = self.scratch_buffers.get('inverted', padded_image.shape)
+        cv2.bitwise_not(padded_image, dst=inverted_image)
+        digits_contours, _ = cv2.findContours(inverted_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
         cv2.drawContours(padded_image, digits_contours, -1, 0, 3)
 
         digit_enclosing_rects = np.array([cv2.boundingRect(cnt) for cnt in digits_contours])
         sort = np.argsort(digit_enclosing_rects[:, 0])
         digit_enclosing_rects = digit_enclosing_rects[sort]
-        result_image = np.ones(
-            (
-                np.max(digit_enclosing_rects[:, 3]) + (self.padding * 2),
-                np.sum(digit_enclosing_rects[:, 2]) + ((len(digit_enclosing_rects) + 1) * self.padding)
-            ), np.uint8) * 255
+        result_image = self.scratch_buffers.get('result', (
+            np.max(digit_enclosing_rects[:, 3]) + (self.padding * 2),
+            np.sum(digit_enclosing_rects[:, 2]) + ((len(digit_enclosing_rects) + 1) * self.padding)))
+        result_image.fill(255)
 
         last_x = 0
         for (x_pos, y_pos, width, height) in digit_enclosing_rects:
@@ -133,3 +394,55 @@ class ClassicOCR(TextRecognizer):
             last_x = last_x + self.padding + width
 
         return result_image
+
+
+class DigitClassifierOCR(TextRecognizer):
+    """
+    Reconocedor que clasifica cada dígito localizado por separado con un clasificador k-NN sobre descriptores HOG, sin
+    ejecutar Tesseract. El modelo se entrena con validation/train_digit_classifier.py
+    """
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, k: int = None, profiler: StageProfiler = None):
+        """
+        Carga el clasificador de dígitos
+
+        :param model_path: ruta del fichero del modelo
+        :param k: número de vecinos que votan cada dígito, si no se indica se usa el guardado en el modelo
+        :param profiler: medidor donde registrar el tiempo de cada etapa del reconocimiento
+        :raises FileNotFoundError: si el modelo no existe
+        """
+        self.classifier = KNearestDigitClassifier.load(model_path, k)
+        self.model_fingerprint = self.classifier.get_fingerprint()
+        self.profiler = StageProfiler() if profiler is None else profiler
+
+    def get_configuration(self) -> dict:
+        """
+        Devuelve los parámetros que determinan el resultado del reconocimiento
+
+        :returns: diccionario con el nombre del reconocedor, el número de vecinos y el resumen del modelo
+        """
+        return {'recognizer': type(self).__name__,
+                'k': self.classifier.k,
+                'model': self.model_fingerprint}
+
+    def recognize_text_with_confidence(self, image: np.array, enclosing_rectangles: np.array) -> Tuple[str, float]:
+        """
+        Clasifica cada dígito de la imagen recibida delimitado por un rectángulo
+
+        :param image: imagen en blanco y negro donde los dígitos son de color negro y el fondo blanco
+        :param enclosing_rectangles: conjunto de rectangulos que delimitan los dígitos
+        :return: una tupla con los dígitos de izquierda a derecha y la fracción media de vecinos que votan cada dígito
+        """
+        with self.profiler.stage('classify_digits'):
+            return classify_digits(self.classifier, [image], [enclosing_rectangles])[0]
+
+    def recognize_texts_with_confidence(self, images: List[np.array],
+                                        enclosing_rectangles: List[np.array]) -> List[Tuple[str, float]]:
+        """
+        Clasifica de una sola vez todos los dígitos de un conjunto de imágenes
+
+        :param images: lista de imágenes donde realizar el reconocimiento
+        :param enclosing_rectangles: lista con los rectángulos que delimitan los dígitos de cada imagen
+        :returns: lista de tuplas con los dígitos reconocidos en cada imagen y su confianza entre 0 y 1
+        """
+        return classify_digits(self.classifier, images, enclosing_rectangles)
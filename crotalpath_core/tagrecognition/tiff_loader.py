@@ -0,0 +1,135 @@
+"""Carga de imágenes TIFF sin comprimir proyectando sus tiras de píxeles en memoria, sin copiarlas"""
+import mmap
+import struct
+
+import cv2
+import numpy as np
+
+_TIFF_TYPE_FORMATS = {3: 'H', 4: 'I'}
+_IMAGE_WIDTH = 256
+_IMAGE_LENGTH = 257
+_BITS_PER_SAMPLE = 258
+_COMPRESSION = 259
+_PHOTOMETRIC_INTERPRETATION = 262
+_STRIP_OFFSETS = 273
+_SAMPLES_PER_PIXEL = 277
+_STRIP_BYTE_COUNTS = 279
+_PLANAR_CONFIGURATION = 284
+_TILE_WIDTH = 322
+_BLACK_IS_ZERO = 1
+_RGB = 2
+
+
+def read_image(image_path: str, flags: int = cv2.IMREAD_COLOR) -> np.array:
+    """
+    Lee una imagen del disco. Las imágenes TIFF sin comprimir, de 8 bits y en escala de grises o RGB, se proyectan en
+    memoria y, si ya están en el formato pedido, se devuelven sin copiar sus píxeles. El resto se lee con cv2.imread
+
+    :param image_path: ruta de la imagen
+    :param flags: cv2.IMREAD_GRAYSCALE para obtener la imagen en escala de grises o cv2.IMREAD_COLOR para obtenerla en
+    color (BGR)
+    :returns: la imagen en forma de numpy array, de solo lectura si está proyectada en memoria, o None si no se puede
+    leer
+    """
+    image = map_uncompressed_tiff(image_path)
+    if image is None:
+        return cv2.imread(image_path, flags)
+
+    if flags == cv2.IMREAD_GRAYSCALE:
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        return image
+
+    if flags == cv2.IMREAD_COLOR:
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    return cv2.imread(image_path, flags)
+
+
+def map_uncompressed_tiff(image_path: str) -> np.array:
+    """
+    Proyecta en memoria la primera imagen de un fichero TIFF sin comprimir. Si sus tiras son contiguas en el fichero
+    la imagen es una vista de la proyección, en otro caso las tiras se copian a una sola imagen
+
+    :param image_path: ruta de la imagen
+    :returns: numpy array de solo lectura de dimensiones (alto, ancho) o (alto, ancho, 3) en RGB, o None si el fichero
+    no es un TIFF sin comprimir de 8 bits en escala de grises o RGB
+    """
+    try:
+        with open(image_path, 'rb') as image_file:
+            file_map = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    layout = _parse_layout(file_map)
+    if layout is None:
+        file_map.close()
+        return None
+
+    height, width, samples_per_pixel, strip_offsets, strip_byte_counts = layout
+    shape = (height, width) if samples_per_pixel == 1 else (height, width, samples_per_pixel)
+    image_bytes = height * width * samples_per_pixel
+    if sum(strip_byte_counts) < image_bytes or \
+            any(offset + count > len(file_map) for offset, count in zip(strip_offsets, strip_byte_counts)):
+        file_map.close()
+        return None
+
+    contiguous_strips = all(strip_offsets[index + 1] == strip_offsets[index] + strip_byte_counts[index]
+                            for index in range(len(strip_offsets) - 1))
+    if contiguous_strips:
+        return np.frombuffer(file_map, np.uint8, count=image_bytes, offset=strip_offsets[0]).reshape(shape)
+
+    image = np.empty(image_bytes, np.uint8)
+    position = 0
+    for offset, count in zip(strip_offsets, strip_byte_counts):
+        count = min(count, image_bytes - position)
+        image[position:position + count] = np.frombuffer(file_map, np.uint8, count=count, offset=offset)
+        position += count
+    file_map.close()
+    image.flags.writeable = False
+    return image.reshape(shape)
+
+
+def _parse_layout(file_map: mmap.mmap) -> tuple:
+    """
+    Lee del primer directorio de un TIFF la disposición de sus píxeles
+
+    :param file_map: proyección en memoria del fichero
+    :returns: una tupla con el alto, el ancho, el número de canales, los desplazamientos y los tamaños de las tiras, o
+    None si el fichero no es un TIFF sin comprimir de 8 bits en escala de grises o RGB
+    """
+    if len(file_map) < 8 or file_map[:4] not in (b'II*\x00', b'MM\x00*'):
+        return None
+    byte_order = '<' if file_map[:2] == b'II' else '>'
+
+    try:
+        directory_offset, = struct.unpack_from(byte_order + 'I', file_map, 4)
+        entry_count, = struct.unpack_from(byte_order + 'H', file_map, directory_offset)
+        tags = {}
+        for index in range(entry_count):
+            tag, value_type, value_count, value_offset = struct.unpack_from(
+                byte_order + 'HHI4s', file_map, directory_offset + 2 + index * 12)
+            if value_type not in _TIFF_TYPE_FORMATS:
+                continue
+            value_format = byte_order + _TIFF_TYPE_FORMATS[value_type] * value_count
+            if struct.calcsize(value_format) <= 4:
+                tags[tag] = struct.unpack_from(value_format, value_offset)
+            else:
+                values_offset, = struct.unpack(byte_order + 'I', value_offset)
+                tags[tag] = struct.unpack_from(value_format, file_map, values_offset)
+    except struct.error:
+        return None
+
+    samples_per_pixel = tags.get(_SAMPLES_PER_PIXEL, (1,))[0]
+    photometric_interpretation = tags.get(_PHOTOMETRIC_INTERPRETATION, (None,))[0]
+    if tags.get(_COMPRESSION, (1,))[0] != 1 or _TILE_WIDTH in tags or \
+            tags.get(_PLANAR_CONFIGURATION, (1,))[0] != 1 or \
+            any(bits != 8 for bits in tags.get(_BITS_PER_SAMPLE, (1,))) or \
+            (samples_per_pixel, photometric_interpretation) not in ((1, _BLACK_IS_ZERO), (3, _RGB)) or \
+            any(tag not in tags for tag in (_IMAGE_WIDTH, _IMAGE_LENGTH, _STRIP_OFFSETS, _STRIP_BYTE_COUNTS)):
+        return None
+
+    return (tags[_IMAGE_LENGTH][0], tags[_IMAGE_WIDTH][0], samples_per_pixel, tags[_STRIP_OFFSETS],
+            tags[_STRIP_BYTE_COUNTS])
@@ -0,0 +1,255 @@
+"""Lectura de vídeos y secuencias de fotogramas, descarte de fotogramas repetidos y votación de los crotales leídos"""
+from collections import namedtuple
+from typing import Iterator, List
+
+import cv2
+import numpy as np
+
+VideoFrame = namedtuple('VideoFrame', ['index', 'timestamp_ms', 'image'])
+
+
+class VideoFrameReader:
+    """
+    Lee los fotogramas de un vídeo, una secuencia de imágenes o una cámara con cv2.VideoCapture. Los fotogramas que no
+    se muestrean solo se extraen del flujo, sin convertirlos a imagen
+    """
+
+    def __init__(self, source: str, frame_step: int = 1, grayscale: bool = True):
+        """
+        Abre la fuente de vídeo
+
+        :param source: ruta de un vídeo, patrón de una secuencia de imágenes como 'frames/%04d.png', URL de un flujo
+        como 'rtsp://...' o número de una cámara local
+        :param frame_step: se devuelve uno de cada frame_step fotogramas
+        :param grayscale: indicador que determina si devolver los fotogramas en escala de grises en lugar de en color
+        :raises ValueError: si el paso entre fotogramas es menor que 1
+        :raises OSError: si no se puede abrir la fuente de vídeo
+        """
+        if frame_step < 1:
+            raise ValueError('Frame step must be at least 1')
+
+        self.source = source
+        self.frame_step = frame_step
+        self.grayscale = grayscale
+        self.capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+        if not self.capture.isOpened():
+            self.capture.release()
+            raise OSError('Could not open video source {}'.format(source))
+
+    def get_frame_rate(self) -> float:
+        """
+        Obtiene la frecuencia de fotogramas declarada por la fuente
+
+        :returns: fotogramas por segundo de la fuente o None si no la declara
+        """
+        frame_rate = self.capture.get(cv2.CAP_PROP_FPS)
+        return frame_rate if frame_rate > 0 else None
+
+    def __iter__(self) -> Iterator[VideoFrame]:
+        """
+        Recorre los fotogramas muestreados hasta el final de la fuente
+
+        :returns: iterador de VideoFrame con el número de fotograma, su instante en milisegundos y la imagen
+        """
+        frame_index = -1
+        while self.capture.grab():
+            frame_index += 1
+            if frame_index % self.frame_step:
+                continue
+            timestamp_ms = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+            retrieved, image = self.capture.retrieve()
+            if not retrieved:
+                break
+            if self.grayscale and image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            yield VideoFrame(frame_index, timestamp_ms, image)
+
+    def close(self) -> None:
+        """Libera la fuente de vídeo"""
+
+        self.capture.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FrameDeduplicator:
+    """
+    Detecta los fotogramas casi iguales al último fotograma no repetido comparando sus miniaturas en escala de grises,
+    lo que cuesta mucho menos que localizar el texto del fotograma
+    """
+
+    def __init__(self, threshold: float = 2.0, thumbnail_size: int = 32):
+        """
+        Crea un detector de fotogramas repetidos
+
+        :param threshold: diferencia absoluta media máxima, en niveles de gris de 0 a 255, entre las miniaturas de dos
+        fotogramas repetidos. Con 0 solo se descartan los fotogramas idénticos
+        :param thumbnail_size: lado en píxeles de la miniatura cuadrada que se compara
+        :raises ValueError: si el umbral es negativo o el lado de la miniatura menor que 1
+        """
+        if threshold < 0:
+            raise ValueError('Duplicate threshold must not be negative')
+        if thumbnail_size < 1:
+            raise ValueError('Thumbnail size must be at least 1')
+
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        self.reference_thumbnail = None
+
+    def is_duplicate(self, image: np.array) -> bool:
+        """
+        Compara un fotograma con el último no repetido, que pasa a ser él mismo si no es un repetido
+
+        :param image: fotograma en color (3 canales) o en escala de grises (1 canal)
+        :returns: True si el fotograma es casi igual al último no repetido
+        """
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(image, (self.thumbnail_size, self.thumbnail_size), interpolation=cv2.INTER_AREA)
+
+        if self.reference_thumbnail is not None and \
+                cv2.norm(thumbnail, self.reference_thumbnail, cv2.NORM_L1) / thumbnail.size <= self.threshold:
+            return True
+        self.reference_thumbnail = thumbnail
+        return False
+
+
+def vote_digits(readings: List[tuple]) -> tuple:
+    """
+    Elige el número de un crotal a partir de varias lecturas, ponderando cada una con su confianza. Primero se vota el
+    número de dígitos y después cada dígito entre las lecturas con ese número de dígitos
+
+    :param readings: lista no vacía de tuplas con los dígitos leídos y su confianza entre 0 y 1 o None
+    :returns: una tupla con los dígitos elegidos y el acuerdo, entre 0 y 1, como la media de la fracción del peso
+    que vota cada dígito elegido
+    """
+    # Una confianza nula o desconocida no anula la lectura, que sigue contando como un voto mínimo
+    weighted_readings = [(digits, max(confidence if confidence is not None else 1.0, 1e-3))
+                         for digits, confidence in readings]
+
+    length_weights = {}
+    for digits, weight in weighted_readings:
+        length_weights[len(digits)] = length_weights.get(len(digits), 0.0) + weight
+    digit_count = max(length_weights, key=lambda length: (length_weights[length], length))
+
+    position_weights = np.zeros((digit_count, 10))
+    for digits, weight in weighted_readings:
+        if len(digits) == digit_count:
+            for position, digit in enumerate(digits):
+                if digit.isdigit():
+                    position_weights[position, int(digit)] += weight
+
+    total_weights = np.maximum(position_weights.sum(axis=1), 1e-9)
+    voted_digits = ''.join(str(digit) for digit in position_weights.argmax(axis=1))
+    agreement = float(np.mean(position_weights.max(axis=1) / total_weights))
+    return voted_digits, agreement
+
+
+class TagTrackVoter:
+    """
+    Agrupa las lecturas de fotogramas consecutivos en pasos de un animal y vota su número de crotal. Un paso comienza
+    con la primera lectura con dígitos y termina cuando pasan más de max_gap_frames fotogramas sin ninguna lectura o
+    cuando una lectura con confianza suficiente y el mismo número de dígitos difiere del número votado hasta entonces en
+    la mayoría de ellos, lo que indica que un animal ha pasado justo detrás del anterior. Las lecturas repetidas de un
+    fotograma casi igual al anterior prolongan el paso pero no votan, ya que no aportan información nueva
+    """
+
+    def __init__(self, max_gap_frames: int = 10, min_readings: int = 2, split_confidence: float = 0.8):
+        """
+        Crea un agrupador de lecturas
+
+        :param max_gap_frames: número máximo de fotogramas sin lectura dentro del paso de un mismo animal
+        :param min_readings: número mínimo de lecturas de un paso para devolverlo, los pasos con menos se descartan
+        :param split_confidence: confianza mínima, entre 0 y 1, de una lectura que difiere del número votado para
+        terminar el paso en curso y comenzar otro con ella o None para terminar los pasos solo por el hueco sin lecturas
+        :raises ValueError: si el hueco máximo es negativo, el número mínimo de lecturas menor que 1 o la confianza
+        para separar pasos no está entre 0 y 1
+        """
+        if max_gap_frames < 0:
+            raise ValueError('Maximum gap must not be negative')
+        if min_readings < 1:
+            raise ValueError('Minimum number of readings must be at least 1')
+        if split_confidence is not None and not 0 <= split_confidence <= 1:
+            raise ValueError('Split confidence must be between 0 and 1')
+
+        self.max_gap_frames = max_gap_frames
+        self.min_readings = min_readings
+        self.split_confidence = split_confidence
+        self.readings = []
+        self.reading_count = 0
+        self.first_frame = None
+        self.last_frame = None
+
+    def add_reading(self, frame: VideoFrame, digits: str, confidence: float = None, repeated: bool = False) -> dict:
+        """
+        Añade la lectura de un fotograma, los fotogramas deben añadirse en orden
+
+        :param frame: fotograma leído, solo se usan su número y su instante
+        :param digits: dígitos leídos, vacíos o None si no se ha leído ningún crotal
+        :param confidence: confianza de la lectura entre 0 y 1 o None si es desconocida
+        :param repeated: indicador de que la lectura repite la del fotograma anterior, casi igual a este
+        :returns: el paso terminado por este fotograma, con el formato de finish_track, o None
+        """
+        if not digits:
+            if self.reading_count and frame.index - self.last_frame[0] > self.max_gap_frames:
+                return self.finish_track()
+            return None
+
+        finished_track = None
+        if self.reading_count and not repeated and self.__starts_new_track(digits, confidence):
+            finished_track = self.finish_track()
+
+        if not self.reading_count:
+            self.first_frame = (frame.index, frame.timestamp_ms)
+        if not repeated or not self.readings:
+            self.readings.append((digits, confidence))
+        self.reading_count += 1
+        self.last_frame = (frame.index, frame.timestamp_ms)
+        return finished_track
+
+    def __starts_new_track(self, digits: str, confidence: float) -> bool:
+        """
+        Comprueba si una lectura confiada difiere del número votado del paso en curso en más de la mitad de sus
+        dígitos. Las lecturas con otro número de dígitos no se comparan, suelen ser lecturas parciales del mismo crotal
+
+        :param digits: dígitos leídos
+        :param confidence: confianza de la lectura entre 0 y 1 o None si es desconocida
+        :returns: True si la lectura pertenece a otro animal
+        """
+        if self.split_confidence is None or confidence is None or confidence < self.split_confidence:
+            return False
+
+        voted_digits = vote_digits(self.readings)[0]
+        if len(digits) != len(voted_digits):
+            return False
+        different_positions = sum(new_digit != voted_digit for new_digit, voted_digit in zip(digits, voted_digits))
+        return different_positions * 2 > len(digits)
+
+    def finish_track(self) -> dict:
+        """
+        Termina el paso en curso, por ejemplo al terminar el vídeo
+
+        :returns: diccionario con los dígitos votados ('digits'), el acuerdo entre las lecturas ('confidence'), el
+        número de fotogramas leídos ('readings'), incluidos los repetidos, el de lecturas que han votado ('votes'), el
+        primer y el último fotograma con lectura ('first_frame' y 'last_frame') y
+        sus instantes en milisegundos ('start_ms' y 'end_ms'), o None si no hay paso en curso o tiene menos de
+        min_readings lecturas
+        """
+        readings, self.readings = self.readings, []
+        reading_count, self.reading_count = self.reading_count, 0
+        if reading_count < self.min_readings:
+            return None
+
+        digits, agreement = vote_digits(readings)
+        return {'digits': digits,
+                'confidence': round(agreement, 3),
+                'readings': reading_count,
+                'votes': len(readings),
+                'first_frame': self.first_frame[0],
+                'last_frame': self.last_frame[0],
+                'start_ms': round(self.first_frame[1], 1),
+                'end_ms': round(self.last_frame[1], 1)}
@@ -0,0 +1,151 @@
+"""Conjuntos de prueba para la vigilancia de carpetas con imágenes"""
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from itertools import islice
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from crotalpath_core.tagrecognition.folder_watch import FolderWatcher, ProcessedFilesLog
+
+DATASET_PATH = Path(__file__).parent / 'dataset' / 'TestSamples'
+
+
+class FolderWatchTest(unittest.TestCase):
+    """Realiza las pruebas a la vigilancia de carpetas y al registro de ficheros procesados"""
+
+    def setUp(self):
+        """Crea una carpeta temporal con una imagen"""
+        self.temporary_folder = tempfile.TemporaryDirectory()
+        self.folder_path = Path(self.temporary_folder.name)
+        shutil.copy(str(DATASET_PATH / '0001.TIF'), str(self.folder_path / '0001.TIF'))
+
+    def tearDown(self):
+        """Elimina la carpeta temporal"""
+        self.temporary_folder.cleanup()
+
+    def check_watcher(self, use_inotify: bool):
+        """Comprueba que se devuelvan una única vez los ficheros existentes y los nuevos, salvo los temporales"""
+        with FolderWatcher(str(self.folder_path), poll_interval=0.05, use_inotify=use_inotify) as watcher:
+            self.assertEqual(watcher.get_new_files(timeout=1), [self.folder_path / '0001.TIF'])
+
+            (self.folder_path / '.0002.TIF.part').write_bytes(b'partial')
+            (self.folder_path / 'README').write_bytes(b'no extension')
+            shutil.copy(str(DATASET_PATH / '0002.TIF'), str(self.folder_path / '0002.TIF'))
+            (self.folder_path / '.0003.TIF.part').write_bytes(b'partial')
+            (self.folder_path / '.0003.TIF.part').rename(self.folder_path / '0003.TIF')
+
+            new_files = []
+            for _ in range(10):
+                new_files.extend(watcher.get_new_files(timeout=0.2))
+                if len(new_files) == 2:
+                    break
+            self.assertEqual(sorted(new_files), [self.folder_path / '0002.TIF', self.folder_path / '0003.TIF'])
+            self.assertEqual(watcher.get_new_files(timeout=0.2), [])
+
+    def test_polling_watcher(self):
+        """Prueba la detección de ficheros nuevos recorriendo la carpeta"""
+        self.check_watcher(use_inotify=False)
+
+    def test_inotify_watcher(self):
+        """Prueba la detección de ficheros nuevos con inotify, si está disponible"""
+        with FolderWatcher(str(self.folder_path)) as watcher:
+            if not watcher.uses_inotify:
+                self.skipTest('inotify is not available')
+        self.check_watcher(use_inotify=True)
+
+    def check_unfinished_file(self, use_inotify: bool):
+        """
+        Comprueba que un fichero que ya existía pero sigue escribiéndose no se devuelva hasta terminar de escribirse y
+        que se devuelva una única vez
+        """
+        unfinished_path = self.folder_path / '0002.TIF'
+        unfinished_file = open(str(unfinished_path), 'wb')
+        unfinished_file.write(b'\0' * 1024)
+        unfinished_file.flush()
+
+        def write_remaining():
+            for _ in range(15):
+                time.sleep(0.02)
+                unfinished_file.write(b'\0' * 1024)
+                unfinished_file.flush()
+            unfinished_file.close()
+
+        with FolderWatcher(str(self.folder_path), poll_interval=0.2, use_inotify=use_inotify) as watcher:
+            writer = threading.Thread(target=write_remaining)
+            writer.start()
+            new_files = watcher.get_new_files(timeout=0.1) + watcher.get_new_files(timeout=0.1)
+            self.assertNotIn(unfinished_path, new_files)
+            writer.join()
+
+            for _ in range(10):
+                new_files.extend(watcher.get_new_files(timeout=0.2))
+                if len(new_files) == 2:
+                    break
+            self.assertEqual(sorted(new_files), [self.folder_path / '0001.TIF', unfinished_path])
+            self.assertEqual(unfinished_path.stat().st_size, 16 * 1024)
+            self.assertEqual(watcher.get_new_files(timeout=0.3), [])
+
+    def test_polling_unfinished_file(self):
+        """Prueba que recorriendo la carpeta no se devuelvan los ficheros a medio escribir"""
+        self.check_unfinished_file(use_inotify=False)
+
+    def test_inotify_unfinished_file(self):
+        """Prueba que con inotify no se devuelvan los ficheros que ya existían y siguen escribiéndose"""
+        with FolderWatcher(str(self.folder_path)) as watcher:
+            if not watcher.uses_inotify:
+                self.skipTest('inotify is not available')
+        self.check_unfinished_file(use_inotify=True)
+
+    def test_incorrect_folder(self):
+        """Prueba que no se pueda vigilar una ruta que no existe o que no es una carpeta"""
+        self.assertRaises(FileNotFoundError, FolderWatcher, str(self.folder_path / 'missing'))
+        self.assertRaises(NotADirectoryError, FolderWatcher, str(self.folder_path / '0001.TIF'))
+
+    def test_processed_files_log(self):
+        """Prueba que el registro de ficheros procesados se conserve al volver a abrirlo"""
+        log_path = str(self.folder_path / 'processed.log')
+        with ProcessedFilesLog(log_path) as processed_files:
+            processed_files.add('0001.TIF')
+            processed_files.add('0001.TIF')
+
+        with ProcessedFilesLog(log_path) as processed_files:
+            self.assertIn('0001.TIF', processed_files)
+            self.assertNotIn('0002.TIF', processed_files)
+            self.assertEqual(len(processed_files), 1)
+
+    def test_watch_folder_resumes(self):
+        """
+        Prueba que al reanudar la vigilancia solo se reconozcan las imágenes no procesadas. Una imagen se anota como
+        procesada al pedir el siguiente crotal, por lo que la última devuelta antes de interrumpir se vuelve a reconocer
+        """
+        log_folder = tempfile.TemporaryDirectory()
+        log_path = str(Path(log_folder.name) / 'processed.log')
+        shutil.copy(str(DATASET_PATH / '0002.TIF'), str(self.folder_path / '0002.TIF'))
+        # El clasificador de dígitos no depende de Tesseract: si el reconocimiento fallase, la vigilancia solo
+        # notificaría el error y la prueba esperaría indefinidamente un crotal
+        tag_batch_recognizer = TagBatchRecognizer(recognizer_type=2)
+
+        with ProcessedFilesLog(log_path) as processed_files:
+            watched_tags = tag_batch_recognizer.watch_folder(str(self.folder_path), processed_files,
+                                                             poll_interval=0.05)
+            recognized_tags = list(islice(watched_tags, 2))
+            watched_tags.close()
+        self.assertEqual([recognized_tag.identifier for recognized_tag in recognized_tags],
+                         [self.folder_path / '0001.TIF', self.folder_path / '0002.TIF'])
+
+        shutil.copy(str(DATASET_PATH / '0003.TIF'), str(self.folder_path / '0003.TIF'))
+        with ProcessedFilesLog(log_path) as processed_files:
+            watched_tags = tag_batch_recognizer.watch_folder(str(self.folder_path), processed_files,
+                                                             poll_interval=0.05)
+            recognized_tags = list(islice(watched_tags, 2))
+            watched_tags.close()
+        log_folder.cleanup()
+        self.assertEqual([recognized_tag.identifier for recognized_tag in recognized_tags],
+                         [self.folder_path / '0002.TIF', self.folder_path / '0003.TIF'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Conjuntos de prueba para el reconocimiento en etapas concurrentes"""
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import cv2
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from crotalpath_core.tagrecognition.pipeline import RecognitionPipeline
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
+
+
+class RecognitionPipelineTest(unittest.TestCase):
+    """Realiza las pruebas a la clase RecognitionPipeline a través de TagBatchRecognizer"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Selecciona varias imágenes válidas del conjunto de prueba"""
+        dataset_path = Path(__file__).parent / 'dataset' / 'TestSamples'
+        cls.images_path = [str(dataset_path / '{:04d}.TIF'.format(index)) for index in range(1, 13)]
+
+    def test_same_results(self):
+        """Prueba que las etapas devuelvan los mismos resultados, en el mismo orden, que el reconocimiento en grupos"""
+        tags = TagBatchRecognizer(recognizer_type=2).recognize_images(self.images_path)
+        pipeline_recognizer = TagBatchRecognizer(recognizer_type=2, pipeline_workers=(2, 1, 2), pipeline_queue_size=2)
+        pipeline_tags = pipeline_recognizer.recognize_images(self.images_path)
+
+        self.assertEqual([tag.get_detection() for tag in pipeline_tags], [tag.get_detection() for tag in tags])
+        statistics = pipeline_recognizer.get_pipeline_statistics()
+        self.assertEqual({name: stage['items'] for name, stage in statistics['stages'].items()},
+                         {'decode': 12, 'locate': 12, 'ocr': 12})
+        self.assertEqual(statistics['stages']['decode']['workers'], 2)
+        for name in ('input', 'decoded', 'located'):
+            self.assertLessEqual(statistics['queues'][name]['max_depth'], 2)
+        for stage in statistics['stages'].values():
+            self.assertTrue(0 < stage['utilization'] <= 1)
+
+    def test_profile_and_cache(self):
+        """Prueba que se añada el tiempo de cada etapa y que una imagen ya reconocida se obtenga de la caché"""
+        pipeline_recognizer = TagBatchRecognizer(recognizer_type=2, pipeline_workers=(1, 1, 1), profile=True,
+                                                 cache=TagResultCache())
+        tag = pipeline_recognizer.recognize_images(self.images_path[:1])[0]
+        cached_tags = pipeline_recognizer.recognize_images(self.images_path[:1] * 4)
+
+        self.assertEqual(set(tag.timings), {'decode', 'locate', 'ocr'})
+        detection = {key: value for key, value in tag.get_detection().items() if key != 'timings'}
+        for cached_tag in cached_tags:
+            self.assertEqual({key: value for key, value in cached_tag.get_detection().items() if key != 'timings'},
+                             detection)
+        self.assertEqual(pipeline_recognizer.cache_statistics['hits'], 4)
+        self.assertEqual(pipeline_recognizer.get_pipeline_statistics()['stages']['locate']['items'], 0)
+
+    def test_bounded_images_in_flight(self):
+        """Prueba que una primera imagen lenta no acumule en memoria el resto de imágenes ya reconocidas"""
+        slow_image_path = self.images_path[0]
+
+        def read_image(path: str):
+            if path is slow_image_path:
+                time.sleep(0.5)
+            return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+        recognizer = TagBatchRecognizer(recognizer_type=2).recognizer
+        pipeline = RecognitionPipeline(recognizer, read_image, decode_threads=2, locate_processes=1, ocr_threads=1,
+                                       queue_size=2)
+        tags = list(pipeline.iterate([slow_image_path] + [str(path) for path in self.images_path * 3]))
+
+        statistics = pipeline.get_statistics()
+        self.assertEqual(len(tags), 37)
+        self.assertEqual(statistics['window_size'], 6)
+        self.assertLessEqual(statistics['max_images_in_flight'], 6)
+        self.assertLessEqual(statistics['queues']['recognized']['max_depth'], 6)
+
+    def test_errors_and_early_stop(self):
+        """
+        Prueba que el error de una imagen se lance en su posición, tras devolver las anteriores, y que las etapas se
+        detengan si se deja de consumir el resultado
+        """
+        pipeline_recognizer = TagBatchRecognizer(recognizer_type=2, pipeline_workers=(2, 1, 1))
+        with tempfile.NamedTemporaryFile(suffix='.TIF') as invalid_image:
+            recognized_tags = pipeline_recognizer.iterate_images(self.images_path[:3] + [invalid_image.name])
+            self.assertEqual(len([next(recognized_tags) for _ in range(3)]), 3)
+            self.assertRaises(Exception, next, recognized_tags)
+
+        recognized_tags = pipeline_recognizer.iterate_images(self.images_path)
+        next(recognized_tags)
+        recognized_tags.close()
+        self.assertLess(pipeline_recognizer.get_pipeline_statistics()['stages']['ocr']['items'], 12)
+
+    def test_incorrect_workers(self):
+        """Prueba que cada etapa necesite al menos un hilo o proceso"""
+        self.assertRaises(ValueError, TagBatchRecognizer, recognizer_type=2, pipeline_workers=(1, 0, 1))
+        self.assertRaises(ValueError, TagBatchRecognizer, recognizer_type=2, pipeline_workers=(1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Conjuntos de prueba para la medición de tiempos del reconocimiento"""
+import unittest
+
+from crotalpath_core.tagrecognition.profiling import StageProfiler, summarize_timings
+
+
+class StageProfilerTest(unittest.TestCase):
+    """Realiza las pruebas a la clase StageProfiler y al resumen de tiempos"""
+
+    def test_disabled_profiler(self):
+        """Prueba que un medidor desactivado no registre tiempos"""
+        profiler = StageProfiler()
+        profiler.start_image()
+        with profiler.stage('locate_text'):
+            pass
+        self.assertIsNone(profiler.finish_image())
+
+    def test_enabled_profiler(self):
+        """Prueba que se acumulen los tiempos de cada etapa y se descarten al comenzar una nueva imagen"""
+        profiler = StageProfiler(enabled=True)
+        profiler.start_image()
+        with profiler.stage('locate_text'):
+            pass
+        with profiler.stage('locate_text'):
+            pass
+        with profiler.stage('tesseract'):
+            pass
+        timings = profiler.finish_image()
+
+        self.assertEqual(set(timings.keys()), {'locate_text', 'tesseract'})
+        self.assertGreaterEqual(timings['locate_text'], 0)
+        profiler.start_image()
+        self.assertEqual(profiler.finish_image(), {})
+
+    def test_summarize_timings(self):
+        """Prueba el cálculo de los percentiles de cada etapa"""
+        summary = summarize_timings([{'tesseract': float(elapsed)} for elapsed in range(1, 101)])
+
+        self.assertEqual(summary['tesseract']['count'], 100)
+        self.assertEqual(summary['tesseract']['p50'], 50.5)
+        self.assertEqual(summary['tesseract']['max'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
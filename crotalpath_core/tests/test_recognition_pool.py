@@ -0,0 +1,65 @@
+"""Conjuntos de prueba para el conjunto de procesos de reconocimiento del servidor web"""
+import json
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from crotalpath_server.recognition_pool import RecognitionPool
+
+
+class RecognitionPoolTest(unittest.TestCase):
+    """Realiza las pruebas a la clase RecognitionPool"""
+
+    def setUp(self):
+        """Crea una tarea con una imagen del conjunto de prueba y el conjunto de procesos con el clasificador k-NN"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.task_folder_path = Path(self.folder.name) / 'task'
+        self.task_folder_path.mkdir()
+        shutil.copy(str(Path(__file__).parent / 'dataset' / 'TestSamples' / '0001.TIF'), str(self.task_folder_path))
+        self.pool = RecognitionPool(workers=1, max_queued_tasks=0, recognizer_type=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.folder.cleanup()
+
+    def submit_task(self, name: str):
+        """Encola la tarea con el nombre de fichero de resultado indicado"""
+
+        return self.pool.submit(self.task_folder_path, Path(self.folder.name) / name)
+
+    def test_worker_crash(self):
+        """
+        Prueba que tras terminar un proceso de forma abrupta las siguientes tareas se reconozcan en un nuevo conjunto
+        de procesos y que no se pierdan huecos de la cola
+        """
+        self.submit_task('first').result(timeout=60)
+        for pid in list(self.pool.executor._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        # La tarea encolada antes de que el conjunto de procesos detecte la caída puede fallar, la siguiente no
+        try:
+            self.submit_task('crashed').result(timeout=60)
+        except BrokenProcessPool:
+            pass
+        self.submit_task('second').result(timeout=60)
+
+        with open(Path(self.folder.name) / 'second', 'r') as result_file:
+            self.assertEqual(len(json.load(result_file)), 1)
+        self.assertEqual(self.pool.active_tasks, 0)
+        self.assertFalse(self.pool.is_full())
+
+    def test_submit_after_shutdown(self):
+        """Prueba que una tarea rechazada por estar detenidos los procesos libere su hueco de la cola"""
+        self.pool.shutdown()
+
+        self.assertRaises(RuntimeError, self.submit_task, 'rejected')
+        self.assertEqual(self.pool.active_tasks, 0)
+        self.assertFalse(self.pool.is_full())
+
+
+if __name__ == '__main__':
+    unittest.main()
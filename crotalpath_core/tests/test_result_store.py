@@ -0,0 +1,90 @@
+"""Conjuntos de prueba para el almacén de resultados de reconocimiento"""
+import tempfile
+import unittest
+from pathlib import Path
+
+from crotalpath_core.tagrecognition.result_store import TagResultStore
+
+
+class TagResultStoreTest(unittest.TestCase):
+    """Realiza las pruebas a la clase TagResultStore"""
+
+    def setUp(self):
+        """Crea una carpeta temporal para la base de datos"""
+        self.temporary_folder = tempfile.TemporaryDirectory()
+        self.database_path = str(Path(self.temporary_folder.name) / 'results.sqlite3')
+        self.detection = {'digits': '1234', 'bounding_rects': [[10, 20, 30, 40], [50, 60, 70, 80]],
+                          'identifier': 'images/0001.TIF', 'timings': {'total': 12.5}}
+
+    def tearDown(self):
+        """Elimina la carpeta temporal"""
+        self.temporary_folder.cleanup()
+
+    def test_find_by_digits(self):
+        """Prueba que un resultado se recupere igual que se añadió, solo buscando su número exacto"""
+        with TagResultStore(self.database_path) as result_store:
+            result_store.add_detection(self.detection)
+            result_store.add_detection({'digits': '12345', 'bounding_rects': [[1, 2, 3, 4]],
+                                        'identifier': 'images/0002.TIF'}, source='task')
+            result_store.commit()
+
+            self.assertEqual(result_store.find_by_digits('1234'), [dict(self.detection, source=None)])
+            self.assertEqual(result_store.find_by_digits('123'), [])
+            self.assertEqual(result_store.find_by_digits('12345')[0]['source'], 'task')
+
+    def test_find_by_prefix(self):
+        """Prueba la búsqueda de los números que empiezan por unos dígitos y el límite de resultados"""
+        with TagResultStore(self.database_path) as result_store:
+            for digits in ('1234', '1239', '1240', '0123', None):
+                result_store.add_detection(dict(self.detection, digits=digits))
+            result_store.commit()
+
+            self.assertEqual([detection['digits'] for detection in result_store.find_by_digits('123', prefix=True)],
+                             ['1234', '1239'])
+            self.assertEqual(len(result_store.find_by_digits('1', prefix=True, limit=2)), 2)
+            self.assertEqual(len(result_store.find_by_digits('', prefix=True)), 4)
+
+    def test_commit(self):
+        """Prueba que los resultados se escriban al alcanzar el tamaño de escritura, al confirmar y al cerrar"""
+        with TagResultStore(self.database_path, commit_size=2) as result_store:
+            result_store.add_detection(self.detection)
+            self.assertEqual(result_store.count(), 0)
+            result_store.add_detection(self.detection)
+            self.assertEqual(result_store.count(), 2)
+            result_store.add_detection(self.detection)
+
+        with TagResultStore(self.database_path) as result_store:
+            self.assertEqual(result_store.count(), 3)
+
+    def test_delete_source(self):
+        """Prueba que solo se eliminen los resultados del origen indicado"""
+        with TagResultStore(self.database_path) as result_store:
+            result_store.add_detection(self.detection, source='first')
+            result_store.add_detection(self.detection, source='second')
+            result_store.commit()
+            result_store.delete_source('first')
+
+            self.assertEqual([detection['source'] for detection in result_store.find_by_digits('1234')], ['second'])
+
+    def test_replace_source(self):
+        """
+        Prueba que se reemplacen en una sola transacción los resultados de un origen, aunque superen el tamaño de
+        escritura, sin escribir los añadidos pendientes
+        """
+        with TagResultStore(self.database_path, commit_size=2) as result_store:
+            result_store.replace_source('task', [self.detection] * 3)
+            result_store.add_detection(dict(self.detection, digits='5678'), source='task')
+            result_store.replace_source('task', [dict(self.detection, digits='9999')] * 3)
+
+            self.assertEqual(result_store.find_by_digits('1234'), [])
+            self.assertEqual(len(result_store.find_by_digits('9999')), 3)
+            self.assertEqual(result_store.find_by_digits('5678'), [])
+            self.assertEqual(result_store.pending_rows[0][2], '5678')
+
+    def test_incorrect_commit_size(self):
+        """Prueba que no se admita un tamaño de escritura menor que 1"""
+        self.assertRaises(ValueError, TagResultStore, self.database_path, commit_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
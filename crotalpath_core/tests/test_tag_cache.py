@@ -0,0 +1,76 @@
+"""Conjuntos de prueba para la caché de resultados de reconocimiento"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
+
+
+class TagResultCacheTest(unittest.TestCase):
+    """Realiza las pruebas a la clase TagResultCache"""
+
+    def setUp(self):
+        """Genera una imagen y un resultado de prueba"""
+        self.image = np.arange(64 * 48 * 3, dtype=np.uint8).reshape((64, 48, 3))
+        self.configuration = {'ocr': {'padding': 50}}
+        self.detection = {'digits': '0288', 'bounding_rects': [[95, 326, 74, 123]], 'identifier': 'ignored'}
+
+    def test_key(self):
+        """Prueba que la clave dependa del contenido de la imagen y de la configuración"""
+        key = TagResultCache.key(self.image, self.configuration)
+        self.assertEqual(key, TagResultCache.key(self.image.copy(), dict(self.configuration)))
+        self.assertNotEqual(key, TagResultCache.key(self.image, {'ocr': {'padding': 40}}))
+        self.assertNotEqual(key, TagResultCache.key(self.image[::-1], self.configuration))
+
+    def test_memory_lru(self):
+        """Prueba que en memoria se descarte el resultado usado hace más tiempo"""
+        cache = TagResultCache(max_entries=2)
+        cache.put('a', self.detection)
+        cache.put('b', self.detection)
+        cache.get('a')
+        cache.put('c', self.detection)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), {'digits': '0288', 'bounding_rects': [[95, 326, 74, 123]]})
+        self.assertEqual(cache.get_statistics(), {'memory_hits': 3, 'disk_hits': 0, 'misses': 1, 'memory_entries': 2})
+
+    def test_disk(self):
+        """Prueba que los resultados en disco se compartan entre cachés y se respete su tamaño máximo"""
+        with tempfile.TemporaryDirectory() as disk_path:
+            TagResultCache(disk_path=disk_path).put('a', self.detection)
+            cache = TagResultCache(disk_path=disk_path, max_disk_bytes=100)
+            self.assertEqual(cache.get('a')['digits'], '0288')
+            self.assertEqual(cache.get_statistics()['disk_hits'], 1)
+
+            cache.put('b', self.detection)
+            self.assertLessEqual(cache.disk_bytes, 100)
+            self.assertIsNone(TagResultCache(disk_path=disk_path).get('a'))
+
+    def test_disk_eviction(self):
+        """
+        Prueba que al sobrescribir un resultado solo se cuente la diferencia de tamaño y que al superar el máximo se
+        eliminen resultados hasta la fracción DISK_LOW_WATER_RATIO, de forma que la carpeta no se recorra en cada
+        resultado
+        """
+        with tempfile.TemporaryDirectory() as disk_path:
+            entry_bytes = len(json.dumps({'digits': '0288', 'bounding_rects': [[95, 326, 74, 123]]}))
+            cache = TagResultCache(disk_path=disk_path, max_disk_bytes=entry_bytes * 100)
+            for _ in range(200):
+                cache.put('a', self.detection)
+            self.assertEqual(cache.disk_bytes, entry_bytes)
+
+            with mock.patch.object(Path, 'glob', side_effect=Path.glob, autospec=True) as glob_mock:
+                for index in range(300):
+                    cache.put(str(index), self.detection)
+            self.assertLess(glob_mock.call_count, 25)
+            self.assertLessEqual(cache.disk_bytes, entry_bytes * 100)
+            self.assertEqual(cache.disk_bytes, sum(entry.stat().st_size for entry in Path(disk_path).glob('*.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
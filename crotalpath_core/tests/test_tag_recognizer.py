@@ -1,14 +1,19 @@
 """Conjuntos de prueba para los reconocedores de crotales"""
 import json
+import time
 from pathlib import Path
 
 import unittest
+from unittest import mock
+import cv2
 import numpy as np
 
 from pandas_ods_reader import read_ods
 
 from crotalpath_core.__main__ import TagBatchRecognizer
-from crotalpath_core.tagrecognition.tag import NotAFileError
+from crotalpath_core.tagrecognition.tag import CowTag, NotAFileError
+from crotalpath_core.tagrecognition.tag_recognition import CowTagRecognizer
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
 
 
 class TagRecognizerTest(unittest.TestCase):
@@ -198,6 +203,148 @@ class TagRecognizerTest(unittest.TestCase):
         self.assertRaises(NotAFileError, self.tag_recognizer.recognize_images,
                           images_path=self.some_non_valid_image_path_list)
 
+    def test_parallel_image_path(self):
+        """
+        Prueba que el modo multiproceso devuelva los mismos resultados, en el mismo orden, que el modo secuencial y que
+        propague los mismos errores
+        """
+        parallel_recognizer = TagBatchRecognizer(recognizer_type=1, display_result=False, workers=2)
+        serial_tags = self.tag_recognizer.recognize_images(self.valid_multi_image_path_list)
+        parallel_tags = parallel_recognizer.recognize_images(self.valid_multi_image_path_list)
+
+        self.assertEqual([tag.get_detection() for tag in serial_tags],
+                         [tag.get_detection() for tag in parallel_tags])
+        self.assertRaises(ValueError, TagBatchRecognizer, recognizer_type=1, workers=0)
+        self.assertRaises(FileNotFoundError, parallel_recognizer.recognize_images,
+                          images_path=self.some_non_valid_image_path_list_2)
+        self.assertRaises(NotAFileError, parallel_recognizer.recognize_images,
+                          images_path=self.some_non_valid_image_path_list)
+
+    def test_roi_batch_image_path(self):
+        """
+        Prueba que con región de interés el reconocimiento en grupos devuelva los mismos resultados que imagen a imagen,
+        aunque el detector de texto reutilice la imagen postprocesada entre imágenes
+        """
+        single_recognizer = TagBatchRecognizer(recognizer_type=2, display_result=False, roi_scale=0.5)
+        batch_recognizer = TagBatchRecognizer(recognizer_type=2, display_result=False, roi_scale=0.5,
+                                              ocr_batch_size=len(self.valid_multi_image_path_list))
+        single_tags = single_recognizer.recognize_images(self.valid_multi_image_path_list)
+        batch_tags = batch_recognizer.recognize_images(self.valid_multi_image_path_list)
+
+        self.assertEqual([tag.get_detection() for tag in single_tags], [tag.get_detection() for tag in batch_tags])
+
+    def test_stream_image_path(self):
+        """Prueba que el modo streaming devuelva un JSON por imagen, igual al del resultado completo"""
+        streamed_tags = [json.loads(tag_json) for tag_json in
+                         self.tag_recognizer.stream_path(images_path=self.valid_multi_image_path_list)]
+        tags = json.loads(self.tag_recognizer.process_path(images_path=self.valid_multi_image_path_list))
+
+        self.assertEqual(streamed_tags, tags)
+        self.assertRaises(TypeError, list, self.tag_recognizer.stream_path())
+
+    def test_cached_image_path(self):
+        """Prueba que una imagen repetida se obtenga de la caché con el mismo resultado"""
+        cached_recognizer = TagBatchRecognizer(recognizer_type=1, display_result=False, cache=TagResultCache())
+        tags = cached_recognizer.recognize_images([self.valid_image_path, self.valid_image_path])
+
+        self.assertEqual(tags[0].get_detection(), tags[1].get_detection())
+        self.assertEqual(cached_recognizer.cache_statistics, {'hits': 1, 'misses': 1})
+
+    def test_rejected_images(self):
+        """
+        Prueba que las imágenes sin dígitos válidos se descarten sin ejecutar el OCR, indicando el motivo, y que solo
+        las válidas se reconozcan de forma conjunta
+        """
+        recognizer = CowTagRecognizer()
+        blank_image = np.full((480, 640), 128, np.uint8)
+        valid_image = cv2.imread(str(self.valid_image_path), cv2.IMREAD_GRAYSCALE)
+
+        with mock.patch.object(recognizer.ocr, 'recognize_text_with_confidence') as recognize_text, \
+                mock.patch.object(recognizer.ocr, 'recognize_texts_with_confidence',
+                                  return_value=[('0288', 0.9)]) as recognize_texts:
+            blank_tag = recognizer.recognize_image(blank_image)
+            tags = recognizer.recognize_images([blank_image, valid_image, blank_image])
+
+        recognize_text.assert_not_called()
+        self.assertEqual(len(recognize_texts.call_args[0][0]), 1)
+        self.assertEqual(blank_tag.get_detection()['rejection_reason'], 'no_digits')
+        self.assertEqual((blank_tag.digits, blank_tag.confidence), ('', 0.0))
+        self.assertEqual([tag.rejection_reason for tag in tags], ['no_digits', None, 'no_digits'])
+        self.assertEqual(tags[1].digits, '0288')
+        self.assertGreater(tags[1].confidence, 0.5)
+        self.assertNotIn('rejection_reason', tags[1].get_detection())
+
+        self.assertEqual(recognizer.check_located_text(np.array([[0, 0, 20, 40]])), 'too_few_digits')
+        self.assertEqual(recognizer.check_located_text(np.array([[0, 0, 20, 40], [30, 0, 20, 10]])),
+                         'inconsistent_digit_heights')
+        self.assertIsNone(recognizer.check_located_text(np.array([[0, 0, 20, 40], [30, 0, 20, 30]])))
+        self.assertRaises(ValueError, CowTagRecognizer, min_digits=0)
+        self.assertRaises(ValueError, CowTagRecognizer, min_height_ratio=1.5)
+
+    def test_retry_low_confidence(self):
+        """
+        Prueba que un crotal con baja confianza se actualice con la primera hipótesis confiable, probando las hipótesis
+        siempre en el mismo orden, y que al agotar el tiempo no se prueben las restantes y el crotal se marque
+        """
+        recognizer = CowTagRecognizer(retry_threshold=0.8, retry_budget_seconds=0.2)
+        rectangles = np.array([[0, 0, 20, 40], [30, 0, 20, 40]])
+        tried_thresholds = []
+
+        def recognize_hypothesis(text_locator, _):
+            tried_thresholds.append(text_locator.thresholding_threshold)
+            if text_locator.thresholding_threshold == 60:
+                return '12', rectangles, 0.9, None
+            time.sleep(0.05)
+            return '1', rectangles, 0.5, None
+
+        tag = CowTag(np.zeros((50, 50), np.uint8))
+        tag.set_detection('1', rectangles, confidence=0.3)
+        with mock.patch.object(CowTagRecognizer, '_CowTagRecognizer__recognize_hypothesis',
+                               side_effect=recognize_hypothesis):
+            self.assertTrue(recognizer.needs_retry(tag))
+            recognizer.retry_detection(tag)
+            self.assertEqual((tag.digits, tag.confidence, tag.retry_truncated), ('12', 0.9, False))
+            self.assertEqual(tried_thresholds, [15, 60])
+
+            tag = CowTag(np.zeros((50, 50), np.uint8))
+            tag.set_detection('1', rectangles, confidence=0.3)
+            recognizer.retry_budget_seconds = 0.01
+            recognizer.retry_detection(tag)
+            self.assertEqual((tag.digits, tag.confidence, tag.retry_truncated), ('1', 0.5, True))
+            self.assertEqual(tried_thresholds, [15, 60, 15])
+
+        tag.set_detection('12', rectangles, confidence=0.9)
+        self.assertFalse(recognizer.needs_retry(tag))
+        tag.set_detection('', np.empty((0, 4), np.int32), confidence=0.0, rejection_reason='no_digits')
+        self.assertFalse(recognizer.needs_retry(tag))
+        self.assertFalse(CowTagRecognizer().needs_retry(tag))
+        self.assertIn('retry_hypotheses', recognizer.get_configuration())
+        self.assertRaises(ValueError, CowTagRecognizer, retry_threshold=0)
+        self.assertRaises(ValueError, CowTagRecognizer, retry_threshold=0.5, retry_budget_seconds=0)
+
+    def test_truncated_retry_not_cached(self):
+        """Prueba que no se almacenen en la caché los crotales cuyos reintentos se han interrumpido por el tiempo"""
+        tag_recognizer = TagBatchRecognizer(recognizer_type=2, retry_threshold=1.0, cache=TagResultCache())
+        image_path = str(self.valid_images[0]['path'])
+
+        def retry_detection(tag):
+            tag.retry_truncated = True
+
+        with mock.patch.object(tag_recognizer.recognizer, 'retry_detection', side_effect=retry_detection):
+            tag_recognizer.recognize_image(image_path)
+            self.assertFalse(tag_recognizer.recognize_image(image_path).cache_hit)
+
+    def test_grayscale_decoding(self):
+        """Prueba que decodificar directamente en escala de grises produzca el mismo resultado que en color"""
+        for test_dict in self.valid_images:
+            color_image = cv2.imread(str(test_dict['path']), cv2.IMREAD_COLOR)
+            gray_image = cv2.imread(str(test_dict['path']), cv2.IMREAD_GRAYSCALE)
+            color_tag = self.tag_recognizer.recognizer.recognize_image(color_image)
+            gray_tag = self.tag_recognizer.recognizer.recognize_image(gray_image)
+
+            self.assertIsNone(gray_tag.image)
+            self.assertEqual(color_tag.get_detection(), gray_tag.get_detection())
+
     def test_correct_image_path(self):
         """
         Prueba de una serie de rutas a imágenes correctas, se comprueba el resultado frente al definido en la prueba
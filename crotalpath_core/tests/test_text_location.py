@@ -0,0 +1,123 @@
+"""Conjuntos de prueba para los detectores de texto"""
+from pathlib import Path
+
+import unittest
+import cv2
+import numpy as np
+
+from crotalpath_core.tagrecognition.text_location import LargestTextLocator
+
+
+def reference_locate_largest_text(image: np.array, digit_difference_threshold: float) -> np.array:
+    """
+    Implementación original, objeto a objeto, de la localización de los caracteres de mayor tamaño
+
+    :param image: imagen en blanco y negro siendo los caracteres los elementos de mayor tamaño
+    :param digit_difference_threshold: ratio de diferencia entre los digitos a localizar
+    :return: un numpy array con los rectángulos que engloban a los caracteres candidatos
+    """
+    image_objects_contour, _ = cv2.findContours(~image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    binary_image = ~image / 255
+
+    object_enclosing_rect = [cv2.boundingRect(contour) for contour in image_objects_contour]
+    object_areas = [np.sum(binary_image[y:y + h, x:x + w]) for x, y, w, h in object_enclosing_rect]
+
+    max_object_area = np.max(object_areas)
+    biggest_object_enclosing_rect = object_enclosing_rect[np.argmax(object_areas)]
+
+    normalized_object_areas = (object_areas - np.min(object_areas)) / (max_object_area - np.min(object_areas))
+    digit_candidate_index = normalized_object_areas > digit_difference_threshold
+
+    digit_enclosing_rects = []
+    for digit_enclosing_rect in np.array(object_enclosing_rect)[digit_candidate_index]:
+        if abs(digit_enclosing_rect[1] - biggest_object_enclosing_rect[1]) < biggest_object_enclosing_rect[3] / 3:
+            digit_enclosing_rects.append(digit_enclosing_rect)
+
+    return np.array(digit_enclosing_rects)
+
+
+class LargestTextLocatorTest(unittest.TestCase):
+    """Realiza las pruebas a la clase LargestTextLocator"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Obtiene las rutas de las imágenes de prueba e inicializa el detector de texto"""
+        cls.images_path = sorted((Path(__file__).parent / 'dataset' / 'TestSamples').glob('*.TIF'))
+        cls.text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+
+    def test_enclosing_rectangles_match_reference(self):
+        """Prueba que los rectángulos localizados sean idénticos a los de la implementación original en el dataset"""
+        self.assertGreater(len(self.images_path), 0)
+
+        for image_path in self.images_path:
+            image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+            # Invalid images
+            if image is None:
+                continue
+
+            enclosing_rectangles, digits_only_image = self.text_locator.locate_text(image)
+            expected_rectangles = reference_locate_largest_text(digits_only_image,
+                                                                self.text_locator.digit_difference_threshold)
+
+            np.testing.assert_array_equal(enclosing_rectangles.reshape(-1, 4), expected_rectangles.reshape(-1, 4),
+                                          err_msg=str(image_path))
+
+    def test_incorrect_roi_scale(self):
+        """Prueba de inicialización con una escala de región de interés fuera del rango (0, 1)"""
+        self.assertRaises(ValueError, LargestTextLocator, thresholding_threshold=30, noise_size=5,
+                          digit_difference_threshold=0.3, roi_scale=1.5)
+
+    def test_roi_locates_full_resolution_digits(self):
+        """
+        Prueba que con la región de interés los dígitos se localicen, en coordenadas de la imagen completa, en la
+        misma posición que procesando la imagen completa
+        """
+        roi_text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3,
+                                              roi_scale=0.25)
+        image = cv2.imread(str(self.images_path[0]), cv2.IMREAD_GRAYSCALE)
+
+        enclosing_rectangles, digits_only_image = roi_text_locator.locate_text(image)
+        expected_rectangles, _ = self.text_locator.locate_text(image)
+
+        self.assertEqual(digits_only_image.shape, image.shape)
+        self.assertEqual(len(enclosing_rectangles), len(expected_rectangles))
+        np.testing.assert_allclose(np.sort(enclosing_rectangles, axis=0), np.sort(expected_rectangles, axis=0),
+                                   atol=3)
+
+    def test_roi_structuring_element(self):
+        """Prueba que el elemento estructurante de la imagen reducida no sea menor de 3x3"""
+        for roi_scale, expected_size in ((0.1, 3), (0.25, 3), (0.8, 4)):
+            roi_text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5,
+                                                  digit_difference_threshold=0.3, roi_scale=roi_scale)
+            self.assertEqual(roi_text_locator.roi_structuring_element.shape, (expected_size, expected_size))
+
+    def test_roi_reused_canvas(self):
+        """
+        Prueba que al reutilizar la imagen postprocesada entre imágenes la zona fuera de la región de la imagen actual
+        quede en blanco
+        """
+        roi_text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3,
+                                              roi_scale=0.25)
+        for image_path in self.images_path[:4]:
+            image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+            _, digits_only_image = roi_text_locator.locate_text(image)
+            left, top, right, bottom = roi_text_locator.roi_canvas_region[1]
+
+            outside_region = np.ones(image.shape, bool)
+            outside_region[top:bottom, left:right] = False
+            self.assertTrue(np.all(digits_only_image[outside_region] == 255), msg=str(image_path))
+
+    def test_roi_falls_back_to_full_image(self):
+        """Prueba que si no se localiza ningún carácter en la imagen reducida se procese la imagen completa"""
+        roi_text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3,
+                                              roi_scale=0.25)
+        image = np.zeros((480, 640), np.uint8)
+
+        enclosing_rectangles, digits_only_image = roi_text_locator.locate_text(image)
+
+        self.assertEqual(enclosing_rectangles.shape, (0, 4))
+        self.assertEqual(digits_only_image.shape, image.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
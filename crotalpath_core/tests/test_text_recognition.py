@@ -0,0 +1,206 @@
+"""Conjuntos de prueba para los reconocedores de texto"""
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from crotalpath_core.tagrecognition import text_recognition
+from crotalpath_core.tagrecognition.digit_classifier import KNearestDigitClassifier, compute_features, extract_glyphs
+from crotalpath_core.tagrecognition.text_location import LargestTextLocator
+from crotalpath_core.tagrecognition.text_recognition import ClassicOCR, DigitClassifierOCR
+
+
+class ClassicOCRTest(unittest.TestCase):
+    """Realiza las pruebas a la clase ClassicOCR"""
+
+    def test_incorrect_engine(self):
+        """Prueba de inicialización con un motor inexistente"""
+        self.assertRaises(ValueError, ClassicOCR, image_width=600, image_height=300, engine='unknown')
+
+    def test_engine_fallback(self):
+        """Prueba que sin tesserocr instalado se use pytesseract y que no se pueda solicitar tesserocr"""
+        with mock.patch.object(text_recognition, 'tesserocr', None):
+            ocr = ClassicOCR(image_width=600, image_height=300)
+            self.assertEqual(ocr.engine, 'pytesseract')
+            self.assertRaises(ImportError, ClassicOCR, image_width=600, image_height=300, engine='tesserocr')
+
+    def test_engine_not_serialized(self):
+        """Prueba que la instancia de Tesseract no se serialice al enviar el reconocedor a otro proceso"""
+        ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract')
+        ocr.tesseract_api = object()
+        self.assertIsNone(pickle.loads(pickle.dumps(ocr)).tesseract_api)
+
+    def test_batch_recognition(self):
+        """
+        Prueba que al reconocer un conjunto de imágenes con pytesseract se ejecute Tesseract una vez por grupo y que
+        cada palabra se asigne a la imagen de su fila
+        """
+        ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract', batch_size=3)
+        self.assertEqual(ocr.batch_config, '--psm 6 --oem 0 -c tessedit_char_whitelist=0123456789')
+
+        def tesseract_data(words):
+            rows = ['level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext']
+            rows += ['5\t1\t1\t1\t1\t1\t{}\t{}\t40\t60\t90\t{}'.format(left, top, text) for left, top, text in words]
+            return '\n'.join(rows)
+
+        # Las filas apiladas empiezan en 0, 100 y 220 en el primer grupo y en 0 en el segundo
+        image_to_data = mock.Mock(side_effect=[
+            tesseract_data([(300, 10, '88'), (50, 12, '02'), (50, 110, '9926'), (50, 230, ' 7383')]),
+            tesseract_data([(50, 20, '0054')])])
+        spaced_digits_images = [np.full((100, 400), 255, np.uint8), np.full((120, 500), 255, np.uint8),
+                                np.full((90, 450), 255, np.uint8), np.full((100, 350), 255, np.uint8)]
+
+        with mock.patch.object(text_recognition.pytesseract, 'image_to_data', image_to_data), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__align_characters', side_effect=lambda image, _: image), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__separate_characters', side_effect=lambda image: image):
+            recognized_texts = ocr.recognize_texts(spaced_digits_images, [None] * 4)
+
+        self.assertEqual(image_to_data.call_count, 2)
+        self.assertEqual(image_to_data.call_args[1]['config'], ocr.batch_config)
+        self.assertEqual(image_to_data.call_args_list[0][0][0].shape, (310, 500))
+        self.assertEqual(recognized_texts, ['0288', '9926', '7383', '0054'])
+
+    def test_batch_fallback(self):
+        """
+        Prueba que una imagen cuya fila no tiene tantos dígitos como rectángulos se reconozca de nuevo por separado con
+        la configuración original
+        """
+        ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract', batch_size=3)
+        image_to_data = mock.Mock(return_value='\n'.join([
+            'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext',
+            '5\t1\t1\t1\t1\t1\t50\t10\t40\t60\t90\t0288',
+            '5\t1\t1\t1\t1\t1\t50\t110\t40\t60\t90\t992']))
+        image_to_string = mock.Mock(return_value='9 9 2 6')
+        spaced_digits_images = [np.full((100, 400), 255, np.uint8), np.full((100, 400), 0, np.uint8),
+                                np.full((100, 400), 255, np.uint8)]
+        enclosing_rectangles = [np.zeros((4, 4), np.int32), np.zeros((4, 4), np.int32), None]
+
+        with mock.patch.object(text_recognition.pytesseract, 'image_to_data', image_to_data), \
+                mock.patch.object(text_recognition.pytesseract, 'image_to_string', image_to_string), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__align_characters', side_effect=lambda image, _: image), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__separate_characters', side_effect=lambda image: image):
+            recognized_texts = ocr.recognize_texts(spaced_digits_images, enclosing_rectangles)
+
+        self.assertEqual(recognized_texts, ['0288', '9926', ''])
+        self.assertEqual(image_to_string.call_count, 1)
+        self.assertEqual(image_to_string.call_args[1]['config'], ocr.config)
+        self.assertEqual(image_to_string.call_args[0][0].min(), 0)
+
+    def test_recognition_confidence(self):
+        """
+        Prueba que sin solicitar la confianza el texto se obtenga de image_to_string, que al solicitarla el texto y la
+        confianza, media de la de las palabras, se obtengan de una única ejecución de image_to_data y que sin
+        rectángulos no se ejecute Tesseract
+        """
+        image_to_string = mock.Mock(return_value='02 88\n')
+        image_to_data = mock.Mock(return_value='\n'.join([
+            'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext',
+            '4\t1\t1\t1\t1\t0\t0\t0\t400\t60\t-1\t',
+            '5\t1\t1\t1\t1\t1\t200\t0\t40\t60\t60\t88',
+            '5\t1\t1\t1\t1\t2\t10\t0\t40\t60\t90\t02']))
+
+        with mock.patch.object(text_recognition.pytesseract, 'image_to_string', image_to_string), \
+                mock.patch.object(text_recognition.pytesseract, 'image_to_data', image_to_data), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__align_characters', side_effect=lambda image, _: image), \
+                mock.patch.object(ClassicOCR, '_ClassicOCR__separate_characters', side_effect=lambda image: image):
+            ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract')
+            self.assertEqual(ocr.recognize_text_with_confidence(np.full((100, 400), 255, np.uint8), None),
+                             ('0288', None))
+            self.assertEqual((image_to_string.call_count, image_to_data.call_count), (1, 0))
+
+            ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract', confidence=True)
+            digits, confidence = ocr.recognize_text_with_confidence(np.full((100, 400), 255, np.uint8), None)
+            self.assertEqual(ocr.recognize_text_with_confidence(np.full((100, 400), 255, np.uint8),
+                                                                np.empty((0, 4), np.int32)), ('', 0.0))
+            self.assertEqual((image_to_string.call_count, image_to_data.call_count), (1, 1))
+
+        self.assertEqual(digits, '0288')
+        self.assertAlmostEqual(confidence, 0.75)
+
+    def test_confidence_same_digits(self):
+        """
+        Prueba, con Tesseract instalado, que los dígitos leídos de image_to_data al solicitar la confianza coincidan
+        con los de image_to_string en las imágenes del conjunto de prueba
+        """
+        try:
+            text_recognition.pytesseract.get_tesseract_version()
+        except EnvironmentError:
+            self.skipTest('Tesseract is not installed')
+
+        text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+        ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract')
+        confidence_ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract', confidence=True)
+        images_path = sorted((Path(__file__).parent / 'dataset' / 'TestSamples').glob('*.TIF'))
+        for image_path in images_path:
+            image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                continue
+            enclosing_rectangles, digits_only_image = text_locator.locate_text(image)
+            if len(enclosing_rectangles) == 0:
+                continue
+            self.assertEqual(confidence_ocr.recognize_text(digits_only_image, enclosing_rectangles),
+                             ocr.recognize_text(digits_only_image, enclosing_rectangles), msg=str(image_path))
+
+
+class DigitClassifierOCRTest(unittest.TestCase):
+    """Realiza las pruebas a la clase DigitClassifierOCR y a su clasificador de dígitos"""
+
+    def test_recognize_validation_images(self):
+        """Prueba el reconocimiento de imágenes de validación, no usadas al entrenar el modelo por defecto"""
+        text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+        located_texts = [text_locator.locate_text(cv2.imread(
+            str(Path(__file__).parent / 'dataset' / 'TestSamples' / image_name), cv2.IMREAD_GRAYSCALE))[::-1]
+            for image_name in ('0001.TIF', '0006.TIF', '0016.TIF')]
+
+        ocr = DigitClassifierOCR()
+        self.assertEqual([ocr.recognize_text(*located_text) for located_text in located_texts],
+                         ['0288', '4831', '0053'])
+        self.assertEqual(ocr.recognize_texts(*zip(*located_texts)), ['0288', '4831', '0053'])
+        for _, confidence in ocr.recognize_texts_with_confidence(*zip(*located_texts)):
+            self.assertGreater(confidence, 0.5)
+            self.assertLessEqual(confidence, 1)
+
+    def test_no_digits(self):
+        """Prueba que una imagen sin dígitos localizados no tenga texto"""
+        ocr = DigitClassifierOCR()
+        self.assertEqual(ocr.recognize_text_with_confidence(np.full((50, 50), 255, np.uint8),
+                                                            np.empty((0, 4), np.int32)), ('', 0.0))
+        self.assertEqual(ocr.recognize_texts([], []), [])
+
+    def test_batched_features(self):
+        """Prueba que los descriptores calculados de una vez coincidan con los calculados dígito a dígito"""
+        image = np.full((60, 200), 255, np.uint8)
+        cv2.putText(image, '1907', (5, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.8, 0, 4)
+        contours, _ = cv2.findContours(cv2.bitwise_not(image), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        glyphs = extract_glyphs(image, np.array([cv2.boundingRect(contour) for contour in contours]))
+
+        np.testing.assert_allclose(compute_features(glyphs),
+                                   np.concatenate([compute_features(glyph[np.newaxis]) for glyph in glyphs]),
+                                   atol=1e-6)
+
+    def test_save_and_load(self):
+        """Prueba que el clasificador guardado clasifique igual y conserve su resumen"""
+        random_generator = np.random.RandomState(0)
+        features = random_generator.rand(30, 8).astype(np.float16).astype(np.float32)
+        classifier = KNearestDigitClassifier(features, np.arange(30) % 10, k=1)
+
+        with tempfile.TemporaryDirectory() as temporary_folder:
+            model_path = str(Path(temporary_folder) / 'model.npz')
+            classifier.save(model_path)
+            loaded_classifier = KNearestDigitClassifier.load(model_path)
+
+        np.testing.assert_array_equal(loaded_classifier.predict(features), np.arange(30) % 10)
+        self.assertEqual(loaded_classifier.get_fingerprint(), classifier.get_fingerprint())
+
+    def test_incorrect_classifier(self):
+        """Prueba la creación de un clasificador sin una etiqueta por descriptor o con un número de vecinos inválido"""
+        self.assertRaises(ValueError, KNearestDigitClassifier, np.zeros((3, 4)), np.zeros(2))
+        self.assertRaises(ValueError, KNearestDigitClassifier, np.zeros((3, 4)), np.zeros(3), k=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Conjuntos de prueba para la carga de imágenes TIFF proyectadas en memoria"""
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from crotalpath_core.tagrecognition.tiff_loader import map_uncompressed_tiff, read_image
+
+
+class TiffLoaderTest(unittest.TestCase):
+    """Realiza las pruebas a la carga de imágenes TIFF"""
+
+    def setUp(self):
+        """Crea una carpeta temporal con una imagen en escala de grises y otra en color sin comprimir"""
+        self.temporary_folder = tempfile.TemporaryDirectory()
+        random_generator = np.random.RandomState(0)
+        self.gray_image = random_generator.randint(0, 256, (301, 403), np.uint8)
+        self.color_image = random_generator.randint(0, 256, (301, 403, 3), np.uint8)
+
+        self.gray_image_path = str(Path(self.temporary_folder.name) / 'gray.tif')
+        self.color_image_path = str(Path(self.temporary_folder.name) / 'color.tif')
+        cv2.imwrite(self.gray_image_path, self.gray_image, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+        cv2.imwrite(self.color_image_path, self.color_image, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+
+    def tearDown(self):
+        """Elimina la carpeta temporal"""
+        self.temporary_folder.cleanup()
+
+    def test_uncompressed_gray_image_is_mapped(self):
+        """Prueba que una imagen en escala de grises sin comprimir se proyecte en memoria sin copiarse"""
+        image = read_image(self.gray_image_path, cv2.IMREAD_GRAYSCALE)
+
+        np.testing.assert_array_equal(image, self.gray_image)
+        self.assertFalse(image.flags.owndata)
+        self.assertFalse(image.flags.writeable)
+
+    def test_uncompressed_color_image(self):
+        """Prueba que una imagen en color sin comprimir se lea como con OpenCV en color y en escala de grises"""
+        self.assertEqual(map_uncompressed_tiff(self.color_image_path).shape, (301, 403, 3))
+        np.testing.assert_array_equal(read_image(self.color_image_path, cv2.IMREAD_COLOR), self.color_image)
+        # El decodificador de OpenCV redondea la conversión a escala de grises de otra forma
+        np.testing.assert_allclose(read_image(self.color_image_path, cv2.IMREAD_GRAYSCALE),
+                                   cv2.imread(self.color_image_path, cv2.IMREAD_GRAYSCALE), atol=1)
+
+    def test_compressed_image_fallback(self):
+        """Prueba que las imágenes comprimidas del dataset se lean con OpenCV"""
+        image_path = str(Path(__file__).parent / 'dataset' / 'TestSamples' / '0001.TIF')
+
+        self.assertIsNone(map_uncompressed_tiff(image_path))
+        np.testing.assert_array_equal(read_image(image_path, cv2.IMREAD_GRAYSCALE),
+                                      cv2.imread(image_path, cv2.IMREAD_GRAYSCALE))
+
+    def test_not_tiff_image(self):
+        """Prueba que los ficheros que no son TIFF no se proyecten y los que no existen devuelvan None"""
+        image_path = str(Path(self.temporary_folder.name) / 'image.png')
+        cv2.imwrite(image_path, self.gray_image)
+
+        self.assertIsNone(map_uncompressed_tiff(image_path))
+        np.testing.assert_array_equal(read_image(image_path, cv2.IMREAD_GRAYSCALE), self.gray_image)
+        self.assertIsNone(read_image(str(Path(self.temporary_folder.name) / 'missing.tif'), cv2.IMREAD_GRAYSCALE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Conjuntos de prueba para la lectura de vídeos y la votación de los crotales leídos en sus fotogramas"""
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from crotalpath_core.tagrecognition.video_stream import FrameDeduplicator, TagTrackVoter, VideoFrame, \
+    VideoFrameReader, vote_digits
+
+
+class VideoStreamTest(unittest.TestCase):
+    """Realiza las pruebas a la lectura de vídeos, al descarte de fotogramas repetidos y a la votación"""
+
+    def setUp(self):
+        """Escribe un vídeo con dos animales, cada uno durante cuatro fotogramas seguidos de doce vacíos"""
+        self.temporary_folder = tempfile.TemporaryDirectory()
+        self.video_path = self.write_video('gate.avi', gap_frames=12)
+
+    def write_video(self, video_name: str, gap_frames: int) -> str:
+        """
+        Escribe en la carpeta temporal un vídeo con dos animales, cada uno durante cuatro fotogramas seguidos de
+        gap_frames vacíos
+
+        :returns: ruta del vídeo
+        """
+        video_path = str(Path(self.temporary_folder.name) / video_name)
+        dataset_path = Path(__file__).parent / 'dataset' / 'TestSamples'
+
+        video_writer = None
+        for image_name in ('0001.TIF', '0006.TIF'):
+            image = cv2.imread(str(dataset_path / image_name), cv2.IMREAD_COLOR)
+            if video_writer is None:
+                video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 25,
+                                               (image.shape[1], image.shape[0]))
+            for shift in (12, 8, 4, 0):
+                video_writer.write(cv2.warpAffine(image, np.float32([[1, 0, shift], [0, 1, 0]]),
+                                                  (image.shape[1], image.shape[0]), borderMode=cv2.BORDER_REPLICATE))
+            for _ in range(gap_frames):
+                video_writer.write(np.full_like(image, 20))
+        video_writer.release()
+        return video_path
+
+    def tearDown(self):
+        """Elimina la carpeta temporal"""
+        self.temporary_folder.cleanup()
+
+    def test_read_frames(self):
+        """Prueba la lectura de uno de cada varios fotogramas en escala de grises y el error con una fuente inválida"""
+        with VideoFrameReader(self.video_path, frame_step=3) as video_frames:
+            frames = list(video_frames)
+
+        self.assertEqual([frame.index for frame in frames], list(range(0, 32, 3)))
+        self.assertEqual(frames[0].image.ndim, 2)
+        self.assertAlmostEqual(frames[1].timestamp_ms, 120, delta=1)
+        self.assertRaises(OSError, VideoFrameReader, str(Path(self.temporary_folder.name) / 'missing.avi'))
+        self.assertRaises(ValueError, VideoFrameReader, self.video_path, frame_step=0)
+
+    def test_duplicate_frames(self):
+        """Prueba que solo se descarten los fotogramas casi iguales al último no repetido"""
+        deduplicator = FrameDeduplicator(threshold=2.0)
+        image = np.random.RandomState(0).randint(0, 256, (120, 160), np.uint8)
+
+        self.assertFalse(deduplicator.is_duplicate(image))
+        self.assertTrue(deduplicator.is_duplicate(cv2.add(image, 1)))
+        self.assertFalse(deduplicator.is_duplicate(cv2.flip(image, 1)))
+        self.assertTrue(deduplicator.is_duplicate(cv2.cvtColor(cv2.flip(image, 1), cv2.COLOR_GRAY2BGR)))
+
+    def test_vote_digits(self):
+        """Prueba que se vote primero el número de dígitos y después cada dígito, ponderados por la confianza"""
+        digits, agreement = vote_digits([('1234', 0.9), ('1284', 0.3), ('123', 0.5), ('1294', 0.4)])
+
+        self.assertEqual(digits, '1234')
+        self.assertAlmostEqual(agreement, (3 + 0.9 / 1.6) / 4)
+        self.assertEqual(vote_digits([('12', None), ('13', 0.0), ('13', 0.0)])[0], '12')
+
+    def test_track_voter(self):
+        """
+        Prueba que un paso termine tras el hueco máximo sin lecturas, que las lecturas repetidas no voten y que se
+        descarten los pasos con pocas lecturas
+        """
+        voter = TagTrackVoter(max_gap_frames=2, min_readings=2)
+        readings = [('1234', 0.5, False), ('1284', 0.9, False), ('1284', 0.9, True), ('1284', 0.9, True),
+                    ('1234', 0.6, False), (None, None, False), (None, None, False), ('', 0.0, False),
+                    ('999', 0.9, False), (None, None, False), (None, None, False), (None, None, False)]
+        tracks = [voter.add_reading(VideoFrame(index, index * 40.0, None), digits, confidence, repeated)
+                  for index, (digits, confidence, repeated) in enumerate(readings)]
+
+        self.assertEqual([track for track in tracks if track is not None],
+                         [{'digits': '1234', 'confidence': 0.887, 'readings': 5, 'votes': 3, 'first_frame': 0,
+                           'last_frame': 4, 'start_ms': 0.0, 'end_ms': 160.0}])
+        self.assertIsNone(voter.finish_track())
+        self.assertRaises(ValueError, TagTrackVoter, min_readings=0)
+        self.assertRaises(ValueError, TagTrackVoter, split_confidence=1.5)
+
+    def test_back_to_back_tracks(self):
+        """
+        Prueba que una lectura confiada que difiere en la mayoría de dígitos del número votado comience otro paso sin
+        fotogramas vacíos entre ambos, y que no lo hagan las lecturas poco confiadas o que difieren en pocos dígitos
+        """
+        readings = [('1234', 0.9), ('1284', 0.95), ('5678', 0.5), ('1234', 0.9), ('5678', 0.9), ('567', 0.9),
+                    ('5678', 0.9)]
+        voter = TagTrackVoter(max_gap_frames=10, min_readings=2)
+        tracks = [voter.add_reading(VideoFrame(index, index * 40.0, None), digits, confidence)
+                  for index, (digits, confidence) in enumerate(readings)] + [voter.finish_track()]
+
+        self.assertEqual([(track['digits'], track['first_frame'], track['last_frame'])
+                          for track in tracks if track is not None], [('1234', 0, 3), ('5678', 4, 6)])
+
+        voter = TagTrackVoter(max_gap_frames=10, min_readings=2, split_confidence=None)
+        tracks = [voter.add_reading(VideoFrame(index, index * 40.0, None), digits, confidence)
+                  for index, (digits, confidence) in enumerate(readings)] + [voter.finish_track()]
+        self.assertEqual(len([track for track in tracks if track is not None]), 1)
+
+    def test_recognize_video(self):
+        """Prueba que cada animal del vídeo se devuelva una vez con su número votado, con uno y con varios procesos"""
+        for workers in (1, 2):
+            tag_recognizer = TagBatchRecognizer(recognizer_type=2, workers=workers, ocr_batch_size=2)
+            tracks = list(tag_recognizer.recognize_video(self.video_path, max_gap_frames=5))
+
+            self.assertEqual([track['digits'] for track in tracks], ['0288', '4831'])
+            self.assertEqual([track['identifier'] for track in tracks],
+                             ['{}#0'.format(self.video_path), '{}#16'.format(self.video_path)])
+            self.assertEqual(tag_recognizer.video_statistics['frames'], 32)
+            self.assertEqual(tag_recognizer.video_statistics['tracks'], 2)
+            self.assertGreater(tag_recognizer.video_statistics['duplicate_frames'], 0)
+
+    def test_recognize_back_to_back_video(self):
+        """Prueba que dos animales sin fotogramas vacíos entre ellos se devuelvan como dos pasos"""
+        video_path = self.write_video('back_to_back.avi', gap_frames=0)
+        tracks = list(TagBatchRecognizer(recognizer_type=2).recognize_video(video_path))
+
+        self.assertEqual([(track['digits'], track['first_frame']) for track in tracks], [('0288', 0), ('4831', 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
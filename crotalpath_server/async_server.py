@@ -0,0 +1,342 @@
+"""Servidor web asíncrono con el mismo contrato que web_server, las subidas se escriben en disco por fragmentos"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiohttp import web
+from werkzeug.utils import secure_filename
+
+from crotalpath_core.tagrecognition.result_store import TagResultStore
+from crotalpath_server.direct_recognition import DirectRecognizerPool, UndecodableImageError
+from crotalpath_server.job_store import JobStore, new_job_id
+from crotalpath_server.recognition_pool import RecognitionPool, QueueFullError, progress_file_path, \
+    requeue_unfinished_tasks
+
+TASK_FOLDER = Path(__file__).absolute().parent / 'pending_tasks'
+TAG_RESULT_FOLDER = Path(__file__).absolute().parent / 'tag_results'
+JOB_STORE_PATH = os.environ.get('CROTALPATH_JOB_DB', Path(__file__).absolute().parent / 'jobs.sqlite3')
+RESULT_STORE_PATH = os.environ.get('CROTALPATH_RESULTS_DB', Path(__file__).absolute().parent / 'tag_results.sqlite3')
+STATIC_CONTENT_FOLDER = Path(__file__).absolute().parent.parent / 'crotalpath_web_app'
+RECOGNITION_WORKERS = int(os.environ.get('CROTALPATH_WORKERS', os.cpu_count() or 1))
+MAX_QUEUED_TASKS = int(os.environ.get('CROTALPATH_MAX_QUEUED_TASKS', 32))
+RESULT_CACHE_FOLDER = os.environ.get('CROTALPATH_CACHE_DIR')
+DIRECT_RECOGNIZERS = int(os.environ.get('CROTALPATH_DIRECT_RECOGNIZERS', os.cpu_count() or 1))
+FILE_IO_THREADS = int(os.environ.get('CROTALPATH_FILE_IO_THREADS', 8))
+MAX_LOOKUP_RESULTS = 100
+RETRY_AFTER_SECONDS = 5
+UPLOAD_CHUNK_BYTES = 256 * 1024
+MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+MAX_DIRECT_UPLOAD_BYTES = 32 * 1024 * 1024
+EVENTS_PROGRESS_INTERVAL_SECONDS = 0.25
+EVENTS_KEEP_ALIVE_SECONDS = 15
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(Exception):
+    """Excepción lanzada cuando un cuerpo leído por fragmentos supera el tamaño máximo permitido"""
+
+
+def json_response(data, status=200, headers=None):
+    return web.Response(text=json.dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+def queue_full_response():
+    return json_response({'error': 'Recognition queue is full'}, status=503,
+                         headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+
+def server_sent_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data)).encode()
+
+
+def read_text_file(file_path):
+    with open(file_path, 'r') as file:
+        return file.read()
+
+
+def read_appended_bytes(file_path, offset):
+    """
+    Lee lo añadido a un fichero desde la posición indicada y devuelve los bytes leídos, vacíos si el fichero aún no
+    existe, junto a la posición tras leerlos. Así cada lectura del progreso de una tarea se hace desde un hilo sin
+    mantener el fichero abierto entre lecturas
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            file.seek(offset)
+            appended_bytes = file.read()
+    except FileNotFoundError:
+        return b'', offset
+    return appended_bytes, offset + len(appended_bytes)
+
+
+async def save_uploaded_files(request, task_folder_path):
+    """
+    Guarda en la carpeta de la tarea los ficheros del campo 'file' de un formulario multipart. Cada fichero se lee
+    por fragmentos y cada fragmento se escribe desde un hilo, de forma que ni se carga el fichero entero en memoria ni
+    se bloquea el bucle de eventos mientras se escribe en disco
+    """
+    loop = asyncio.get_event_loop()
+    file_io_executor = request.app['file_io_executor']
+    reader = await request.multipart()
+
+    while True:
+        part = await reader.next()
+        if part is None:
+            break
+
+        file_name = secure_filename(part.filename or '')
+        if part.name != 'file' or not file_name:
+            await part.release()
+            continue
+
+        file = await loop.run_in_executor(file_io_executor, open, str(task_folder_path / file_name), 'wb')
+        try:
+            while True:
+                chunk = await part.read_chunk(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                await loop.run_in_executor(file_io_executor, file.write, chunk)
+        finally:
+            await loop.run_in_executor(file_io_executor, file.close)
+
+
+async def read_limited(read_chunk, max_bytes):
+    """
+    Lee un cuerpo por fragmentos con la función recibida llevando la cuenta de los bytes leídos, de forma que un
+    cuerpo sin Content-Length, como una subida por fragmentos, no se carga entero en memoria si supera el máximo
+    """
+    chunks = []
+    read_bytes = 0
+    while True:
+        chunk = await read_chunk(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return b''.join(chunks)
+        read_bytes += len(chunk)
+        if read_bytes > max_bytes:
+            raise UploadTooLargeError()
+        chunks.append(chunk)
+
+
+def notify_task_completion(app, task_id, future):
+    loop = asyncio.get_event_loop()
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Recognition task %s failed: %s', task_id, future.exception())
+        loop.run_in_executor(app['file_io_executor'], app['job_store'].mark_failed, task_id, str(future.exception()))
+    app['running_tasks'].pop(task_id, None)
+    loop.run_in_executor(app['file_io_executor'], shutil.rmtree, str(TASK_FOLDER / task_id), True)
+
+
+def track_task(app, task_id, task):
+    task_future = asyncio.wrap_future(task)
+    app['running_tasks'][task_id] = task_future
+    task_future.add_done_callback(lambda future: notify_task_completion(app, task_id, future))
+
+
+async def handle_job_creation(request):
+    app = request.app
+    recognition_pool = app['recognition_pool']
+    if recognition_pool.is_full():
+        return queue_full_response()
+
+    loop = asyncio.get_event_loop()
+    task_id = new_job_id()
+    task_folder_path = TASK_FOLDER / task_id
+    result_file_path = TAG_RESULT_FOLDER / task_id
+    await loop.run_in_executor(app['file_io_executor'], os.mkdir, str(task_folder_path))
+
+    try:
+        await save_uploaded_files(request, task_folder_path)
+        file_names = await loop.run_in_executor(app['file_io_executor'], os.listdir, str(task_folder_path))
+        await loop.run_in_executor(app['file_io_executor'], app['job_store'].create_job, task_id, len(file_names))
+    except BaseException:
+        await loop.run_in_executor(app['file_io_executor'], shutil.rmtree, str(task_folder_path), True)
+        raise
+
+    try:
+        task = recognition_pool.submit(task_folder_path, result_file_path)
+    except QueueFullError:
+        await loop.run_in_executor(app['file_io_executor'], app['job_store'].delete_job, task_id)
+        await loop.run_in_executor(app['file_io_executor'], shutil.rmtree, str(task_folder_path))
+        return queue_full_response()
+    track_task(app, task_id, task)
+
+    return web.Response(status=202, content_type='application/text', headers={'location': 'tasks/' + task_id})
+
+
+async def handle_direct_recognition(request):
+    if request.content_length is not None and request.content_length > MAX_DIRECT_UPLOAD_BYTES:
+        return json_response({'error': 'Image is too large'}, status=413)
+
+    image_bytes = None
+    identifier = None
+    try:
+        if request.content_type.startswith('multipart/'):
+            reader = await request.multipart()
+            while True:
+                part = await reader.next()
+                if part is None:
+                    break
+                if part.name == 'file' and image_bytes is None:
+                    image_bytes = await read_limited(part.read_chunk, MAX_DIRECT_UPLOAD_BYTES)
+                    identifier = secure_filename(part.filename or '')
+                else:
+                    await part.release()
+        else:
+            image_bytes = await read_limited(request.content.read, MAX_DIRECT_UPLOAD_BYTES)
+            identifier = secure_filename(request.query.get('name', '')) or None
+    except UploadTooLargeError:
+        return json_response({'error': 'Image is too large'}, status=413)
+
+    loop = asyncio.get_event_loop()
+    try:
+        detection = await loop.run_in_executor(request.app['direct_recognition_executor'],
+                                               request.app['direct_recognizer_pool'].recognize, image_bytes, identifier)
+    except UndecodableImageError as error:
+        return json_response({'error': str(error)}, status=400)
+
+    return json_response(detection)
+
+
+async def serve_job(request):
+    task_id = secure_filename(request.match_info['task_id'])
+    loop = asyncio.get_event_loop()
+    if await loop.run_in_executor(request.app['file_io_executor'], os.path.isfile, str(TAG_RESULT_FOLDER / task_id)):
+        return json_response({}, status=303, headers={'location': '/tags/' + task_id})
+
+    job = await loop.run_in_executor(request.app['file_io_executor'], request.app['job_store'].get_job, task_id)
+    if job is None:
+        return json_response({}, status=404)
+    return json_response(job)
+
+
+async def serve_job_events(request):
+    task_id = secure_filename(request.match_info['task_id'])
+    task_future = request.app['running_tasks'].get(task_id)
+    result_file_path = TAG_RESULT_FOLDER / task_id
+    loop = asyncio.get_event_loop()
+    file_io_executor = request.app['file_io_executor']
+
+    if task_future is None and await loop.run_in_executor(
+            file_io_executor, request.app['job_store'].get_job, task_id) is None:
+        return json_response({}, status=404)
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream',
+                                           'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    await response.prepare(request)
+
+    progress_path = str(progress_file_path(result_file_path))
+    progress_offset = 0
+    pending_line = b''
+    last_event_time = time.monotonic()
+
+    while True:
+        if task_future is not None:
+            await asyncio.wait([task_future], timeout=EVENTS_PROGRESS_INTERVAL_SECONDS)
+        finished = task_future is None or task_future.done()
+
+        appended_bytes, progress_offset = await loop.run_in_executor(file_io_executor, read_appended_bytes,
+                                                                     progress_path, progress_offset)
+        *tag_lines, pending_line = (pending_line + appended_bytes).split(b'\n')
+        for tag_line in tag_lines:
+            last_event_time = time.monotonic()
+            await response.write(server_sent_event('tag', json.loads(tag_line)))
+
+        if finished:
+            if await loop.run_in_executor(file_io_executor, os.path.isfile, str(result_file_path)):
+                await response.write(server_sent_event('done', {'location': '/tags/' + task_id}))
+            else:
+                job = await loop.run_in_executor(file_io_executor, request.app['job_store'].get_job, task_id)
+                await response.write(server_sent_event('failed', {'error': None if job is None else job['error']}))
+            break
+
+        if time.monotonic() - last_event_time > EVENTS_KEEP_ALIVE_SECONDS:
+            last_event_time = time.monotonic()
+            await response.write(b': keep-alive\n\n')
+
+    return response
+
+
+async def find_tags(request):
+    digits = request.query.get('digits', '')
+    prefix = request.query.get('prefix', 'false').lower() in ('1', 'true')
+    try:
+        limit = min(int(request.query.get('limit', MAX_LOOKUP_RESULTS)), MAX_LOOKUP_RESULTS)
+    except ValueError:
+        limit = 0
+    if (not digits and not prefix) or limit < 1:
+        return json_response({'error': 'A digits query and a positive limit are required'}, status=400)
+
+    loop = asyncio.get_event_loop()
+    detections = await loop.run_in_executor(request.app['file_io_executor'], functools.partial(
+        request.app['result_store'].find_by_digits, digits, prefix=prefix, limit=limit))
+    return json_response(detections)
+
+
+async def serve_tag(request):
+    result_file_path = TAG_RESULT_FOLDER / secure_filename(request.match_info['task_id'])
+    loop = asyncio.get_event_loop()
+    try:
+        result = await loop.run_in_executor(request.app['file_io_executor'], read_text_file, str(result_file_path))
+    except (FileNotFoundError, IsADirectoryError):
+        return json_response({}, status=404)
+    return web.Response(text=result, content_type='application/json')
+
+
+async def close_executors(app):
+    await asyncio.get_event_loop().run_in_executor(None, app['recognition_pool'].shutdown)
+    app['file_io_executor'].shutdown(wait=True)
+    app['direct_recognition_executor'].shutdown(wait=True)
+
+
+async def requeue_tasks(app):
+    requeued_tasks = await asyncio.get_event_loop().run_in_executor(
+        app['file_io_executor'], requeue_unfinished_tasks, app['job_store'], app['recognition_pool'], TASK_FOLDER,
+        TAG_RESULT_FOLDER)
+    for task_id, task in requeued_tasks.items():
+        track_task(app, task_id, task)
+
+
+def create_app():
+    os.makedirs(TASK_FOLDER, exist_ok=True)
+    os.makedirs(TAG_RESULT_FOLDER, exist_ok=True)
+
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+    app['job_store'] = JobStore(JOB_STORE_PATH)
+    app['result_store'] = TagResultStore(RESULT_STORE_PATH)
+    app['recognition_pool'] = RecognitionPool(workers=RECOGNITION_WORKERS, max_queued_tasks=MAX_QUEUED_TASKS,
+                                              cache_dir=RESULT_CACHE_FOLDER, job_store_path=JOB_STORE_PATH,
+                                              result_store_path=RESULT_STORE_PATH)
+    app['file_io_executor'] = ThreadPoolExecutor(max_workers=FILE_IO_THREADS)
+    app['direct_recognizer_pool'] = DirectRecognizerPool(size=DIRECT_RECOGNIZERS)
+    app['direct_recognition_executor'] = ThreadPoolExecutor(max_workers=DIRECT_RECOGNIZERS)
+    app['running_tasks'] = {}
+    app.on_startup.append(requeue_tasks)
+    app.on_cleanup.append(close_executors)
+
+    app.router.add_post('/tasks', handle_job_creation)
+    app.router.add_post('/recognize', handle_direct_recognition)
+    app.router.add_get('/tasks/{task_id}/events', serve_job_events)
+    app.router.add_get('/tasks/{task_id}', serve_job)
+    app.router.add_get('/tags', find_tags)
+    app.router.add_get('/tags/{task_id}', serve_tag)
+    app.router.add_static('/', STATIC_CONTENT_FOLDER)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default='0.0.0.0', help='Address to listen on.')
+    parser.add_argument("--port", type=int, default=5000, help='Port to listen on, 5000 by default.')
+    kwargs = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), host=kwargs.host, port=kwargs.port)
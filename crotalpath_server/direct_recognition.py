@@ -0,0 +1,59 @@
+"""Reconocimiento síncrono de una imagen recibida en memoria, sin pasar por disco ni por la cola de tareas"""
+import queue
+
+import cv2
+import numpy as np
+
+from crotalpath_core.__main__ import RECOGNIZER_TYPES
+
+
+class UndecodableImageError(ValueError):
+    """Excepción que indica que los bytes recibidos no son una imagen válida"""
+
+
+class DirectRecognizerPool:
+    """Conjunto de reconocedores ya creados que se reutilizan entre peticiones, cada uno usado por un hilo a la vez"""
+
+    def __init__(self, size: int, recognizer_type: int = 1):
+        """
+        Crea los reconocedores del conjunto
+
+        :param size: número de reconocimientos que se pueden realizar a la vez
+        :param recognizer_type: identificador del tipo de reconocedor de crotales a usar
+        :raises ValueError: si el tamaño es menor que 1 o el tipo de reconocedor no existe
+        """
+        if size < 1:
+            raise ValueError('Number of recognizers must be at least 1')
+        if recognizer_type not in RECOGNIZER_TYPES:
+            raise ValueError('Recognizer type not available')
+
+        self.size = size
+        self.recognizers = queue.Queue()
+        for _ in range(size):
+            self.recognizers.put(RECOGNIZER_TYPES[recognizer_type]['recognizer']())
+
+    def recognize(self, image_bytes: bytes, identifier: str = None) -> dict:
+        """
+        Decodifica en memoria una imagen y reconoce su crotal, esperando a que quede libre un reconocedor si todos
+        están en uso
+
+        :param image_bytes: contenido del fichero de la imagen
+        :param identifier: identificador con el que devolver el crotal, normalmente el nombre del fichero
+        :returns: diccionario con la descripción del crotal devuelta por get_detection
+        :raises UndecodableImageError: si los bytes recibidos no se pueden decodificar como imagen
+        """
+        image = None
+        if image_bytes:
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise UndecodableImageError('Image could not be decoded')
+
+        recognizer = self.recognizers.get()
+        try:
+            tag = recognizer.recognize_image(image)
+        finally:
+            self.recognizers.put(recognizer)
+
+        tag.identifier = identifier
+        tag.release_images()
+        return tag.get_detection()
@@ -0,0 +1,146 @@
+"""Almacén persistente de las tareas de reconocimiento del servidor web, en una base de datos SQLite"""
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    total_images INTEGER NOT NULL,
+    processed_images INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs (created_at) WHERE state IN ('queued', 'running');
+'''
+
+
+def new_job_id() -> str:
+    """
+    Genera el identificador de una nueva tarea
+
+    :returns: identificador aleatorio de 32 caracteres hexadecimales, sin necesidad de consultar los ya existentes
+    """
+    return uuid.uuid4().hex
+
+
+class JobStore:
+    """
+    Almacén de tareas compartido por los hilos del servidor y los procesos de reconocimiento. La base de datos usa el
+    modo WAL, de forma que las consultas no esperan a las escrituras, y cada escritura es una transacción de una sola
+    fila. Cada hilo usa su propia conexión
+    """
+
+    def __init__(self, database_path: str, busy_timeout_seconds: float = 30):
+        """
+        Abre, creándola si no existe, la base de datos de tareas
+
+        :param database_path: ruta del fichero de la base de datos
+        :param busy_timeout_seconds: tiempo máximo de espera a que otra conexión termine de escribir
+        """
+        self.database_path = str(database_path)
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self.local = threading.local()
+        self.__connection().executescript(_SCHEMA)
+
+    def __getstate__(self) -> dict:
+        """Excluye las conexiones al serializar, cada proceso abre las suyas"""
+
+        return {'database_path': self.database_path, 'busy_timeout_seconds': self.busy_timeout_seconds}
+
+    def __setstate__(self, state: dict) -> None:
+        """Restaura el almacén sin conexiones abiertas"""
+
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def create_job(self, job_id: str, total_images: int) -> None:
+        """
+        Registra una nueva tarea en espera
+
+        :param job_id: identificador de la tarea
+        :param total_images: número de imágenes de la tarea
+        """
+        now = time.time()
+        with self.__connection() as connection:
+            connection.execute('INSERT INTO jobs (id, state, total_images, created_at, updated_at) '
+                               'VALUES (?, ?, ?, ?, ?)', (job_id, 'queued', total_images, now, now))
+
+    def get_job(self, job_id: str) -> dict:
+        """
+        Obtiene el estado de una tarea
+
+        :param job_id: identificador de la tarea
+        :returns: diccionario con el identificador ('id'), el estado ('state'), el número de imágenes ('total_images'),
+        el de imágenes reconocidas ('processed_images') y el error ('error'), o None si la tarea no existe
+        """
+        row = self.__connection().execute(
+            'SELECT id, state, total_images, processed_images, error FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'state': row[1], 'total_images': row[2], 'processed_images': row[3], 'error': row[4]}
+
+    def mark_running(self, job_id: str) -> None:
+        """Marca una tarea como en curso, sin imágenes reconocidas"""
+
+        self.__update('UPDATE jobs SET state = ?, processed_images = 0, updated_at = ? WHERE id = ?',
+                      ('running', time.time(), job_id))
+
+    def update_progress(self, job_id: str, processed_images: int) -> None:
+        """Actualiza el número de imágenes reconocidas de una tarea"""
+
+        self.__update('UPDATE jobs SET processed_images = ?, updated_at = ? WHERE id = ?',
+                      (processed_images, time.time(), job_id))
+
+    def mark_done(self, job_id: str) -> None:
+        """Marca una tarea como terminada con todas sus imágenes reconocidas"""
+
+        self.__update('UPDATE jobs SET state = ?, processed_images = total_images, updated_at = ? WHERE id = ?',
+                      ('done', time.time(), job_id))
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        """Marca una tarea como fallida, salvo que ya haya terminado, guardando el error"""
+
+        self.__update("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ? AND state != 'done'",
+                      ('failed', error, time.time(), job_id))
+
+    def delete_job(self, job_id: str) -> None:
+        """Elimina una tarea que no se ha llegado a encolar"""
+
+        self.__update('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def requeue_unfinished_jobs(self) -> List[str]:
+        """
+        Devuelve a la cola las tareas que estaban en espera o en curso, por ejemplo al reiniciar el servidor
+
+        :returns: lista con los identificadores de las tareas, de la más antigua a la más reciente
+        """
+        with self.__connection() as connection:
+            job_ids = [row[0] for row in connection.execute(
+                "SELECT id FROM jobs WHERE state IN ('queued', 'running') ORDER BY created_at")]
+            connection.execute("UPDATE jobs SET state = 'queued', processed_images = 0, updated_at = ? "
+                               "WHERE state IN ('queued', 'running')", (time.time(),))
+        return job_ids
+
+    def __update(self, statement: str, parameters: tuple) -> None:
+        """Ejecuta una actualización de una tarea en su propia transacción"""
+
+        with self.__connection() as connection:
+            connection.execute(statement, parameters)
+
+    def __connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión de este hilo, abriéndola la primera vez"""
+
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=self.busy_timeout_seconds)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
@@ -0,0 +1,227 @@
+"""Conjunto de procesos de reconocimiento, con el reconocedor ya cargado, que atienden las tareas del servidor web"""
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from crotalpath_core.tagrecognition.result_store import TagResultStore
+from crotalpath_core.tagrecognition.tag_cache import TagResultCache
+from crotalpath_server.job_store import JobStore
+
+_worker_batch_recognizer = None
+_worker_job_store = None
+_worker_result_store = None
+
+
+def _init_worker(recognizer_type: int, cache_dir: str, job_store_path: str, result_store_path: str) -> None:
+    """
+    Crea, una única vez por proceso, el reconocedor que atenderá las tareas y las conexiones a los almacenes de tareas
+    y de resultados
+
+    :param recognizer_type: identificador del tipo de reconocedor de crotales a usar
+    :param cache_dir: ruta de la carpeta, compartida por los procesos, donde almacenar los resultados o None
+    :param job_store_path: ruta de la base de datos de tareas donde registrar el estado y el progreso o None
+    :param result_store_path: ruta de la base de datos donde añadir los resultados de cada tarea o None
+    """
+    global _worker_batch_recognizer, _worker_job_store, _worker_result_store
+    _worker_batch_recognizer = TagBatchRecognizer(recognizer_type=recognizer_type,
+                                                  cache=TagResultCache(disk_path=cache_dir))
+    _worker_job_store = None if job_store_path is None else JobStore(job_store_path)
+    _worker_result_store = None if result_store_path is None else TagResultStore(result_store_path)
+
+
+def _process_task(task_folder_path: Path, result_file_path: Path) -> None:
+    """
+    Reconoce las imágenes de una tarea y escribe su resultado. Cada crotal se añade, en cuanto se reconoce, a un
+    fichero de progreso con un objeto JSON por línea. El resultado final se escribe en un fichero temporal que se
+    renombra al terminar, de forma que nunca se sirva un resultado a medio escribir. Si hay almacén de tareas, en él
+    se registra el estado y el número de imágenes reconocidas de la tarea, identificada por el nombre del fichero de
+    resultado. Si hay almacén de resultados, los de la tarea se añaden al terminar en una sola transacción, con la
+    tarea como origen y reemplazando los de un intento anterior. Si la tarea falla no se añade ninguno
+
+    :param task_folder_path: ruta de la carpeta con las imágenes de la tarea
+    :param result_file_path: ruta del fichero donde almacenar el resultado en formato JSON
+    """
+    job_id = result_file_path.name
+    if _worker_job_store is not None:
+        _worker_job_store.mark_running(job_id)
+
+    try:
+        result_json = []
+        detections = []
+        with open(progress_file_path(result_file_path), 'w') as progress_file:
+            for recognized_tag in _worker_batch_recognizer.iterate_path(folder_path=str(task_folder_path)):
+                tag_json = recognized_tag.export_json()
+                if _worker_result_store is not None:
+                    detections.append(recognized_tag.get_detection())
+                recognized_tag.release_images()
+                progress_file.write(tag_json + '\n')
+                progress_file.flush()
+                result_json.append(tag_json)
+                if _worker_job_store is not None:
+                    _worker_job_store.update_progress(job_id, len(result_json))
+
+        partial_result_file_path = result_file_path.with_name(result_file_path.name + '.part')
+        with open(partial_result_file_path, 'w') as result_file:
+            result_file.write('[' + ','.join(result_json) + ']')
+        os.replace(str(partial_result_file_path), str(result_file_path))
+        if _worker_result_store is not None:
+            _worker_result_store.replace_source(job_id, detections)
+    except Exception as error:
+        if _worker_job_store is not None:
+            _worker_job_store.mark_failed(job_id, str(error))
+        raise
+
+    if _worker_job_store is not None:
+        _worker_job_store.mark_done(job_id)
+
+
+def progress_file_path(result_file_path: Path) -> Path:
+    """
+    Obtiene la ruta del fichero de progreso de una tarea
+
+    :param result_file_path: ruta del fichero con el resultado de la tarea
+    :returns: ruta del fichero con un objeto JSON por línea por cada crotal ya reconocido
+    """
+    return result_file_path.with_name(result_file_path.name + '.ndjson')
+
+
+def requeue_unfinished_tasks(job_store: JobStore, recognition_pool: 'RecognitionPool', task_folder: Path,
+                             result_folder: Path) -> dict:
+    """
+    Vuelve a encolar las tareas que no terminaron antes de detenerse el servidor, descartando su progreso parcial. Las
+    tareas cuyas imágenes ya no existen se marcan como fallidas
+
+    :param job_store: almacén de tareas
+    :param recognition_pool: conjunto de procesos donde encolar las tareas, aunque se supere su cola
+    :param task_folder: carpeta con una carpeta de imágenes por tarea
+    :param result_folder: carpeta con el resultado de cada tarea
+    :returns: diccionario donde cada entrada es el identificador de una tarea encolada y su valor su Future
+    """
+    requeued_tasks = {}
+    for job_id in job_store.requeue_unfinished_jobs():
+        task_folder_path = task_folder / job_id
+        result_file_path = result_folder / job_id
+        if not task_folder_path.is_dir():
+            job_store.mark_failed(job_id, 'Task images are missing')
+            continue
+
+        for partial_file_path in (progress_file_path(result_file_path),
+                                  result_file_path.with_name(result_file_path.name + '.part')):
+            if partial_file_path.exists():
+                partial_file_path.unlink()
+        requeued_tasks[job_id] = recognition_pool.submit(task_folder_path, result_file_path, force=True)
+
+    return requeued_tasks
+
+
+class QueueFullError(Exception):
+    """Excepción que indica que la cola de tareas está llena"""
+
+
+class RecognitionPool:
+    """Conjunto acotado de procesos de reconocimiento alimentado por una cola de tareas"""
+
+    def __init__(self, workers: int, max_queued_tasks: int, recognizer_type: int = 1, cache_dir: str = None,
+                 job_store_path: str = None, result_store_path: str = None):
+        """
+        Crea el conjunto de procesos, estos se inician con la primera tarea y se mantienen a la espera de nuevas tareas
+
+        :param workers: número de tareas que se reconocen a la vez
+        :param max_queued_tasks: número máximo de tareas a la espera de un proceso libre
+        :param recognizer_type: identificador del tipo de reconocedor de crotales a usar
+        :param cache_dir: ruta de la carpeta donde almacenar los resultados, si no se indica cada proceso solo guarda
+        los resultados en memoria
+        :param job_store_path: ruta de la base de datos de tareas donde los procesos registran el estado y el progreso
+        de cada tarea, si no se indica no se registran
+        :param result_store_path: ruta de la base de datos donde los procesos añaden los resultados de cada tarea, si no
+        se indica no se añaden
+        :raises ValueError: si el número de procesos es menor que 1 o el de tareas en espera es negativo
+        """
+        if workers < 1:
+            raise ValueError('Number of workers must be at least 1')
+        if max_queued_tasks < 0:
+            raise ValueError('Number of queued tasks must not be negative')
+
+        self.workers = workers
+        self.max_queued_tasks = max_queued_tasks
+        self.active_tasks = 0
+        self.lock = threading.Lock()
+        self.worker_options = (recognizer_type, cache_dir, None if job_store_path is None else str(job_store_path),
+                               None if result_store_path is None else str(result_store_path))
+        self.executor = self.__create_executor()
+
+    def is_full(self) -> bool:
+        """
+        Indica si la cola de tareas está llena
+
+        :returns: True si no se admiten más tareas
+        """
+        with self.lock:
+            return self.active_tasks >= self.workers + self.max_queued_tasks
+
+    def submit(self, task_folder_path: Path, result_file_path: Path, force: bool = False) -> Future:
+        """
+        Encola el reconocimiento de las imágenes de una tarea. Si un proceso terminó de forma abrupta, como por un fallo
+        de segmentación, el conjunto de procesos queda roto y se sustituye por uno nuevo antes de encolar la tarea
+
+        :param task_folder_path: ruta de la carpeta con las imágenes de la tarea
+        :param result_file_path: ruta del fichero donde almacenar el resultado en formato JSON
+        :param force: indicador que determina si encolar la tarea aunque la cola esté llena, como al recuperar las
+        tareas pendientes tras un reinicio
+        :returns: un Future que se completará cuando la tarea termine
+        :raises QueueFullError: si la cola de tareas está llena y no se fuerza
+        :raises RuntimeError: si los procesos ya se han detenido
+        """
+        with self.lock:
+            if not force and self.active_tasks >= self.workers + self.max_queued_tasks:
+                raise QueueFullError('Recognition queue is full')
+            self.active_tasks += 1
+
+        try:
+            executor = self.executor
+            try:
+                future = executor.submit(_process_task, task_folder_path, result_file_path)
+            except BrokenProcessPool:
+                future = self.__replace_executor(executor).submit(_process_task, task_folder_path, result_file_path)
+        except BaseException:
+            with self.lock:
+                self.active_tasks -= 1
+            raise
+
+        future.add_done_callback(self.__task_done)
+        return future
+
+    def shutdown(self) -> None:
+        """Espera a que terminen las tareas en curso y detiene los procesos"""
+
+        self.executor.shutdown(wait=True)
+
+    def __create_executor(self) -> ProcessPoolExecutor:
+        """
+        Crea el conjunto de procesos, cada uno con el reconocedor y los almacenes creados por _init_worker
+
+        :returns: una instancia de ProcessPoolExecutor
+        """
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self.worker_options)
+
+    def __replace_executor(self, broken_executor: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """
+        Sustituye un conjunto de procesos roto, salvo que otra tarea ya lo haya sustituido
+
+        :param broken_executor: conjunto de procesos que ha rechazado una tarea por estar roto
+        :returns: el conjunto de procesos en uso
+        """
+        with self.lock:
+            if self.executor is broken_executor:
+                broken_executor.shutdown(wait=False)
+                self.executor = self.__create_executor()
+            return self.executor
+
+    def __task_done(self, _: Future) -> None:
+        """Libera el hueco de la tarea terminada"""
+
+        with self.lock:
+            self.active_tasks -= 1
@@ -1,21 +1,127 @@
 import os
-import subprocess
+import threading
+import time
+from io import BytesIO
 from pathlib import Path
-from random import randint
 import shutil
-from flask import Flask, request, send_from_directory, json
+from flask import Flask, Request, Response, request, send_from_directory, json
 from werkzeug.utils import secure_filename
 
+from crotalpath_core.tagrecognition.result_store import TagResultStore
+from crotalpath_server.direct_recognition import DirectRecognizerPool, UndecodableImageError
+from crotalpath_server.job_store import JobStore, new_job_id
+from crotalpath_server.recognition_pool import RecognitionPool, QueueFullError, progress_file_path, \
+    requeue_unfinished_tasks
+
+
+class InMemoryUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Direct recognition never spools uploads to a temporary file
+        if self.path == '/recognize':
+            return BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.config['TASK_FOLDER'] = Path(__file__).absolute().parent / 'pending_tasks'
 app.config['TAG_RESULT_FOLDER'] = Path(__file__).absolute().parent / 'tag_results'
+app.config['JOB_STORE_PATH'] = os.environ.get('CROTALPATH_JOB_DB', Path(__file__).absolute().parent / 'jobs.sqlite3')
+app.config['RESULT_STORE_PATH'] = os.environ.get('CROTALPATH_RESULTS_DB',
+                                                Path(__file__).absolute().parent / 'tag_results.sqlite3')
 app.config['STATIC_CONTENT_FOLDER'] = Path(__file__).absolute().parent.parent / 'crotalpath_web_app'
-if os.path.isdir(app.config['TASK_FOLDER']):
-    shutil.rmtree(app.config['TASK_FOLDER'])
-if os.path.isdir(app.config['TAG_RESULT_FOLDER']):
-    shutil.rmtree(app.config['TAG_RESULT_FOLDER'])
-os.mkdir(app.config['TASK_FOLDER'])
-os.mkdir(app.config['TAG_RESULT_FOLDER'])
+app.config['RECOGNITION_WORKERS'] = int(os.environ.get('CROTALPATH_WORKERS', os.cpu_count() or 1))
+app.config['MAX_QUEUED_TASKS'] = int(os.environ.get('CROTALPATH_MAX_QUEUED_TASKS', 32))
+app.config['RESULT_CACHE_FOLDER'] = os.environ.get('CROTALPATH_CACHE_DIR')
+app.config['DIRECT_RECOGNIZERS'] = int(os.environ.get('CROTALPATH_DIRECT_RECOGNIZERS', os.cpu_count() or 1))
+app.config['MAX_DIRECT_UPLOAD_BYTES'] = 32 * 1024 * 1024
+app.config['MAX_LOOKUP_RESULTS'] = 100
+app.config['RETRY_AFTER_SECONDS'] = 5
+app.config['EVENTS_PROGRESS_INTERVAL_SECONDS'] = 0.25
+app.config['EVENTS_KEEP_ALIVE_SECONDS'] = 15
+os.makedirs(app.config['TASK_FOLDER'], exist_ok=True)
+os.makedirs(app.config['TAG_RESULT_FOLDER'], exist_ok=True)
+
+job_store = JobStore(app.config['JOB_STORE_PATH'])
+result_store = TagResultStore(app.config['RESULT_STORE_PATH'])
+recognition_pool = RecognitionPool(workers=app.config['RECOGNITION_WORKERS'],
+                                   max_queued_tasks=app.config['MAX_QUEUED_TASKS'],
+                                   cache_dir=app.config['RESULT_CACHE_FOLDER'],
+                                   job_store_path=app.config['JOB_STORE_PATH'],
+                                   result_store_path=app.config['RESULT_STORE_PATH'])
+direct_recognizer_pool = DirectRecognizerPool(size=app.config['DIRECT_RECOGNIZERS'])
+running_tasks = {}
+running_tasks_lock = threading.Lock()
+
+
+def queue_full_response():
+    response = app.response_class(
+        response=json.dumps({'error': 'Recognition queue is full'}),
+        status=503,
+        mimetype='application/json'
+    )
+    response.headers['Retry-After'] = str(app.config['RETRY_AFTER_SECONDS'])
+    return response
+
+
+def notify_task_completion(task_id, future):
+    if future.exception() is not None:
+        app.logger.error('Recognition task %s failed: %s', task_id, future.exception())
+        job_store.mark_failed(task_id, str(future.exception()))
+    shutil.rmtree(app.config['TASK_FOLDER'] / task_id, ignore_errors=True)
+    with running_tasks_lock:
+        running_tasks.pop(task_id).set()
+
+
+def track_task(task_id, task):
+    with running_tasks_lock:
+        running_tasks[task_id] = threading.Event()
+    task.add_done_callback(lambda future: notify_task_completion(task_id, future))
+
+
+for requeued_task_id, requeued_task in requeue_unfinished_tasks(job_store, recognition_pool, app.config['TASK_FOLDER'],
+                                                                app.config['TAG_RESULT_FOLDER']).items():
+    track_task(requeued_task_id, requeued_task)
+
+
+def server_sent_event(event, data):
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
+
+
+def stream_task_events(task_id, task_finished):
+    result_file_path = app.config['TAG_RESULT_FOLDER'] / task_id
+    progress_path = progress_file_path(result_file_path)
+    progress_file = None
+    pending_line = ''
+    last_event_time = time.monotonic()
+
+    try:
+        while True:
+            finished = task_finished.wait(app.config['EVENTS_PROGRESS_INTERVAL_SECONDS'])
+
+            if progress_file is None and os.path.isfile(progress_path):
+                progress_file = open(progress_path, 'r')
+            if progress_file is not None:
+                pending_line += progress_file.read()
+                *tag_lines, pending_line = pending_line.split('\n')
+                for tag_line in tag_lines:
+                    last_event_time = time.monotonic()
+                    yield server_sent_event('tag', json.loads(tag_line))
+
+            if finished:
+                if os.path.isfile(result_file_path):
+                    yield server_sent_event('done', {'location': '/tags/' + task_id})
+                else:
+                    job = job_store.get_job(task_id)
+                    yield server_sent_event('failed', {'error': None if job is None else job['error']})
+                return
+
+            if time.monotonic() - last_event_time > app.config['EVENTS_KEEP_ALIVE_SECONDS']:
+                last_event_time = time.monotonic()
+                yield ': keep-alive\n\n'
+    finally:
+        if progress_file is not None:
+            progress_file.close()
 
 
 @app.route('/<path:path>')
@@ -35,7 +141,10 @@ def send_css(path):
 
 @app.route("/tasks", methods=['POST'])
 def handle_job_creation():
-    task_id = str(randint(10000, 99999))
+    if recognition_pool.is_full():
+        return queue_full_response()
+
+    task_id = new_job_id()
     task_folder_path = app.config['TASK_FOLDER'] / task_id
     result_file_path = app.config['TAG_RESULT_FOLDER'] / task_id
     os.mkdir(task_folder_path)
@@ -44,9 +153,14 @@ def handle_job_creation():
     for file in uploaded_files:
         file.save(os.path.join(task_folder_path, secure_filename(file.filename)))
 
-    cmd = 'cd .. && python3 -m crotalpath_core -t 1 -f ' + str(task_folder_path) + ' -o ' + str(result_file_path)
-
-    subprocess.Popen(cmd, shell=True)
+    job_store.create_job(task_id, len(os.listdir(task_folder_path)))
+    try:
+        task = recognition_pool.submit(task_folder_path, result_file_path)
+    except QueueFullError:
+        job_store.delete_job(task_id)
+        shutil.rmtree(task_folder_path)
+        return queue_full_response()
+    track_task(task_id, task)
 
     response = app.response_class(
         status=202,
@@ -57,12 +171,38 @@ def handle_job_creation():
     return response
 
 
+@app.route("/recognize", methods=['POST'])
+def handle_direct_recognition():
+    if request.content_length is not None and request.content_length > app.config['MAX_DIRECT_UPLOAD_BYTES']:
+        return app.response_class(response=json.dumps({'error': 'Image is too large'}), status=413,
+                                  mimetype='application/json')
+
+    image_bytes = b''
+    identifier = None
+    if request.mimetype == 'multipart/form-data':
+        uploaded_file = request.files.get('file')
+        if uploaded_file is not None:
+            image_bytes = uploaded_file.read()
+            identifier = secure_filename(uploaded_file.filename or '')
+    else:
+        image_bytes = request.get_data()
+        identifier = secure_filename(request.args.get('name', '')) or None
+
+    try:
+        detection = direct_recognizer_pool.recognize(image_bytes, identifier)
+    except UndecodableImageError as error:
+        return app.response_class(response=json.dumps({'error': str(error)}), status=400, mimetype='application/json')
+
+    return app.response_class(response=json.dumps(detection), status=200, mimetype='application/json')
+
+
 @app.route("/tasks/<path:path>", methods=['GET'])
 def serve_job(path):
     result_file_path = app.config['TAG_RESULT_FOLDER'] / path
-    status = 200
+    job = job_store.get_job(secure_filename(path))
+    status = 200 if job is not None else 404
     response = app.response_class(
-        response=json.dumps({}),
+        response=json.dumps(job or {}),
         status=status,
         mimetype='application/json'
     )
@@ -79,6 +219,40 @@ def serve_job(path):
     return response
 
 
+@app.route("/tasks/<task_id>/events", methods=['GET'])
+def serve_job_events(task_id):
+    task_id = secure_filename(task_id)
+    with running_tasks_lock:
+        task_finished = running_tasks.get(task_id)
+
+    if task_finished is None:
+        task_finished = threading.Event()
+        task_finished.set()
+        if job_store.get_job(task_id) is None:
+            return app.response_class(response=json.dumps({}), status=404, mimetype='application/json')
+
+    response = Response(stream_task_events(task_id, task_finished), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route("/tags", methods=['GET'])
+def find_tags():
+    digits = request.args.get('digits', '')
+    prefix = request.args.get('prefix', 'false').lower() in ('1', 'true')
+    try:
+        limit = min(int(request.args.get('limit', app.config['MAX_LOOKUP_RESULTS'])), app.config['MAX_LOOKUP_RESULTS'])
+    except ValueError:
+        limit = 0
+    if (not digits and not prefix) or limit < 1:
+        return app.response_class(response=json.dumps({'error': 'A digits query and a positive limit are required'}),
+                                  status=400, mimetype='application/json')
+
+    detections = result_store.find_by_digits(digits, prefix=prefix, limit=limit)
+    return app.response_class(response=json.dumps(detections), status=200, mimetype='application/json')
+
+
 @app.route("/tags/<path:path>", methods=['GET'])
 def serve_tag(path):
     result_file_path = app.config['TAG_RESULT_FOLDER'] / path
@@ -98,4 +272,4 @@ def serve_tag(path):
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0')
+    app.run(host='0.0.0.0', threaded=True)
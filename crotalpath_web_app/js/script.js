@@ -65,6 +65,89 @@ function paint_rect(canvas, rect) {
     ctx.stroke();
 }
 
+function display_result(file, fileList, crotal) {
+    var extension = file.name.split('.').pop().toLowerCase();
+    if (extension === 'tif' || extension === 'tiff')
+        display_tiff(file, fileList, crotal.bounding_rects, crotal.digits);
+    else
+        display_image(file, fileList, crotal.bounding_rects, crotal.digits);
+}
+
+function display_results(files, fileList, dataList) {
+    $('#file_container').css('display', 'flex');
+    fileList.empty();
+
+    var dataObj = {};
+    dataList.forEach(function (data) {
+        var id = data.identifier.split('/').pop();
+        dataObj[id] = data;
+    });
+
+    for (var i = 0; i < files.length; i++) {
+        display_result(files[i], fileList, dataObj[files[i].name]);
+    }
+}
+
+function display_error(fileList, message) {
+    fileList.empty();
+    fileList.append($('<p class="text-danger"></p>').text(message || 'Recognition failed'));
+}
+
+function listen_task(location, files, fileList) {
+    var filesObj = {};
+    for (var i = 0; i < files.length; i++) {
+        filesObj[files[i].name] = files[i];
+    }
+
+    var first_result = true;
+    var source = new EventSource(location + '/events');
+    source.addEventListener('tag', function (event) {
+        var crotal = JSON.parse(event.data);
+        var file = filesObj[crotal.identifier.split('/').pop()];
+        if (first_result) {
+            first_result = false;
+            $('#file_container').css('display', 'flex');
+            fileList.empty();
+        }
+        if (file !== undefined)
+            display_result(file, fileList, crotal);
+    });
+    source.addEventListener('done', function () {
+        source.close();
+    });
+    source.addEventListener('failed', function (event) {
+        source.close();
+        display_error(fileList, JSON.parse(event.data).error);
+    });
+    source.onerror = function () {
+        // Sin este cierre el navegador reintenta la conexión indefinidamente, por ejemplo tras un proxy que no
+        // admite eventos; el sondeo muestra igualmente todos los resultados al terminar la tarea
+        source.close();
+        poll_task(location, files, fileList);
+    };
+}
+
+function poll_task(location, files, fileList) {
+    var repeat = setInterval(function () {
+        $.ajax({
+            url: location,
+            type: 'get',
+            cache: false,
+            processData: false,
+            contentType: false,
+            success: function (data, textStatus, request) {
+                if (request.responseJSON.length !== undefined) {
+                    clearInterval(repeat);
+                    display_results(files, fileList, request.responseJSON);
+                } else if (request.responseJSON.state === 'failed') {
+                    clearInterval(repeat);
+                    display_error(fileList, request.responseJSON.error);
+                }
+            }
+        });
+    }, 1000);
+}
+
 $(document).ready(function () {
     $('#upload_input').on('change', function () {
         var fileList = $('#file_list');
@@ -83,40 +166,11 @@ $(document).ready(function () {
             processData: false,
             contentType: false,
             success: function (data, textStatus, request) {
-                var repeat = setInterval(function () {
-                    $.ajax({
-                        url: request.getResponseHeader('location'),
-                        type: 'get',
-                        cache: false,
-                        processData: false,
-                        contentType: false,
-                        success: function (data, textStatus, request) {
-                            if (request.responseJSON.length !== undefined) {
-                                var dataList = request.responseJSON;
-                                clearInterval(repeat);
-                                $('#file_container').css('display', 'flex');
-                                fileList.empty();
-
-                                var dataObj = {};
-                                dataList.forEach(function (data) {
-                                    var id = data.identifier.split('/').pop();
-                                    dataObj[id] = data;
-                                });
-
-                                for (var i = 0; i < files.length; i++) {
-                                    var file = files[i];
-                                    var crotal = dataObj[file.name];
-                                    var extension = file.name.split('.').pop().toLowerCase();
-                                    if (extension === 'tif' || extension === 'tiff')
-                                        display_tiff(file, fileList, crotal.bounding_rects, crotal.digits);
-                                    else
-                                        display_image(file, fileList, crotal.bounding_rects, crotal.digits);
-                                }
-
-                            }
-                        }
-                    });
-                }, 1000);
+                var location = request.getResponseHeader('location');
+                if (window.EventSource !== undefined)
+                    listen_task(location, files, fileList);
+                else
+                    poll_task(location, files, fileList);
             }
         });
 
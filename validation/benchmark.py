@@ -0,0 +1,215 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+
+import cv2
+import numpy as np
+import pytesseract
+
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DATASET_PATH = Path(__file__).absolute().parent.parent / 'crotalpath_core' / 'tests' / 'dataset' / 'TestSamples'
+
+
+def generate_synthetic_tags(output_path: Path, count: int, seed: int = 0):
+    """
+    Genera imágenes sintéticas de crotales: un crotal claro sobre fondo oscuro con cuatro dígitos grises oscuros
+
+    :param output_path: carpeta donde guardar las imágenes
+    :param count: número de imágenes a generar
+    :param seed: semilla del generador aleatorio, para que las imágenes sean reproducibles
+    :return: lista con las rutas de las imágenes generadas
+    """
+    random_generator = np.random.RandomState(seed)
+    images_path = []
+
+    for index in range(count):
+        image = np.full((480, 640), 10, np.uint8)
+        tag_left, tag_top = random_generator.randint(20, 60, size=2)
+        cv2.rectangle(image, (int(tag_left), int(tag_top)), (int(tag_left) + 540, int(tag_top) + 380), 210, -1)
+
+        digits = ''.join(str(digit) for digit in random_generator.randint(0, 10, size=4))
+        cv2.putText(image, digits, (int(tag_left) + 40, int(tag_top) + 260), cv2.FONT_HERSHEY_SIMPLEX, 5, 70, 18)
+
+        noise = random_generator.normal(0, 6, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+
+        image_path = output_path / '{:04d}.TIF'.format(index + 1)
+        cv2.imwrite(str(image_path), image)
+        images_path.append(str(image_path))
+
+    return images_path
+
+
+def list_dataset(dataset_path: Path, max_images: int):
+    """
+    Obtiene las rutas de las imágenes válidas del dataset
+
+    :param dataset_path: carpeta con las imágenes del dataset
+    :param max_images: número máximo de imágenes a usar
+    :return: lista con las rutas de las imágenes
+    """
+    images_path = []
+    for image_path in sorted(dataset_path.glob('*.TIF')):
+        # Invalid images
+        if cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE) is None:
+            continue
+        images_path.append(str(image_path))
+        if len(images_path) == max_images:
+            break
+
+    return images_path
+
+
+def count_tesseract_runs():
+    """
+    Sustituye la función de pytesseract que lanza el proceso de Tesseract por otra que cuenta sus ejecuciones
+
+    :return: lista de un elemento con el número de ejecuciones, actualizado en cada ejecución
+    """
+    runs = [0]
+    run_tesseract = pytesseract.pytesseract.run_tesseract
+
+    def counted_run_tesseract(*args, **kwargs):
+        runs[0] += 1
+        return run_tesseract(*args, **kwargs)
+
+    pytesseract.pytesseract.run_tesseract = counted_run_tesseract
+    return runs
+
+
+def peak_rss():
+    """
+    Obtiene el máximo de memoria residente de este proceso y de sus procesos hijo
+
+    :return: diccionario con el máximo en megabytes de este proceso ('self') y de sus hijos ('children')
+    """
+    if resource is None:
+        return {'self': None, 'children': None}
+
+    # ru_maxrss esta en kilobytes en Linux y en bytes en macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+            'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1)}
+
+
+def run_benchmark(images_path: list, workers: list, source: str):
+    """
+    Mide la latencia por etapa y total en un proceso y el rendimiento con cada número de procesos
+
+    :param images_path: lista con las rutas de las imágenes a reconocer
+    :param workers: lista con los números de procesos a medir
+    :param source: origen de las imágenes, 'dataset' o 'synthetic'
+    :return: diccionario con los resultados del benchmark
+    """
+    tesseract_runs = count_tesseract_runs()
+
+    profiled_recognizer = TagBatchRecognizer(recognizer_type=1, profile=True)
+    profiled_recognizer.recognize_images(images_path)
+    latency = profiled_recognizer.get_profile_summary()
+    ocr_process_count = tesseract_runs[0]
+
+    throughput = {}
+    for worker_count in workers:
+        tag_batch_recognizer = TagBatchRecognizer(recognizer_type=1, workers=worker_count)
+        start = time.perf_counter()
+        tag_batch_recognizer.recognize_images(images_path)
+        throughput[str(worker_count)] = round(len(images_path) / (time.perf_counter() - start), 3)
+
+    return {'environment': {'python': platform.python_version(),
+                            'opencv': cv2.__version__,
+                            'numpy': np.__version__,
+                            'platform': platform.platform()},
+            'images': len(images_path),
+            'source': source,
+            'latency_ms': latency,
+            'throughput_images_per_second': throughput,
+            'ocr_processes_per_image': round(ocr_process_count / len(images_path), 3),
+            'peak_rss_mb': peak_rss()}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float):
+    """
+    Compara dos ejecuciones del benchmark y detecta las regresiones mayores que el umbral
+
+    :param baseline: resultados de referencia
+    :param current: resultados a comprobar
+    :param threshold: empeoramiento relativo máximo admitido, por ejemplo 0.1 para un 10 %
+    :return: lista de cadenas de caracteres describiendo cada regresión
+    """
+    regressions = []
+
+    def check(name, baseline_value, current_value, higher_is_better):
+        if baseline_value is None or current_value is None or baseline_value == 0:
+            return
+        change = (current_value - baseline_value) / baseline_value
+        if higher_is_better:
+            change = -change
+        if change > threshold:
+            regressions.append('{}: {} -> {} ({}% worse)'.format(name, baseline_value, current_value,
+                                                                  round(change * 100, 1)))
+
+    for stage, baseline_stage in baseline['latency_ms'].items():
+        current_stage = current['latency_ms'].get(stage)
+        if current_stage is not None:
+            for statistic in ('p50', 'p90'):
+                check('latency {} {}'.format(stage, statistic), baseline_stage[statistic], current_stage[statistic],
+                      False)
+
+    for worker_count, baseline_throughput in baseline['throughput_images_per_second'].items():
+        check('throughput with {} workers'.format(worker_count), baseline_throughput,
+              current['throughput_images_per_second'].get(worker_count), True)
+
+    check('OCR processes per image', baseline['ocr_processes_per_image'], current['ocr_processes_per_image'], False)
+    check('peak RSS', baseline['peak_rss_mb']['self'], current['peak_rss_mb']['self'], False)
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--images", type=int, default=100, help='Maximum number of images to recognize.')
+    parser.add_argument("-w", "--workers", type=int, nargs='+', default=[1, 2, 4],
+                        help='Numbers of processes to measure the throughput with.')
+    parser.add_argument("-s", "--synthetic", dest='synthetic', action='store_true',
+                        help='If stated synthetic tags are used even if the test dataset is available.')
+    parser.add_argument("-o", "--output_path", type=str, help='Path to the JSON file with the results.')
+    parser.add_argument("-c", "--compare", type=str, nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two result files instead of running the benchmark.')
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help='Relative degradation flagged as a regression when comparing, 0.1 by default.')
+    kwargs = parser.parse_args()
+
+    if kwargs.compare is not None:
+        with open(kwargs.compare[0], 'r') as baseline_file, open(kwargs.compare[1], 'r') as current_file:
+            found_regressions = compare_results(json.load(baseline_file), json.load(current_file), kwargs.threshold)
+        for regression in found_regressions:
+            print('REGRESSION ' + regression)
+        print('{} regressions above {}%'.format(len(found_regressions), kwargs.threshold * 100))
+        sys.exit(1 if found_regressions else 0)
+
+    with tempfile.TemporaryDirectory() as synthetic_path:
+        if not kwargs.synthetic and DATASET_PATH.is_dir():
+            benchmark_images = list_dataset(DATASET_PATH, kwargs.images)
+            images_source = 'dataset'
+        else:
+            benchmark_images = generate_synthetic_tags(Path(synthetic_path), kwargs.images)
+            images_source = 'synthetic'
+
+        results = run_benchmark(benchmark_images, kwargs.workers, images_source)
+
+    output = json.dumps(results, indent=2)
+    if kwargs.output_path is not None:
+        with open(kwargs.output_path, 'w') as output_file:
+            output_file.write(output)
+    print(output)
@@ -0,0 +1,73 @@
+import time
+import argparse
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from pathlib import Path
+
+from crotalpath_core.tagrecognition.text_location import LargestTextLocator
+from crotalpath_core.tagrecognition.text_recognition import ClassicOCR
+
+
+def prepare_text(text_locator: LargestTextLocator, ocr: ClassicOCR, image: np.array):
+    """Localiza el texto de una imagen y prepara la imagen con los caracteres espaciados, sin ejecutar Tesseract"""
+
+    enclosing_rectangles, digits_only_image = text_locator.locate_text(image)
+    if len(enclosing_rectangles) == 0:
+        return None
+    projected_char_image = ocr._ClassicOCR__align_characters(digits_only_image, enclosing_rectangles)
+    return ocr._ClassicOCR__separate_characters(projected_char_image)
+
+
+def measure(images: list, warm_up: int):
+    """
+    Mide la memoria reservada durante el procesado de cada imagen y el tiempo medio por imagen con unas mismas
+    instancias del detector de texto y del OCR
+
+    Cada imagen se procesa con tracemalloc recién iniciado, de forma que solo se contabiliza la memoria reservada
+    durante esa imagen y no la reservada para imágenes anteriores y reutilizada
+
+    :param images: lista de imágenes en escala de grises
+    :param warm_up: número de imágenes procesadas antes de medir
+    :return: diccionario con la media y el máximo de los picos de memoria por imagen en kilobytes y el tiempo medio
+    por imagen en milisegundos
+    """
+    text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+    ocr = ClassicOCR(image_width=600, image_height=300, engine='pytesseract')
+    for image in images[:warm_up]:
+        prepare_text(text_locator, ocr, image)
+
+    start = time.perf_counter()
+    for image in images:
+        prepare_text(text_locator, ocr, image)
+    elapsed = time.perf_counter() - start
+
+    allocated_peaks = []
+    for image in images:
+        tracemalloc.start()
+        prepare_text(text_locator, ocr, image)
+        allocated_peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    return {'mean_allocated_peak_kb': round(float(np.mean(allocated_peaks)), 1),
+            'max_allocated_peak_kb': round(float(np.max(allocated_peaks)), 1),
+            'ms_per_image': round(elapsed * 1000 / len(images), 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--images", type=int, default=200, help='Maximum number of images to use.')
+    parser.add_argument("-w", "--warm_up", type=int, default=5, help='Number of images processed before measuring.')
+    kwargs = parser.parse_args()
+
+    images_path = sorted(Path('../crotalpath_core/tests/dataset/TestSamples').glob('*.TIF'))[:kwargs.images]
+    images = [cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE) for image_path in images_path]
+    # Invalid images
+    images = [image for image in images if image is not None]
+
+    results = measure(images, kwargs.warm_up)
+    print('memory allocated per image: {} KB mean, {} KB max'.format(results['mean_allocated_peak_kb'],
+                                                                     results['max_allocated_peak_kb']))
+    print('{} ms/image over {} images'.format(results['ms_per_image'], len(images)))
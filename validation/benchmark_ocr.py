@@ -0,0 +1,67 @@
+import time
+import argparse
+
+import cv2
+
+from pathlib import Path
+
+from crotalpath_core.tagrecognition.text_location import LargestTextLocator
+from crotalpath_core.tagrecognition.text_recognition import ClassicOCR, tesserocr
+
+
+def locate_dataset(images_path: Path, max_images: int):
+    """
+    Localiza el texto de las imágenes del dataset para que solo se mida el tiempo del reconocimiento
+
+    :param images_path: ruta a la carpeta con las imágenes de prueba
+    :param max_images: número máximo de imágenes a usar
+    :return: lista de tuplas con los rectángulos de los dígitos y la imagen postprocesada
+    """
+    text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+    located_images = []
+
+    for image_path in sorted(images_path.glob('*.TIF'))[:max_images]:
+        image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+        located_images.append(text_locator.locate_text(image))
+
+    return located_images
+
+
+def benchmark_engine(engine: str, located_images: list):
+    """
+    Mide los crotales por segundo reconocidos por un motor de Tesseract
+
+    :param engine: motor de Tesseract a usar
+    :param located_images: lista de tuplas con los rectángulos de los dígitos y la imagen postprocesada
+    :return: una tupla con los crotales por segundo y los dígitos reconocidos
+    """
+    ocr = ClassicOCR(image_width=600, image_height=300, engine=engine)
+    recognized_digits = []
+
+    start = time.perf_counter()
+    for enclosing_rectangles, digits_only_image in located_images:
+        recognized_digits.append(ocr.recognize_text(digits_only_image, enclosing_rectangles))
+    elapsed = time.perf_counter() - start
+
+    return len(located_images) / elapsed, recognized_digits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--images", type=int, default=500, help='Maximum number of images to recognize.')
+    kwargs = parser.parse_args()
+
+    dataset = locate_dataset(Path('../crotalpath_core/tests/dataset/TestSamples'), kwargs.images)
+    engines = ['pytesseract'] if tesserocr is None else ['pytesseract', 'tesserocr']
+    results = {}
+
+    for engine_name in engines:
+        tags_per_second, digits = benchmark_engine(engine_name, dataset)
+        results[engine_name] = digits
+        print('{}: {} tags/s over {} tags'.format(engine_name, round(tags_per_second, 2), len(dataset)))
+
+    if len(results) > 1:
+        matching = sum(a == b for a, b in zip(results['pytesseract'], results['tesserocr']))
+        print('matching results between engines: {}/{}'.format(matching, len(dataset)))
+    else:
+        print('tesserocr is not installed, only pytesseract has been measured')
@@ -0,0 +1,82 @@
+import time
+import argparse
+import functools
+
+import pytesseract
+
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from metrics import parse_ground_truth
+
+
+def add_ocr_latency(latency_ms: float) -> None:
+    """
+    Añade una espera a cada llamada a Tesseract para simular su latencia en máquinas donde el OCR espera al proceso
+    externo más que ocupa la CPU
+
+    :param latency_ms: milisegundos de espera por llamada
+    """
+    for function_name in ('image_to_string', 'image_to_data'):
+        function = getattr(pytesseract, function_name)
+
+        @functools.wraps(function)
+        def delayed_function(*args, __function=function, **kwargs):
+            time.sleep(latency_ms / 1000)
+            return __function(*args, **kwargs)
+
+        setattr(pytesseract, function_name, delayed_function)
+
+
+def recognize_images(recognizer_type: int, images_path: list, ground_truth: dict, pipeline_workers: tuple,
+                     queue_size: int) -> dict:
+    """
+    Reconoce las imágenes en orden o con las etapas concurrentes indicadas y compara los resultados con el ground truth
+
+    :param recognizer_type: identificador del tipo de reconocedor de crotales
+    :param images_path: lista de rutas de las imágenes
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :param pipeline_workers: tupla con el número de hilos de decodificación, de procesos de localización y de hilos de
+    OCR o None para reconocer las imágenes en orden
+    :param queue_size: número máximo de imágenes en cada cola entre dos etapas
+    :return: diccionario con los crotales por segundo, la tasa de acierto y, con etapas, la utilización de cada etapa y
+    la ocupación media de cada cola
+    """
+    tag_recognizer = TagBatchRecognizer(recognizer_type=recognizer_type, pipeline_workers=pipeline_workers,
+                                        pipeline_queue_size=queue_size)
+    start = time.perf_counter()
+    tags = tag_recognizer.recognize_images(images_path)
+    elapsed = time.perf_counter() - start
+
+    correct_tags = sum(tag.digits == ground_truth[Path(path).name] for tag, path in zip(tags, images_path))
+    result = {'tags_per_second': round(len(tags) / elapsed, 1),
+              'accuracy': round(correct_tags / len(tags), 3)}
+    statistics = tag_recognizer.get_pipeline_statistics()
+    if statistics is not None:
+        result['utilization'] = {name: stage['utilization'] for name, stage in statistics['stages'].items()}
+        result['mean_queue_depth'] = {name: queue['mean_depth'] for name, queue in statistics['queues'].items()}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--type", type=int, default=1, help='Recognizer type.')
+    parser.add_argument("-n", "--images", type=int, default=200, help='Number of ground truth images.')
+    parser.add_argument("-p", "--pipeline", type=int, nargs=3, action='append', metavar=('DECODE', 'LOCATE', 'OCR'),
+                        help='Pipeline configurations to compare with sequential recognition.')
+    parser.add_argument("-q", "--queue_size", type=int, default=8, help='Maximum number of images between stages.')
+    parser.add_argument("-l", "--ocr_latency", type=float, default=0,
+                        help='Milliseconds added to each Tesseract call to simulate its latency.')
+    kwargs = parser.parse_args()
+
+    if kwargs.ocr_latency > 0:
+        add_ocr_latency(kwargs.ocr_latency)
+
+    images_folder = Path('../crotalpath_core/tests/dataset/TestSamples')
+    ground_truth = parse_ground_truth(Path('../crotalpath_core/tests/dataset/GroundTruth.ods'), kwargs.images)
+    images_path = [str(images_folder / key) for key in ground_truth if (images_folder / key).is_file()]
+
+    for pipeline_workers in [None] + [tuple(workers) for workers in kwargs.pipeline or [(2, 1, 2), (2, 1, 4)]]:
+        print('{}: {}'.format('sequential' if pipeline_workers is None else 'pipeline {}'.format(pipeline_workers),
+                              recognize_images(kwargs.type, images_path, ground_truth, pipeline_workers,
+                                               kwargs.queue_size)))
@@ -0,0 +1,67 @@
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from crotalpath_core.tagrecognition.result_store import TagResultStore
+
+
+def fill_store(result_store: TagResultStore, records: int, seed: int = 0) -> float:
+    """
+    Añade resultados sintéticos con números de crotal de 4 a 8 dígitos y cuatro rectángulos cada uno
+
+    :param result_store: almacén donde añadir los resultados
+    :param records: número de resultados a añadir
+    :param seed: semilla del generador de números aleatorios
+    :return: resultados escritos por segundo
+    """
+    random_generator = np.random.RandomState(seed)
+    bounding_rects = random_generator.randint(0, 1000, (4, 4)).tolist()
+    start = time.perf_counter()
+    for index in range(records):
+        digits = str(random_generator.randint(0, 10 ** random_generator.randint(4, 9)))
+        result_store.add_detection({'digits': digits, 'bounding_rects': bounding_rects,
+                                    'identifier': 'images/{:08d}.TIF'.format(index)})
+    result_store.commit()
+    return records / (time.perf_counter() - start)
+
+
+def measure_lookups(result_store: TagResultStore, queries: int, prefix: bool, seed: int = 1) -> dict:
+    """
+    Mide el tiempo de búsqueda de números de crotal aleatorios
+
+    :param result_store: almacén donde buscar
+    :param queries: número de búsquedas
+    :param prefix: indicador que determina si buscar por prefijo en lugar de por número exacto
+    :param seed: semilla del generador de números aleatorios
+    :return: diccionario con la mediana y el percentil 99 del tiempo por búsqueda en milisegundos
+    """
+    random_generator = np.random.RandomState(seed)
+    lookup_times = []
+    for _ in range(queries):
+        digits = str(random_generator.randint(0, 10 ** (3 if prefix else 4)))
+        start = time.perf_counter()
+        result_store.find_by_digits(digits, prefix=prefix)
+        lookup_times.append((time.perf_counter() - start) * 1000)
+
+    return {'p50_ms': round(float(np.percentile(lookup_times, 50)), 3),
+            'p99_ms': round(float(np.percentile(lookup_times, 99)), 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--records", type=int, default=1000000, help='Number of synthetic results to store.')
+    parser.add_argument("-q", "--queries", type=int, default=1000, help='Number of lookups of each kind.')
+    kwargs = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        database_path = os.path.join(temporary_folder, 'results.sqlite3')
+        with TagResultStore(database_path, commit_size=10000) as result_store:
+            print('{:.0f} results/s written'.format(fill_store(result_store, kwargs.records)))
+            print('database size: {:.1f} MB for {} results'.format(os.path.getsize(database_path) / 1024 ** 2,
+                                                                   result_store.count()))
+            print('exact lookups: {}'.format(measure_lookups(result_store, kwargs.queries, prefix=False)))
+            print('prefix lookups (up to 100 results): {}'.format(
+                measure_lookups(result_store, kwargs.queries, prefix=True)))
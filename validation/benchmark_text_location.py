@@ -0,0 +1,64 @@
+import time
+import argparse
+
+import cv2
+
+from pathlib import Path
+
+from crotalpath_core.tagrecognition.text_location import LargestTextLocator
+from crotalpath_core.tests.test_text_location import reference_locate_largest_text
+
+
+def benchmark(function, digits_only_images: list, repetitions: int):
+    """
+    Mide el tiempo medio por imagen de una función de localización de los caracteres de mayor tamaño
+
+    :param function: función que recibe una imagen postprocesada y devuelve los rectángulos de los caracteres
+    :param digits_only_images: lista de imágenes postprocesadas
+    :param repetitions: número de veces que se recorre el dataset
+    :return: tiempo medio por imagen en milisegundos
+    """
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for digits_only_image in digits_only_images:
+            function(digits_only_image)
+    elapsed = time.perf_counter() - start
+
+    return elapsed * 1000 / (repetitions * len(digits_only_images))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--images", type=int, default=500, help='Maximum number of images to use.')
+    parser.add_argument("-r", "--repetitions", type=int, default=5, help='Number of passes over the images.')
+    parser.add_argument("-s", "--roi_scale", type=float, default=0.25,
+                        help='Scale of the downscaled image used by the coarse-to-fine text location.')
+    kwargs = parser.parse_args()
+
+    text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3)
+    images_path = sorted(Path('../crotalpath_core/tests/dataset/TestSamples').glob('*.TIF'))[:kwargs.images]
+    images = [cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE) for image_path in images_path]
+    # Invalid images
+    images = [image for image in images if image is not None]
+    digits_only_images = [text_locator.locate_text(image)[1] for image in images]
+
+    reference_time = benchmark(lambda image: reference_locate_largest_text(image, 0.3), digits_only_images,
+                               kwargs.repetitions)
+    vectorized_time = benchmark(text_locator._LargestTextLocator__locate_largest_text, digits_only_images,
+                                kwargs.repetitions)
+
+    print('per-object areas: {} ms/image'.format(round(reference_time, 3)))
+    print('integral image areas: {} ms/image'.format(round(vectorized_time, 3)))
+    print('speedup: {}x over {} images'.format(round(reference_time / vectorized_time, 2), len(digits_only_images)))
+
+    roi_text_locator = LargestTextLocator(thresholding_threshold=30, noise_size=5, digit_difference_threshold=0.3,
+                                          roi_scale=kwargs.roi_scale)
+    full_resolution_time = benchmark(text_locator.locate_text, images, kwargs.repetitions)
+    roi_time = benchmark(roi_text_locator.locate_text, images, kwargs.repetitions)
+    same_digit_count = sum(len(text_locator.locate_text(image)[0]) == len(roi_text_locator.locate_text(image)[0])
+                           for image in images)
+
+    print('full resolution text location: {} ms/image'.format(round(full_resolution_time, 3)))
+    print('ROI text location at scale {}: {} ms/image'.format(kwargs.roi_scale, round(roi_time, 3)))
+    print('speedup: {}x, same number of located digits in {} of {} images'.format(
+        round(full_resolution_time / roi_time, 2), same_digit_count, len(images)))
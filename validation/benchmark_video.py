@@ -0,0 +1,105 @@
+import os
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from metrics import parse_ground_truth
+
+
+def write_synthetic_video(video_path: str, images_path: Path, ground_truth: dict, frames_per_animal: int,
+                          gap_frames: int, frame_rate: float, seed: int = 0) -> list:
+    """
+    Escribe un vídeo donde cada imagen del ground truth es el paso de un animal: la imagen aparece durante
+    frames_per_animal fotogramas, la primera mitad desplazándose y la segunda parada, y entre dos animales hay
+    gap_frames fotogramas del fondo vacío. Todos los fotogramas llevan un ligero ruido de sensor
+
+    :param video_path: ruta del vídeo a escribir
+    :param images_path: carpeta con las imágenes
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :param frames_per_animal: número de fotogramas de cada animal
+    :param gap_frames: número de fotogramas vacíos entre dos animales
+    :param frame_rate: fotogramas por segundo del vídeo
+    :param seed: semilla del generador de números aleatorios
+    :return: lista con los dígitos reales de cada animal del vídeo, en orden
+    """
+    random_generator = np.random.RandomState(seed)
+    video_writer = None
+    animals = []
+    for key, digits in ground_truth.items():
+        image = cv2.imread(str(images_path / key), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        if video_writer is None:
+            video_writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), frame_rate, (width, height))
+            background = np.full_like(image, 20)
+        animals.append(digits)
+
+        for frame_index in range(frames_per_animal):
+            shift = max(frames_per_animal // 2 - frame_index, 0) * 4
+            frame = cv2.warpAffine(image, np.float32([[1, 0, shift], [0, 1, 0]]), (width, height),
+                                   borderMode=cv2.BORDER_REPLICATE)
+            video_writer.write(cv2.add(frame, random_generator.randint(0, 3, frame.shape, np.uint8)))
+        for _ in range(gap_frames):
+            video_writer.write(cv2.add(background, random_generator.randint(0, 3, background.shape, np.uint8)))
+
+    video_writer.release()
+    return animals
+
+
+def recognize_video(recognizer_type: int, video_path: str, workers: int, batch_size: int, animals: list) -> dict:
+    """
+    Reconoce el vídeo y compara cada paso devuelto con los animales reales
+
+    :param recognizer_type: identificador del tipo de reconocedor de crotales
+    :param video_path: ruta del vídeo
+    :param workers: número de procesos
+    :param batch_size: número de fotogramas reconocidos de forma conjunta
+    :param animals: lista con los dígitos reales de cada animal
+    :return: diccionario con los fotogramas por segundo, la fracción de fotogramas repetidos, el número de pasos y la
+    tasa de animales acertados
+    """
+    tag_recognizer = TagBatchRecognizer(recognizer_type=recognizer_type, workers=workers, ocr_batch_size=batch_size,
+                                        ocr_confidence=True)
+    start = time.perf_counter()
+    tracks = list(tag_recognizer.recognize_video(video_path))
+    elapsed = time.perf_counter() - start
+
+    statistics = tag_recognizer.video_statistics
+    correct_animals = sum(track['digits'] == digits for track, digits in zip(tracks, animals))
+    return {'frames_per_second': round(statistics['frames'] / elapsed, 1),
+            'duplicate_ratio': round(statistics['duplicate_frames'] / statistics['frames'], 3),
+            'animal_passes': len(tracks),
+            'animal_accuracy': round(correct_animals / len(animals), 3)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--type", type=int, default=1, help='Recognizer type.')
+    parser.add_argument("-n", "--animals", type=int, default=50, help='Number of ground truth images used as animals.')
+    parser.add_argument("--frames_per_animal", type=int, default=20, help='Frames in which each animal appears.')
+    parser.add_argument("--gap_frames", type=int, default=15, help='Empty frames between two animals.')
+    parser.add_argument("--frame_rate", type=float, default=25, help='Frame rate of the synthetic video.')
+    parser.add_argument("-b", "--batch_size", type=int, default=4, help='Number of frames recognized together.')
+    parser.add_argument("-j", "--jobs", type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help='Numbers of processes to compare.')
+    kwargs = parser.parse_args()
+
+    images_path = Path('../crotalpath_core/tests/dataset/TestSamples')
+    ground_truth = parse_ground_truth(Path('../crotalpath_core/tests/dataset/GroundTruth.ods'), kwargs.animals)
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        video_path = os.path.join(temporary_folder, 'gate.avi')
+        animals = write_synthetic_video(video_path, images_path, ground_truth, kwargs.frames_per_animal,
+                                        kwargs.gap_frames, kwargs.frame_rate)
+        print('{} animals, {} frames at {} frames/s'.format(
+            len(animals), len(animals) * (kwargs.frames_per_animal + kwargs.gap_frames), kwargs.frame_rate))
+        for workers in kwargs.jobs:
+            print('{} process(es): {}'.format(workers, recognize_video(kwargs.type, video_path, workers,
+                                                                        kwargs.batch_size, animals)))
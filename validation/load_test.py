@@ -0,0 +1,130 @@
+import time
+import asyncio
+import argparse
+
+import aiohttp
+import numpy as np
+
+from pathlib import Path
+
+DEFAULT_IMAGE_PATH = (Path(__file__).absolute().parent.parent / 'crotalpath_core' / 'tests' / 'dataset' /
+                      'TestSamples' / '0001.TIF')
+
+
+class RequestStatistics:
+    """Acumula la latencia y el código de respuesta de las peticiones de un tipo"""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def add(self, latency: float, status: int):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self, duration: float):
+        """
+        Resume las peticiones realizadas
+
+        :param duration: duración de la prueba en segundos
+        :return: diccionario con el número de peticiones, peticiones por segundo, latencias en milisegundos, número de
+        respuestas por código y número de errores de conexión
+        """
+        summary = {'requests': len(self.latencies),
+                   'requests_per_second': round(len(self.latencies) / duration, 1),
+                   'statuses': self.statuses,
+                   'errors': self.errors}
+        if self.latencies:
+            p50, p99 = np.percentile(self.latencies, [50, 99]) * 1000
+            summary.update({'p50_ms': round(float(p50), 1), 'p99_ms': round(float(p99), 1),
+                            'max_ms': round(max(self.latencies) * 1000, 1)})
+        return summary
+
+
+async def upload(session: aiohttp.ClientSession, url: str, image_name: str, image: bytes):
+    """
+    Crea una tarea subiendo una imagen
+
+    :return: tupla con el código de respuesta y la cabecera location
+    """
+    form = aiohttp.FormData()
+    form.add_field('file', image, filename=image_name, content_type='image/tiff')
+    async with session.post(url + '/tasks', data=form) as response:
+        await response.read()
+        return response.status, response.headers.get('location')
+
+
+async def timed_loop(statistics: RequestStatistics, deadline: float, request):
+    """Repite una petición hasta la hora límite registrando su latencia y su código de respuesta"""
+
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        try:
+            status = await request()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            statistics.errors += 1
+            continue
+        statistics.add(time.monotonic() - start, status)
+
+
+async def run_load_test(url: str, pollers: int, uploaders: int, duration: float, image_path: Path):
+    """
+    Lanza a la vez clientes que consultan el estado de una tarea y clientes que suben imágenes durante un tiempo
+
+    :param url: dirección base del servidor
+    :param pollers: número de clientes consultando el estado de la tarea
+    :param uploaders: número de clientes subiendo imágenes
+    :param duration: duración de la prueba en segundos
+    :param image_path: ruta de la imagen a subir
+    :return: diccionario con el resumen de las peticiones de cada tipo
+    """
+    image = image_path.read_bytes()
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        status, location = await upload(session, url, image_path.name, image)
+        if status != 202:
+            raise RuntimeError('Could not create the polled task, status {}'.format(status))
+        task_url = url + '/' + location.lstrip('/')
+
+        async def poll():
+            async with session.get(task_url, allow_redirects=False) as response:
+                await response.read()
+                return response.status
+
+        async def upload_once():
+            upload_status, _ = await upload(session, url, image_path.name, image)
+            return upload_status
+
+        poll_statistics = RequestStatistics()
+        upload_statistics = RequestStatistics()
+        start = time.monotonic()
+        deadline = start + duration
+        await asyncio.gather(*[timed_loop(poll_statistics, deadline, poll) for _ in range(pollers)],
+                             *[timed_loop(upload_statistics, deadline, upload_once) for _ in range(uploaders)])
+        elapsed = time.monotonic() - start
+
+    return {'pollers': pollers,
+            'uploaders': uploaders,
+            'duration_seconds': round(elapsed, 1),
+            'poll': poll_statistics.summary(elapsed),
+            'upload': upload_statistics.summary(elapsed)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--url", type=str, default='http://127.0.0.1:5000', help='Base URL of the server.')
+    parser.add_argument("-p", "--pollers", type=int, default=1000, help='Number of concurrent clients polling a task.')
+    parser.add_argument("-l", "--uploaders", type=int, default=50,
+                        help='Number of concurrent clients uploading images.')
+    parser.add_argument("-d", "--duration", type=float, default=30, help='Duration of the test in seconds.')
+    parser.add_argument("-i", "--image_path", type=str, default=str(DEFAULT_IMAGE_PATH), help='Image to upload.')
+    kwargs = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run_load_test(kwargs.url.rstrip('/'), kwargs.pollers, kwargs.uploaders, kwargs.duration,
+                      Path(kwargs.image_path)))
+    for request_type in ('poll', 'upload'):
+        print(request_type, results[request_type])
@@ -1,6 +1,7 @@
 import csv
-
-import numpy as np
+import json
+import time
+import argparse
 
 from pathlib import Path
 from pandas_ods_reader import read_ods
@@ -8,10 +9,73 @@ from pandas_ods_reader import read_ods
 from crotalpath_core.__main__ import TagBatchRecognizer
 
 
-def write_csv(path, content):
-    with open(path, 'a', newline='') as file:
-        file.write(content+'\n')
-    file.close()
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+def load_checkpoint(path: Path, configuration: dict):
+    """
+    Carga los resultados por imagen ya calculados en una ejecución anterior con la misma configuración
+
+    :param path: ruta del fichero de control, con la configuración del reconocedor en la primera línea y un objeto
+    JSON por imagen en el resto
+    :param configuration: configuración del reconocedor de la ejecución actual
+    :return: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reconocidos
+    :raises ValueError: si el fichero de control se generó con otra configuración o no la indica
+    """
+    recognized_digits = {}
+    if path.is_file() and path.stat().st_size > 0:
+        with open(path, 'r') as file:
+            try:
+                checkpoint_configuration = json.loads(file.readline()).get('configuration')
+            except ValueError:
+                checkpoint_configuration = None
+            if checkpoint_configuration != json.loads(json.dumps(configuration)):
+                raise ValueError('Checkpoint {} was written with a different recognizer configuration, use --restart '
+                                 'or another checkpoint path'.format(path))
+
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # Linea incompleta por una ejecución interrumpida
+                    continue
+                recognized_digits[result['image']] = result['digits']
+
+    return recognized_digits
+
+
+def compute_metrics(ground_truth: dict, recognized_digits: dict):
+    """
+    Calcula las métricas acumuladas imagen a imagen en el orden del ground truth
+
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :param recognized_digits: diccionario donde cada entrada es el nombre de una imagen y su valor los reconocidos
+    :return: una tupla con las filas del CSV y el diccionario final de métricas, precisión y exhaustividad
+    """
+    metrics = {'true_positive': 0, 'true_negative': 0, 'false_positive': 0, 'false_negative': 0}
+    precision = 0
+    recall = 0
+    rows = [['precision', 'recall', 'TP', 'FP', 'TN', 'FN']]
+
+    for key in ground_truth.keys():
+        digits = recognized_digits[key]
+        if len(digits) == len(ground_truth[key]):
+            if digits == ground_truth[key]:
+                metrics['true_positive'] += 1
+            else:
+                metrics['false_positive'] += 1
+        else:
+            metrics['false_negative'] += 1
+
+        detected = metrics['true_positive'] + metrics['false_positive']
+        precision = round(metrics['true_positive'] / detected, 3) if detected > 0 else 0
+        recall = round(detected / len(ground_truth), 3)
+        rows.append([precision, recall, metrics['true_positive'], metrics['false_positive'],
+                     metrics['true_negative'], metrics['false_negative']])
+
+    return rows, metrics, precision, recall
 
 
 def parse_ground_truth(ground_truth_path: Path, test_length: int = 500):
@@ -40,27 +104,55 @@ def parse_ground_truth(ground_truth_path: Path, test_length: int = 500):
 
 
 if __name__ == '__main__':
-    tag_recognizer = TagBatchRecognizer(recognizer_type=1, display_result=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--jobs", type=int, default=1, help='Number of processes used to recognize the images.')
+    parser.add_argument("-n", "--images", type=int, default=500, help='Maximum number of ground truth images to use.')
+    parser.add_argument("-o", "--output_path", type=str, default='./metrics.csv', help='Path to the output CSV.')
+    parser.add_argument("-c", "--checkpoint_path", type=str, default='./metrics_checkpoint.ndjson',
+                        help='Path to the per-image results used to resume an interrupted run.')
+    parser.add_argument("--restart", dest='restart', action='store_true',
+                        help='If stated the results of previous runs are discarded.')
+    parser.add_argument("-r", "--roi_scale", type=float,
+                        help='Locate the text region on an image downscaled to this scale before the full resolution '
+                             'pass. A checkpoint written with another scale is not resumed.')
+    kwargs = parser.parse_args()
+
     images_path = Path('../crotalpath_core/tests/dataset/TestSamples')
-    ground_truth = parse_ground_truth(Path('../crotalpath_core/tests/dataset/GroundTruth.ods'), 500)
-    output_metrics_path = './metrics.csv'
-    metrics = {'true_positive': 0, 'true_negative': 0, 'false_positive': 0, 'false_negative': 0}
-    precision = []
-    recall = []
-    write_csv(output_metrics_path, 'precision,recall,TP,FP,TN,FN')
-    for key in ground_truth.keys():
-        tag = tag_recognizer.recognize_image(str(images_path / key))
-        if len(tag.digits) == len(ground_truth[key]):
-            print('{} {}'.format(tag.digits, ground_truth[key]))
-            if tag.digits == ground_truth[key]:
-                metrics['true_positive'] += 1
-            else:
-                metrics['false_positive'] += 1
-        else:
-            metrics['false_negative'] += 1
-        precision = round(metrics['true_positive'] / (metrics['true_positive'] + metrics['false_positive']), 3)
-        recall = round((metrics['true_positive'] + metrics['false_positive']) / len(ground_truth), 3)
-        write_csv(output_metrics_path, '{},{},{},{},{},{}'.format(precision, recall, metrics['true_positive'],
-                                                                  metrics['false_positive'], metrics['true_negative'],
-                                                                  metrics['false_negative']))
-        print('precision: {} recall:{} metrics: {}'.format(precision, recall, metrics))
+    ground_truth = parse_ground_truth(Path('../crotalpath_core/tests/dataset/GroundTruth.ods'), kwargs.images)
+    checkpoint_path = Path(kwargs.checkpoint_path)
+
+    tag_recognizer = TagBatchRecognizer(recognizer_type=1, display_result=False, workers=kwargs.jobs,
+                                        roi_scale=kwargs.roi_scale)
+    configuration = {'recognizer_type': 1, 'recognizer': tag_recognizer.recognizer.get_configuration()}
+
+    if kwargs.restart and checkpoint_path.is_file():
+        checkpoint_path.unlink()
+    try:
+        recognized_digits = load_checkpoint(checkpoint_path, configuration)
+    except ValueError as error:
+        parser.error(str(error))
+    pending_images = [key for key in ground_truth.keys() if key not in recognized_digits]
+    print('{} images already recognized, {} pending'.format(len(recognized_digits), len(pending_images)))
+
+    start = time.perf_counter()
+
+    with open(checkpoint_path, 'a') as checkpoint_file:
+        if checkpoint_file.tell() == 0:
+            checkpoint_file.write(json.dumps({'configuration': configuration}) + '\n')
+        if pending_images:
+            tags = tag_recognizer.iterate_images([str(images_path / key) for key in pending_images])
+            for key, tag in zip(pending_images, tags):
+                recognized_digits[key] = tag.digits
+                checkpoint_file.write(json.dumps({'image': key, 'digits': tag.digits}) + '\n')
+                checkpoint_file.flush()
+                print('{} {} {}'.format(key, tag.digits, ground_truth[key]))
+
+    elapsed = time.perf_counter() - start
+    throughput = len(pending_images) / elapsed if pending_images else 0
+
+    rows, metrics, precision, recall = compute_metrics(ground_truth, recognized_digits)
+    write_csv(kwargs.output_path, rows)
+
+    print('precision: {} recall: {} metrics: {}'.format(precision, recall, metrics))
+    print('throughput: {} images/s with {} processes, ROI scale {}'.format(round(throughput, 2), kwargs.jobs,
+                                                                           kwargs.roi_scale))
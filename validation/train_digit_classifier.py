@@ -0,0 +1,111 @@
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from pathlib import Path
+
+from crotalpath_core.__main__ import TagBatchRecognizer
+from crotalpath_core.tagrecognition.digit_classifier import DEFAULT_MODEL_PATH, KNearestDigitClassifier, \
+    compute_features, extract_glyphs
+from crotalpath_core.tagrecognition.tag_recognition import CowTagRecognizer
+from metrics import parse_ground_truth
+
+
+def split_ground_truth(ground_truth: dict, validation_every: int):
+    """
+    Separa el ground truth en entrenamiento y validación, una de cada validation_every imágenes es de validación
+
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :param validation_every: periodo de las imágenes de validación
+    :return: una tupla con los diccionarios de entrenamiento y de validación
+    """
+    training, validation = {}, {}
+    for index, (key, digits) in enumerate(sorted(ground_truth.items())):
+        (validation if index % validation_every == 0 else training)[key] = digits
+    return training, validation
+
+
+def collect_digits(images_path: Path, ground_truth: dict):
+    """
+    Localiza los dígitos de cada imagen con el mismo detector de texto que el reconocedor y los etiqueta con el ground
+    truth. Las imágenes con un número de dígitos localizados distinto del real se descartan
+
+    :param images_path: carpeta con las imágenes
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :return: una tupla con los descriptores de los dígitos, sus etiquetas y el número de imágenes descartadas
+    """
+    text_locator = CowTagRecognizer().text_locator
+    glyphs, labels = [], []
+    discarded_images = 0
+    for key, digits in ground_truth.items():
+        image = cv2.imread(str(images_path / key), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            discarded_images += 1
+            continue
+        enclosing_rectangles, digits_only_image = text_locator.locate_text(image)
+        if len(enclosing_rectangles) != len(digits):
+            discarded_images += 1
+            continue
+        glyphs.append(extract_glyphs(digits_only_image, enclosing_rectangles))
+        labels.extend(int(digit) for digit in digits)
+
+    return compute_features(np.concatenate(glyphs)), np.array(labels, np.uint8), discarded_images
+
+
+def evaluate(recognizer_type: int, images_path: Path, ground_truth: dict, batch_size: int):
+    """
+    Reconoce las imágenes de validación y mide la tasa de acierto y el rendimiento
+
+    :param recognizer_type: identificador del tipo de reconocedor de crotales
+    :param images_path: carpeta con las imágenes
+    :param ground_truth: diccionario donde cada entrada es el nombre de una imagen y su valor los dígitos reales
+    :param batch_size: número de imágenes cuyo texto se reconoce de forma conjunta
+    :return: diccionario con la tasa de crotales y de dígitos acertados y los crotales por segundo
+    """
+    tag_recognizer = TagBatchRecognizer(recognizer_type=recognizer_type, ocr_batch_size=batch_size)
+    keys = list(ground_truth.keys())
+
+    start = time.perf_counter()
+    tags = tag_recognizer.recognize_images([str(images_path / key) for key in keys])
+    elapsed = time.perf_counter() - start
+
+    correct_tags = sum(tag.digits == ground_truth[key] for key, tag in zip(keys, tags))
+    correct_digits = sum(sum(recognized == real for recognized, real in zip(tag.digits or '', ground_truth[key]))
+                         for key, tag in zip(keys, tags) if len(tag.digits or '') == len(ground_truth[key]))
+    total_digits = sum(len(digits) for digits in ground_truth.values())
+    return {'tag_accuracy': round(correct_tags / len(keys), 3),
+            'digit_accuracy': round(correct_digits / total_digits, 3),
+            'tags_per_second': round(len(keys) / elapsed, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--images", type=int, default=500, help='Maximum number of ground truth images to use.')
+    parser.add_argument("-v", "--validation_every", type=int, default=5,
+                        help='One of every this many images is kept out of training for validation.')
+    parser.add_argument("-k", "--neighbours", type=int, default=3, help='Number of neighbours voting each digit.')
+    parser.add_argument("-b", "--batch_size", type=int, default=16,
+                        help='Number of images recognized together during validation.')
+    parser.add_argument("-o", "--output_path", type=str, default=str(DEFAULT_MODEL_PATH),
+                        help='Path to the trained model.')
+    parser.add_argument("-c", "--compare", dest='compare', action='store_true',
+                        help='If stated the validation images are also recognized with Tesseract (recognizer 1).')
+    kwargs = parser.parse_args()
+
+    images_path = Path('../crotalpath_core/tests/dataset/TestSamples')
+    ground_truth = parse_ground_truth(Path('../crotalpath_core/tests/dataset/GroundTruth.ods'), kwargs.images)
+    training_ground_truth, validation_ground_truth = split_ground_truth(ground_truth, kwargs.validation_every)
+
+    features, labels, discarded_images = collect_digits(images_path, training_ground_truth)
+    print('{} training digits from {} images, {} images discarded'.format(
+        len(labels), len(training_ground_truth) - discarded_images, discarded_images))
+    print('digits per class: {}'.format(np.bincount(labels, minlength=10).tolist()))
+    KNearestDigitClassifier(features, labels, kwargs.neighbours).save(kwargs.output_path)
+    print('model saved to {}'.format(kwargs.output_path))
+
+    print('{} validation images'.format(len(validation_ground_truth)))
+    print('per-digit classifier (2): {}'.format(evaluate(2, images_path, validation_ground_truth, kwargs.batch_size)))
+    if kwargs.compare:
+        print('Tesseract (1): {}'.format(evaluate(1, images_path, validation_ground_truth, kwargs.batch_size)))